@@ -18,8 +18,14 @@ load_dotenv()
 
 OPENAI_KEY = os.getenv("OPENAI_KEY")
 PINE_KEY = os.getenv('PINE_KEY')
-pc = Pinecone(api_key=PINE_KEY)
-client = OpenAI(api_key=OPENAI_KEY)
+# Set to the local stand-in server (python -m benchmarks.mock_server in sage/) to run without credentials.
+MOCK_URL = os.getenv("SAGE_MOCK_URL", "").rstrip("/")
+if MOCK_URL:
+    pc = Pinecone(api_key=PINE_KEY or "mock", host=MOCK_URL)
+    client = OpenAI(api_key=OPENAI_KEY or "mock", base_url=f"{MOCK_URL}/v1")
+else:
+    pc = Pinecone(api_key=PINE_KEY)
+    client = OpenAI(api_key=OPENAI_KEY)
 
 def get_embeddings(text: str, model: str) :
     """Generates embeddings for a given text using the OpenAI client."""
@@ -3,26 +3,28 @@ import asyncio
 import os
 import uuid
 from datetime import datetime
-from manager_agent.agent import manager_agent
+from manager_agent.agent import manager_agent, sage_workflow
+from manager_agent.blob_store import state_value
+from manager_agent.history import chat_messages, history_log, is_rollup
+from manager_agent.pipeline import WORKFLOW_MODE
+from manager_agent.scheduler import request_priority
+from manager_agent.session_backend import get_session_service
+from manager_agent.session_index import backfill_session_index, session_index
+from manager_agent.tracing import TracingPlugin, format_summary, trace
 from dotenv import load_dotenv
 from google.adk.runners import Runner
-from google.adk.sessions import DatabaseSessionService
 import json
 import streamlit.components.v1 as com
 from streamlit_card import card
 
-from google.adk.events import Event
-from google.genai import types
-
-from utils import display_state, Colors
+from session_defaults import APP_NAME, USER_ID, new_session_state
+from utils import SessionTurn, Colors
 
 # Load environment variables
 load_dotenv()
 
 # --- Application Constants ---
-APP_NAME = "Bank Audio Transcript Analyst"
-USER_ID = "dedsec995"
-DB_URL = "sqlite:///./my_agent_data.db"
+SESSIONS_PER_PAGE = 12
 
 # Construct absolute path for uploads
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -30,18 +32,6 @@ PROJECT_ROOT = os.path.abspath(os.path.join(SCRIPT_DIR, ".."))
 UPLOAD_DIR = os.path.join(PROJECT_ROOT, "uploaded_audio")
 
 
-initial_state = {
-    "user_name": "Amit Luhar",
-    "intent_state": None,
-    "sentiment_state": None,
-    "root_cause_state": None,
-    "is_audio_transcribed": False,
-    "audio_filepath": None,
-    "transcript": [],
-    "analysis_report": None,
-    "interaction_history": [],
-}
-
 def display_state_ui(session_state):
     """Renders the session state in a visually appealing way in the UI."""
     with st.expander("View Session State Details", expanded=False):
@@ -62,7 +52,7 @@ def display_state_ui(session_state):
             st.info(root_cause['root_cause'])
 
         st.subheader("Sentiment Analysis")
-        sentiment_state = session_state.get("sentiment_state")
+        sentiment_state = state_value(session_state, "sentiment_state")
 
         if isinstance(sentiment_state, str):
             try:
@@ -87,6 +77,16 @@ def display_state_ui(session_state):
         else:
             st.write("Not analyzed.")
 
+        call_metrics = session_state.get("call_metrics")
+        if isinstance(call_metrics, dict):
+            st.subheader("Call Metrics")
+            m_col1, m_col2 = st.columns(2)
+            m_col1.metric("Duration", f'{call_metrics.get("duration_s", 0.0) / 60:.1f} min')
+            m_col2.metric("Overlapping Speech", f'{call_metrics.get("overlap_s", 0.0):.1f} s')
+            for speaker, seconds in call_metrics.get("talk_time_s", {}).items():
+                turns = call_metrics.get("turns", {}).get(speaker, 0)
+                st.write(f"- **{speaker}:** {seconds:.1f} s over {turns} turns")
+
         st.subheader("File Information")
         st.info(session_state.get("audio_filepath", "N/A"))
 
@@ -100,120 +100,78 @@ async def log_event(event):
 
 async def call_agent_async_ui(runner, session_id, query, chat_placeholder, status_placeholder=None):
     """Call the agent asynchronously and display the response in the UI."""
-    print(f"\n{Colors.BG_GREEN}{Colors.BLACK}{Colors.BOLD}--- Running Query: {query} ---{Colors.RESET}")
-    await display_state(
-        runner.session_service,
-        runner.app_name,
-        USER_ID,
-        session_id,
-        "State BEFORE processing",
-    )
+    with trace("query", session_id=session_id, query=query[:200]) as current:
+        print(f"\n{Colors.BG_GREEN}{Colors.BLACK}{Colors.BOLD}--- Running Query: {query} ---{Colors.RESET}")
 
-    # 1. Get the session and append the user query as an event first.
-    session = await runner.session_service.get_session(
-        app_name=runner.app_name, user_id=USER_ID, session_id=session_id
-    )
-    session.state["interaction_history"].append({
-        "action": "user_query",
-        "query": query,
-        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-    })
-    user_query_event = Event(
-        author="user",
-        content=types.Content(role="user", parts=[types.Part(text=query)]),
-    )
-    await runner.session_service.append_event(session=session, event=user_query_event)
-
-    # 2. Run the agent.
-    content = types.Content(role="user", parts=[types.Part(text=query)])
-    final_response_text = ""
-    agent_name = ""
-    try:
-        async for event in runner.run_async(
-            user_id=USER_ID, session_id=session_id, new_message=content
-        ):
-            await log_event(event)
-            if status_placeholder and event.author:
-                status_text = f"Running {event.author}..."
-                if event.author == "audio_to_transcript_agent":
-                    status_text = "Transcribing audio..."
-                elif event.author == "IntentAgent":
-                    status_text = "Analyzing intent..."
-                elif event.author == "sentiment_agent":
-                    status_text = "Analyzing sentiment..."
-                elif event.author == "root_cause_agent":
-                    status_text = "原因 Analyzing root cause..."
-                elif event.author == "synthesizer_agent":
-                    status_text = "Generating final report..."
-                elif event.author == "manager_agent":
-                    status_text = "Orchestrating analysis..."
-                status_placeholder.text(status_text)
-
-            if event.author:
-                agent_name = event.author
-            if event.is_final_response() and event.content and event.content.parts:
-                final_response_text = event.content.parts[0].text.strip()
-                chat_placeholder.markdown(final_response_text)
-                if status_placeholder:
-                    status_placeholder.empty()
-
-    except Exception as e:
-        st.error(f"An error occurred during agent execution: {e}")
-        if status_placeholder:
-            status_placeholder.empty()
-        return None
-
-    # 3. Re-fetch the session and append the agent response.
-    if final_response_text and agent_name:
-        session = await runner.session_service.get_session(
-            app_name=runner.app_name, user_id=USER_ID, session_id=session_id
-        )
-        session.state["interaction_history"].append({
-            "action": "agent_response",
-            "agent": agent_name,
-            "response": final_response_text,
-            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        })
-        agent_response_event = Event(
-            author=agent_name,
-            content=types.Content(
-                role="model", parts=[types.Part(text=final_response_text)]
-            ),
-        )
-        await runner.session_service.append_event(
-            session=session, event=agent_response_event
-        )
-    
-    await display_state(
-        runner.session_service,
-        runner.app_name,
-        USER_ID,
-        session_id,
-        "State AFTER processing",
-    )
+        # The query, the agent events and the interaction history entries are stored by the turn.
+        turn = SessionTurn(runner, USER_ID, session_id)
+        final_response_text = ""
+        agent_name = ""
+        try:
+            async for event in turn.run(query):
+                await log_event(event)
+                if status_placeholder and event.author:
+                    status_text = f"Running {event.author}..."
+                    if event.author == "audio_to_transcript_agent":
+                        status_text = "Transcribing audio..."
+                    elif event.author == "IntentAgent":
+                        status_text = "Analyzing intent..."
+                    elif event.author == "sentiment_agent":
+                        status_text = "Analyzing sentiment..."
+                    elif event.author == "root_cause_agent":
+                        status_text = "原因 Analyzing root cause..."
+                    elif event.author == "synthesizer_agent":
+                        status_text = "Generating final report..."
+                    elif event.author == "manager_agent":
+                        status_text = "Orchestrating analysis..."
+                    status_placeholder.text(status_text)
+
+                if event.author:
+                    agent_name = event.author
+                if event.is_final_response() and event.content and event.content.parts:
+                    final_response_text = event.content.parts[0].text.strip()
+                    chat_placeholder.markdown(final_response_text)
+                    if status_placeholder:
+                        status_placeholder.empty()
+
+        except Exception as e:
+            st.error(f"An error occurred during agent execution: {e}")
+            if status_placeholder:
+                status_placeholder.empty()
+            # The query still goes into the interaction history, as in call_agent_async.
+            await turn.finish(agent_name, final_response_text)
+            return None
+
+        await turn.finish(agent_name, final_response_text)
+
+    if current is not None:
+        print(format_summary(current))
+        st.session_state.trace_summary = {
+            "trace_id": current.trace_id,
+            "wall_ms": round(current.root.duration_s * 1000, 1),
+            "rows": current.summary_rows(),
+        }
     print(f"{Colors.YELLOW}{'-' * 30}{Colors.RESET}")
     return final_response_text
 
-def load_session_callback(session_data):
+def load_session_callback(session_id):
     """
     Callback function to load a selected session's state and switch to the
     analysis page. This is triggered by on_click from a streamlit-card.
     """
+    session_data = asyncio.run(get_session_service().get_session(app_name=APP_NAME, user_id=USER_ID, session_id=session_id))
+    if session_data is None:
+        st.error("This session no longer exists.")
+        return
     st.session_state.clear()
     st.session_state.page = "analysis"
     st.session_state.session_id = session_data.id
     st.session_state.audio_path = session_data.state.get("audio_filepath")
     st.session_state.analysis_done = True
-    st.session_state.report = session_data.state.get("analysis_report")
+    st.session_state.report = state_value(session_data.state, "analysis_report")
     
-    chat_history = []
     # Skip the first two interactions (initial prompt and report)
-    for interaction in session_data.state.get("interaction_history", [])[2:]:
-        if interaction.get("action") == "user_query":
-            chat_history.append({"role": "user", "content": interaction.get("query")})
-        elif interaction.get("action") == "agent_response":
-            chat_history.append({"role": "assistant", "content": interaction.get("response")})
-    st.session_state.chat_history = chat_history
+    st.session_state.chat_history = chat_messages(session_data.state.get("interaction_history", []), skip=2)
     
     st.rerun()
 
@@ -229,15 +187,23 @@ def home_page():
     # --- Tile 1: Previous Sessions ---
     with st.container(border=True):
         st.subheader("Previous Wisdoms",anchor=False)
-        session_service = DatabaseSessionService(db_url=DB_URL)
-        
+
         try:
-            past_sessions = asyncio.run(session_service.list_sessions(app_name=APP_NAME, user_id=USER_ID))
+            # Sessions written before the index existed are indexed once, on the first visit.
+            if session_index.needs_backfill(APP_NAME, USER_ID):
+                asyncio.run(backfill_session_index(get_session_service(), APP_NAME, USER_ID))
         except Exception as e:
             st.error(f"Could not load past sessions: {e}")
             return
 
-        completed_sessions = [s for s in past_sessions.sessions if s.state.get("analysis_report")]
+        search = st.text_input("Search by file name, intent or sentiment", key="wisdom_search")
+        if search != st.session_state.get("wisdom_last_search"):
+            st.session_state.wisdom_last_search = search
+            st.session_state.wisdom_page = 0
+        page = st.session_state.get("wisdom_page", 0)
+        completed_sessions, total = session_index.page(
+            APP_NAME, USER_ID, search=search, page=page, page_size=SESSIONS_PER_PAGE
+        )
 
         if not completed_sessions:
             st.info("No previous analyses found.")
@@ -245,10 +211,11 @@ def home_page():
             cols = st.columns(3)
             for i, session in enumerate(completed_sessions):
                 with cols[i % 3]:
-                    filename = os.path.basename(session.state.get("audio_filepath", "Unknown File"))
+                    filename = session["filename"] or "Unknown File"
+                    analyzed_at = datetime.fromtimestamp(session["created_at"]).strftime("%Y-%m-%d %H:%M")
                     card(
                         title=filename,
-                        text=f"Analyzed",
+                        text=" · ".join(part for part in (session["intent"], session["sentiment"], analyzed_at) if part),
                         image="https://cdn-icons-png.flaticon.com/512/1001/1001344.png", 
                         styles={
                             "card": {
@@ -268,10 +235,20 @@ def home_page():
                                 "font-size": "14px"
                             }
                         },
-                        on_click=lambda s=session: load_session_callback(session_data=s),
-                        key=f"card_{session.id}"
+                        on_click=lambda s=session["session_id"]: load_session_callback(session_id=s),
+                        key=f"card_{session['session_id']}"
                     )
 
+            pages = (total + SESSIONS_PER_PAGE - 1) // SESSIONS_PER_PAGE
+            prev_col, info_col, next_col = st.columns([1, 3, 1])
+            if prev_col.button("Previous", disabled=page == 0):
+                st.session_state.wisdom_page = page - 1
+                st.rerun()
+            info_col.caption(f"Page {page + 1} of {pages}, {total} analyses")
+            if next_col.button("Next", disabled=page + 1 >= pages):
+                st.session_state.wisdom_page = page + 1
+                st.rerun()
+
     # --- Tile 2: Upload ---
     with st.container(border=True):
         st.subheader("Start New Analysis")
@@ -306,13 +283,21 @@ def analysis_page():
             st.rerun()
         return
 
-    # Initialize session service and runner
-    session_service = DatabaseSessionService(db_url=DB_URL)
+    # The session service is shared by every rerun and browser session of the process.
+    session_service = get_session_service()
     runner = Runner(
         agent=manager_agent,
         app_name=APP_NAME,
         session_service=session_service,
+        plugins=[TracingPlugin()],
     )
+    # With SAGE_WORKFLOW_MODE=tools the analysis runs sage_workflow directly,
+    # and manager_agent is only used for the follow-up chat.
+    analysis_runner = runner
+    if WORKFLOW_MODE == "tools":
+        analysis_runner = Runner(
+            agent=sage_workflow, app_name=APP_NAME, session_service=session_service, plugins=[TracingPlugin()]
+        )
 
     # --- Layout Setup ---
     left_column, right_column = st.columns([2, 1])
@@ -323,8 +308,7 @@ def analysis_page():
     # --- Initial Analysis ---
     if "analysis_done" not in st.session_state:
         async def run_analysis():
-            session_state = initial_state.copy()
-            session_state["audio_filepath"] = audio_path
+            session_state = new_session_state(audio_filepath=audio_path)
             await session_service.create_session(
                 app_name=APP_NAME,
                 user_id=USER_ID,
@@ -336,7 +320,7 @@ def analysis_page():
                 with st.spinner("Starting analysis..."):
                     status_placeholder = st.empty()
                     analysis_report = await call_agent_async_ui(
-                        runner, session_id, "Analyze the audio file", report_placeholder, status_placeholder
+                        analysis_runner, session_id, "Analyze the audio file", report_placeholder, status_placeholder
                     )
             
             if analysis_report:
@@ -360,9 +344,23 @@ def analysis_page():
         with left_column:
             display_state_ui(session.state)
 
+            trace_summary = st.session_state.get("trace_summary")
+            if trace_summary:
+                with st.expander(f"Where the time went ({trace_summary['wall_ms'] / 1000:.1f} s, last run)"):
+                    st.caption(f"Trace {trace_summary['trace_id']}")
+                    st.dataframe(trace_summary["rows"], use_container_width=True)
+
         with right_column:
             st.subheader("Follow-up Chat")
 
+            # Older messages are rolled out of the session and only read from the history log when asked for.
+            interaction_history = session.state.get("interaction_history", [])
+            if interaction_history and is_rollup(interaction_history[0]) and not st.session_state.get("full_chat_loaded"):
+                if st.button("Show earlier messages"):
+                    st.session_state.chat_history = chat_messages(history_log.read(session_id), skip=2)
+                    st.session_state.full_chat_loaded = True
+                    st.rerun()
+
             # Display chat messages from history
             for message in st.session_state.chat_history:
                 with st.chat_message(message["role"]):
@@ -378,7 +376,9 @@ def analysis_page():
                     with st.spinner("Thinking..."):
                         response_placeholder = st.empty()
                         status_placeholder = st.empty()
-                        response = asyncio.run(call_agent_async_ui(runner, session_id, prompt, response_placeholder, status_placeholder))
+                        # Follow-up questions go ahead of the batch analyses waiting for the same models.
+                        with request_priority("interactive"):
+                            response = asyncio.run(call_agent_async_ui(runner, session_id, prompt, response_placeholder, status_placeholder))
                         if response:
                             st.session_state.chat_history.append({"role": "assistant", "content": response})
                             st.rerun()
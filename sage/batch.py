@@ -0,0 +1,296 @@
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+from datetime import datetime
+
+from dotenv import load_dotenv
+from google.adk.runners import Runner
+from google.genai import types
+
+from manager_agent.agent import sage_workflow
+from manager_agent.blob_store import blob_store, prune_unreferenced_blobs
+from manager_agent.scheduler import rate_limit_stats
+from manager_agent.session_backend import SESSION_DB_URL, get_session_service
+from manager_agent.tracing import TracingPlugin, trace
+from manager_agent.sub_agents.audio_to_transcript_agent.transcript_cache import transcript_cache
+from manager_agent.stages import configure_stage_limits, get_stage_limits, parse_stage_limits
+from session_defaults import APP_NAME, USER_ID, new_session_state
+from stats import percentile
+from utils import Colors
+
+load_dotenv()
+
+DB_URL = SESSION_DB_URL
+MANIFEST_VERSION = 1
+
+
+def find_recordings(input_dir, extensions=(".wav",)):
+    """
+    Lists the audio recordings in a directory, recursively and in a stable order.
+
+    Args:
+        input_dir (str): The directory holding the recordings.
+        extensions (tuple): The file extensions to pick up.
+
+    Returns:
+        list: Absolute paths of the recordings found.
+    """
+    recordings = []
+    for root, _, files in os.walk(input_dir):
+        for name in files:
+            if name.lower().endswith(extensions):
+                recordings.append(os.path.abspath(os.path.join(root, name)))
+    return sorted(recordings)
+
+
+def load_manifest(manifest_path):
+    """
+    Loads the job manifest, or returns an empty one if it does not exist yet.
+
+    Args:
+        manifest_path (str): Path of the JSON manifest file.
+
+    Returns:
+        dict: The manifest with a 'jobs' mapping of audio path to job record.
+    """
+    if not os.path.exists(manifest_path):
+        return {"version": MANIFEST_VERSION, "jobs": {}}
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    manifest.setdefault("jobs", {})
+    return manifest
+
+
+def save_manifest(manifest, manifest_path):
+    """Writes the manifest atomically so an interrupted run never leaves it half written."""
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+
+async def analyze_recording(runner, audio_path):
+    """
+    Runs the analysis workflow for a single recording in a fresh session.
+
+    Args:
+        runner (Runner): The runner wrapping the analysis workflow.
+        audio_path (str): The recording to analyze.
+
+    Returns:
+        dict: The job record with session id, status, latency, any error and the slowest spans.
+    """
+    session_state = new_session_state(audio_filepath=audio_path)
+    started = time.perf_counter()
+    record = {
+        "status": "running",
+        "started_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    with trace("analysis", audio_path=audio_path) as current:
+        try:
+            session = await runner.session_service.create_session(
+                app_name=runner.app_name,
+                user_id=USER_ID,
+                state=session_state,
+            )
+            record["session_id"] = session.id
+
+            content = types.Content(role="user", parts=[types.Part(text="Analyze the audio file")])
+            async for _ in runner.run_async(
+                user_id=USER_ID, session_id=session.id, new_message=content
+            ):
+                pass
+
+            session = await runner.session_service.get_session(
+                app_name=runner.app_name, user_id=USER_ID, session_id=session.id
+            )
+            if session.state.get("analysis_report"):
+                record["status"] = "done"
+            else:
+                record["status"] = "failed"
+                record["error"] = "Workflow finished without an analysis report."
+        except Exception as e:
+            record["status"] = "failed"
+            record["error"] = str(e)
+
+    if current is not None:
+        record["trace_id"] = current.trace_id
+        record["slowest_spans"] = [
+            {key: row[key] for key in ("kind", "name", "calls", "total_ms")} for row in current.summary_rows()[:5]
+        ]
+
+    record["latency_s"] = round(time.perf_counter() - started, 3)
+    record["finished_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    return record
+
+
+async def run_batch(recordings, manifest_path, workers=4, retry_failed=False, db_url=DB_URL):
+    """
+    Analyzes many recordings concurrently over a bounded pool of workers.
+
+    Recordings already marked as done in the manifest are skipped, so an
+    interrupted run can be resumed by running the same command again.
+
+    Args:
+        recordings (list): Paths of the recordings to analyze.
+        manifest_path (str): Path of the JSON manifest used to resume runs.
+        workers (int): Number of sessions analyzed at the same time.
+        retry_failed (bool): Whether recordings that failed before are retried.
+        db_url (str): The session database URL.
+
+    Returns:
+        dict: A summary with counts, per-call latencies and throughput.
+    """
+    manifest = load_manifest(manifest_path)
+    jobs = manifest["jobs"]
+
+    pending = []
+    for path in recordings:
+        status = jobs.get(path, {}).get("status")
+        if status == "done" or (status == "failed" and not retry_failed):
+            continue
+        pending.append(path)
+
+    print(
+        f"{Colors.BOLD}Batch: {len(recordings)} recordings, {len(pending)} pending, "
+        f"{workers} workers, stage limits {get_stage_limits()}{Colors.RESET}"
+    )
+
+    session_service = get_session_service(db_url)
+    runner = Runner(
+        agent=sage_workflow, app_name=APP_NAME, session_service=session_service, plugins=[TracingPlugin()]
+    )
+
+    queue = asyncio.Queue()
+    for path in pending:
+        queue.put_nowait(path)
+
+    manifest_lock = asyncio.Lock()
+    latencies = []
+    failed = 0
+
+    async def worker():
+        nonlocal failed
+        while True:
+            try:
+                path = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            async with manifest_lock:
+                jobs[path] = {"status": "running"}
+                save_manifest(manifest, manifest_path)
+
+            record = await analyze_recording(runner, path)
+
+            async with manifest_lock:
+                jobs[path] = record
+                save_manifest(manifest, manifest_path)
+
+            if record["status"] == "done":
+                latencies.append(record["latency_s"])
+                color = Colors.GREEN
+            else:
+                failed += 1
+                color = Colors.RED
+            print(
+                f"{color}[{record['status']}] {os.path.basename(path)} "
+                f"in {record['latency_s']:.1f}s{Colors.RESET}"
+                + (f" ({record['error']})" if record.get("error") else "")
+            )
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(max(1, workers))))
+    wall_time = time.perf_counter() - started
+
+    summary = {
+        "recordings": len(recordings),
+        "processed": len(pending),
+        "done": len(latencies),
+        "failed": failed,
+        "skipped": len(recordings) - len(pending),
+        "workers": workers,
+        "wall_time_s": round(wall_time, 3),
+        "calls_per_minute": round(len(latencies) / wall_time * 60, 2) if wall_time > 0 else 0.0,
+        "latency_s": {
+            "mean": round(statistics.mean(latencies), 3) if latencies else 0.0,
+            "p50": round(percentile(latencies, 50), 3),
+            "p95": round(percentile(latencies, 95), 3),
+            "max": round(max(latencies), 3) if latencies else 0.0,
+        },
+        "transcript_cache": transcript_cache.stats(),
+        "rate_limits": rate_limit_stats(),
+        "session_blobs": blob_store.stats(),
+    }
+    manifest["last_run"] = summary
+    save_manifest(manifest, manifest_path)
+    return summary
+
+
+def main():
+    """Entry point for headless batch analysis."""
+    parser = argparse.ArgumentParser(description="Analyze a directory of call recordings.")
+    parser.add_argument("input_dir", help="Directory containing the .wav recordings.")
+    parser.add_argument("--workers", type=int, default=4, help="Sessions analyzed concurrently.")
+    parser.add_argument(
+        "--manifest",
+        default=None,
+        help="Job manifest used to resume runs (default: <input_dir>/batch_manifest.json).",
+    )
+    parser.add_argument(
+        "--stage-limits",
+        default="",
+        help='Per-stage concurrency limits, e.g. "transcription=2,sentiment=8".',
+    )
+    parser.add_argument("--retry-failed", action="store_true", help="Retry recordings that failed before.")
+    parser.add_argument("--db-url", default=DB_URL, help="Session database URL.")
+    parser.add_argument(
+        "--prune-blobs",
+        action="store_true",
+        help="After the batch, delete the session blobs no session refers to any more.",
+    )
+    parser.add_argument(
+        "--prewarm",
+        action="store_true",
+        help="Load the local whisper/pyannote models before the first call (local backend only).",
+    )
+    args = parser.parse_args()
+
+    if args.stage_limits:
+        configure_stage_limits(parse_stage_limits(args.stage_limits))
+
+    if args.prewarm:
+        from manager_agent.sub_agents.audio_to_transcript_agent.agent import TRANSCRIBE_BACKEND
+
+        if TRANSCRIBE_BACKEND == "local":
+            from manager_agent.sub_agents.audio_to_transcript_agent.local_backend import model_pool
+
+            model_pool.prewarm()
+            print(f"Local transcription models ready: {model_pool.stats()}")
+        else:
+            print(f"--prewarm ignored: the transcription backend is {TRANSCRIBE_BACKEND!r}, not 'local'.")
+
+    manifest_path = args.manifest or os.path.join(args.input_dir, "batch_manifest.json")
+    recordings = find_recordings(args.input_dir)
+    summary = asyncio.run(
+        run_batch(
+            recordings,
+            manifest_path,
+            workers=args.workers,
+            retry_failed=args.retry_failed,
+            db_url=args.db_url,
+        )
+    )
+
+    print(f"\n{Colors.BOLD}Batch summary{Colors.RESET}")
+    print(json.dumps(summary, indent=2))
+
+    if args.prune_blobs:
+        pruned = asyncio.run(prune_unreferenced_blobs(get_session_service(args.db_url), APP_NAME))
+        print(f"Pruned session blobs: {pruned}")
+
+
+if __name__ == "__main__":
+    main()
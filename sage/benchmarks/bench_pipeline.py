@@ -0,0 +1,328 @@
+"""
+End-to-end benchmark of sage_workflow with per-stage timings.
+
+Synthetic recordings of every length in --minutes (default 1, 10 and 60), with
+2 to 6 speakers, are analyzed against the local mock server
+(benchmarks/mock_server.py). The server is started on a free port unless
+SAGE_MOCK_URL already points at one. For every call length the report gives:
+
+- the p50/p95/p99 latency of each stage and of the whole call
+- the LLM requests and tokens per call
+- the peak RSS of the process that ran the calls
+
+Run from the sage/ directory:
+
+    python -m benchmarks.bench_pipeline --calls 5
+
+Every call length runs in its own process, so peak RSS is measured per length.
+The transcript cache, the analysis memo and the LLM response cache are
+disabled. The report is written to bench_results/ as JSON. Pass --baseline with
+an earlier report to print how the p50/p95 of every stage changed.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+import wave
+
+from google.genai import types
+
+from benchmarks.mock_server import DEFAULT_LATENCY, SPEAKER_CODE_STEP, make_server, parse_latency
+from stats import percentile
+
+STAGES = ("transcription", "intent", "sentiment", "root_cause", "synthesis")
+# Workflow agents timed as each stage, in both workflow modes.
+STAGE_AGENTS = {
+    "audio_to_transcript_agent": "transcription",
+    "incremental_transcription_agent": "transcription",
+    "IntentAgent": "intent",
+    "sentiment_agent": "sentiment",
+    "root_cause_agent": "root_cause",
+    "synthesizer_agent": "synthesis",
+}
+SAMPLE_RATE = 8000
+
+
+def write_synthetic_call(path: str, minutes: float, speakers: int, seed: int) -> None:
+    """
+    Writes a speaker-coded WAV recording that the mock server diarizes into `speakers` speakers.
+
+    Turns last 2 to 15 seconds and never go to the speaker who just talked.
+    """
+    rng = random.Random(seed)
+    total = int(minutes * 60 * SAMPLE_RATE)
+    written, speaker = 0, 0
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        while written < total:
+            speaker = rng.choice([s for s in range(1, speakers + 1) if s != speaker])
+            frames = min(int(rng.uniform(2, 15) * SAMPLE_RATE), total - written)
+            wav.writeframes(struct.pack("<h", speaker * SPEAKER_CODE_STEP) * frames)
+            written += frames
+
+
+def build_corpus(corpus_dir: str, lengths: list, calls: int, speaker_range: tuple, seed: int) -> dict:
+    """
+    Writes the synthetic recordings that are missing from the corpus directory.
+
+    Returns:
+        dict: Call length in minutes -> list of (path, speakers).
+    """
+    os.makedirs(corpus_dir, exist_ok=True)
+    low, high = speaker_range
+    corpus = {}
+    for minutes in lengths:
+        corpus[minutes] = []
+        for index in range(calls):
+            speakers = low + index % (high - low + 1)
+            path = os.path.join(corpus_dir, f"call_{minutes:g}min_{speakers}spk_{index}_s{seed}.wav")
+            if not os.path.exists(path):
+                write_synthetic_call(path, minutes, speakers, seed=hash((minutes, index, seed)))
+            corpus[minutes].append((path, speakers))
+    return corpus
+
+
+def install_stage_timer(timings: dict) -> None:
+    """Adds the wall time of every stage agent to timings[session_id][stage]."""
+    from google.adk.agents.base_agent import BaseAgent
+
+    run_async = BaseAgent.run_async
+
+    async def timed_run_async(self, parent_context):
+        stage = STAGE_AGENTS.get(self.name)
+        started = time.perf_counter()
+        try:
+            async for event in run_async(self, parent_context):
+                yield event
+        finally:
+            if stage:
+                session_timings = timings.setdefault(parent_context.session.id, {})
+                session_timings[stage] = session_timings.get(stage, 0.0) + time.perf_counter() - started
+
+    BaseAgent.run_async = timed_run_async
+
+
+def mock_stats(mock_url: str) -> dict:
+    with urllib.request.urlopen(f"{mock_url}/stats") as response:
+        return json.load(response)
+
+
+def usage_delta(before: dict, after: dict) -> dict:
+    """Counts the requests and tokens the mock server served between two /stats snapshots."""
+    def delta(kind, field):
+        return after.get(kind, {}).get(field, 0) - before.get(kind, {}).get(field, 0)
+
+    return {
+        "llm_requests": delta("chat", "requests") + delta("gemini", "requests"),
+        "transcription_requests": delta("transcription", "requests"),
+        "prompt_tokens": delta("chat", "prompt_tokens") + delta("gemini", "prompt_tokens"),
+        "completion_tokens": delta("chat", "completion_tokens") + delta("gemini", "completion_tokens"),
+        "injected_failures": sum(
+            delta(kind, "rate_limited") + delta(kind, "errors") for kind in set(before) | set(after)
+        ),
+    }
+
+
+def peak_rss_mb() -> float:
+    """Returns the peak resident set size of this process in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+async def run_worker(paths: list) -> dict:
+    """Analyzes the recordings one at a time, so the mock server usage of each call can be told apart."""
+    from google.adk.runners import Runner
+    from google.adk.sessions import InMemorySessionService
+    from session_defaults import new_session_state
+    from manager_agent.agent import sage_workflow
+    from manager_agent.blob_store import state_value
+
+    mock_url = os.environ["SAGE_MOCK_URL"]
+    timings = {}
+    install_stage_timer(timings)
+    session_service = InMemorySessionService()
+    runner = Runner(agent=sage_workflow, app_name="bench", session_service=session_service)
+
+    results = []
+    for path in paths:
+        session = await session_service.create_session(
+            app_name="bench", user_id="bench", state=new_session_state(audio_filepath=path)
+        )
+        content = types.Content(role="user", parts=[types.Part(text="Analyze the audio file")])
+        before = mock_stats(mock_url)
+        started = time.perf_counter()
+        async for _ in runner.run_async(user_id="bench", session_id=session.id, new_message=content):
+            pass
+        elapsed = time.perf_counter() - started
+        after = mock_stats(mock_url)
+        session = await session_service.get_session(app_name="bench", user_id="bench", session_id=session.id)
+        results.append({
+            "file": path,
+            "total_s": round(elapsed, 3),
+            "stages_s": {stage: round(seconds, 3) for stage, seconds in timings.get(session.id, {}).items()},
+            **usage_delta(before, after),
+            "segments": len(state_value(session.state, "transcript") or []),
+            "report": bool(state_value(session.state, "analysis_report")),
+        })
+        print(f"{os.path.basename(path)}: {results[-1]['total_s']}s {results[-1]['stages_s']}", file=sys.stderr)
+    return {"calls": results, "peak_rss_mb": peak_rss_mb()}
+
+
+def latency_summary(values: list) -> dict:
+    return {
+        "p50": round(percentile(values, 50), 3),
+        "p95": round(percentile(values, 95), 3),
+        "p99": round(percentile(values, 99), 3),
+        "max": round(max(values), 3) if values else 0.0,
+    }
+
+
+def summarize(calls: list, peak_rss: float) -> dict:
+    latency = {
+        stage: latency_summary([c["stages_s"][stage] for c in calls if stage in c["stages_s"]])
+        for stage in STAGES
+    }
+    latency["total"] = latency_summary([c["total_s"] for c in calls])
+
+    def mean(field):
+        return round(sum(c[field] for c in calls) / len(calls), 1) if calls else 0.0
+
+    return {
+        "calls": len(calls),
+        "reports": sum(c["report"] for c in calls),
+        "latency_s": latency,
+        "llm_requests_mean": mean("llm_requests"),
+        "transcription_requests_mean": mean("transcription_requests"),
+        "prompt_tokens_mean": mean("prompt_tokens"),
+        "completion_tokens_mean": mean("completion_tokens"),
+        "injected_failures": sum(c["injected_failures"] for c in calls),
+        "peak_rss_mb": peak_rss,
+    }
+
+
+def compare(report: dict, baseline: dict) -> None:
+    """Prints the p50/p95 change of every stage against an earlier report."""
+    print(f"Compared with {baseline.get('git_commit') or 'baseline'} ({baseline.get('created_at')}):")
+    for length, summary in report["lengths"].items():
+        old = baseline.get("lengths", {}).get(length)
+        if not old:
+            continue
+        for stage in (*STAGES, "total"):
+            new_latency = summary["summary"]["latency_s"].get(stage, {})
+            old_latency = old["summary"]["latency_s"].get(stage, {})
+            changes = []
+            for pct in ("p50", "p95"):
+                before, after = old_latency.get(pct), new_latency.get(pct)
+                if before and after is not None:
+                    changes.append(f"{pct} {before:.2f}s -> {after:.2f}s ({(after - before) / before:+.0%})")
+            if changes:
+                print(f"  {length:>8} {stage:<14} " + ", ".join(changes))
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--minutes", default="1,10,60", help="Comma separated call lengths in minutes.")
+    parser.add_argument("--calls", type=int, default=3, help="Recordings per call length.")
+    parser.add_argument("--speakers", default="2-6", help="Range of speakers per recording.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--corpus", default="./bench_corpus", help="Directory of the synthetic recordings.")
+    parser.add_argument("--latency", default="", help='Mock latency per kind as "median:p95", see benchmarks.mock_server.')
+    parser.add_argument("--no-latency", action="store_true", help="Let the mock server answer at once.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of mock requests failing with a 500.")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of mock requests failing with a 429.")
+    parser.add_argument("--output", default=None, help="JSON report path (default: bench_results/pipeline_<time>.json).")
+    parser.add_argument("--baseline", default=None, help="Earlier JSON report to compare with.")
+    parser.add_argument("--worker", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("paths", nargs="*", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        with open(args.worker, "w", encoding="utf-8") as f:
+            json.dump(asyncio.run(run_worker(args.paths)), f)
+        return
+
+    lengths = [float(m) for m in args.minutes.split(",")]
+    low, _, high = args.speakers.partition("-")
+    corpus = build_corpus(args.corpus, lengths, args.calls, (int(low), int(high or low)), args.seed)
+
+    latency = {} if args.no_latency else dict(DEFAULT_LATENCY, **parse_latency(args.latency))
+    server = None
+    mock_url = os.getenv("SAGE_MOCK_URL")
+    if not mock_url:
+        server = make_server("127.0.0.1", 0, latency, args.error_rate, args.rate_limit_rate, args.seed)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        mock_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    env = dict(
+        os.environ, SAGE_MOCK_URL=mock_url, SAGE_TRANSCRIPT_CACHE="0", SAGE_ANALYSIS_MEMO="0", SAGE_LLM_CACHE="0"
+    )
+    report = {
+        "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "git_commit": git_commit(),
+        "settings": {
+            "workflow_mode": os.getenv("SAGE_WORKFLOW_MODE", "agents"),
+            "pipeline_mode": os.getenv("SAGE_PIPELINE_MODE", "sequential"),
+            "sentiment_mode": os.getenv("SAGE_SENTIMENT_MODE", "per_minute"),
+            "mock_latency": None if not server else latency,
+            "mock_error_rate": None if not server else args.error_rate,
+            "mock_rate_limit_rate": None if not server else args.rate_limit_rate,
+        },
+        "lengths": {},
+    }
+    try:
+        for minutes, recordings in corpus.items():
+            with tempfile.TemporaryDirectory() as tmp:
+                worker_output = os.path.join(tmp, "worker.json")
+                subprocess.run(
+                    [sys.executable, "-m", "benchmarks.bench_pipeline", "--worker", worker_output,
+                     *(path for path, _ in recordings)],
+                    env=env,
+                    check=True,
+                )
+                with open(worker_output, "r", encoding="utf-8") as f:
+                    worker = json.load(f)
+            for call, (_, speakers) in zip(worker["calls"], recordings):
+                call["speakers"] = speakers
+            report["lengths"][f"{minutes:g}min"] = {
+                "summary": summarize(worker["calls"], worker["peak_rss_mb"]),
+                "calls": worker["calls"],
+            }
+    finally:
+        if server:
+            server.shutdown()
+
+    output = args.output or os.path.join("bench_results", f"pipeline_{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps({length: r["summary"] for length, r in report["lengths"].items()}, indent=2))
+    print(f"Report written to {output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
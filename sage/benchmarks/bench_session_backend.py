@@ -0,0 +1,174 @@
+"""
+Stress test of the session database under concurrent writers.
+
+Every configuration gets a fresh database. A single writer first appends
+--events events to one session, which gives the uncontended write latency.
+Then --processes processes, standing for the app and batch runs sharing a
+database, each write --sessions sessions at the same time, --events events per
+session, with a get_session every --read-every events. Configurations:
+
+- adk-default: DatabaseSessionService as ADK builds it (SQLite rollback journal, synchronous=FULL)
+- tuned: manager_agent.session_backend.create_session_service (WAL, synchronous=NORMAL, sized pool)
+- postgres: the same, on the database of --postgres-url, when given
+
+The report gives the writes per second, the write latency percentiles, the lock
+wait (the latency above the uncontended median, as the database reports no
+waits itself) and the failed writes, such as "database is locked".
+
+Run from the sage/ directory:
+
+    python -m benchmarks.bench_session_backend --processes 4 --sessions 8
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from google.adk.events import Event, EventActions
+from google.adk.sessions import DatabaseSessionService
+from google.genai import types
+
+from benchmarks.mock_server import LINES
+from manager_agent.session_backend import async_db_url, create_session_service
+from stats import percentile
+
+
+def build_service(config: str, db_url: str):
+    if config == "adk-default":
+        return DatabaseSessionService(db_url=async_db_url(db_url))
+    return create_session_service(db_url)
+
+
+def analysis_event(index: int, payload_bytes: int) -> Event:
+    text = (LINES[index % len(LINES)] + " ") * max(1, payload_bytes // 80)
+    return Event(
+        author="sage_workflow",
+        invocation_id=f"stress-{index}",
+        content=types.Content(role="model", parts=[types.Part(text=text[:payload_bytes])]),
+        actions=EventActions(state_delta={"step": index}),
+    )
+
+
+async def write_sessions(config, db_url, sessions, events, read_every, payload_bytes, barrier=None):
+    service = build_service(config, db_url)
+    created = [
+        await service.create_session(app_name="stress", user_id=f"user-{os.getpid()}", state={"step": 0})
+        for _ in range(sessions)
+    ]
+    if barrier is not None:
+        barrier.wait()
+
+    writes, reads, errors = [], [], []
+
+    async def writer(session):
+        for index in range(events):
+            started = time.perf_counter()
+            try:
+                await service.append_event(session, analysis_event(index, payload_bytes))
+                writes.append(time.perf_counter() - started)
+            except Exception as e:
+                errors.append(type(e).__name__ + ": " + str(e)[:120])
+            if read_every and (index + 1) % read_every == 0:
+                started = time.perf_counter()
+                try:
+                    session = await service.get_session(
+                        app_name=session.app_name, user_id=session.user_id, session_id=session.id
+                    )
+                    reads.append(time.perf_counter() - started)
+                except Exception as e:
+                    errors.append(type(e).__name__ + ": " + str(e)[:120])
+
+    started = time.perf_counter()
+    await asyncio.gather(*(writer(session) for session in created))
+    elapsed = time.perf_counter() - started
+    await service.db_engine.dispose()
+    return {"writes": writes, "reads": reads, "errors": errors, "elapsed_s": elapsed}
+
+
+def run_process(config, db_url, sessions, events, read_every, payload_bytes, barrier):
+    return asyncio.run(write_sessions(config, db_url, sessions, events, read_every, payload_bytes, barrier))
+
+
+def measure(config: str, db_url: str, args) -> dict:
+    # The tables are created before the processes start, so they do not race to create them.
+    baseline = asyncio.run(write_sessions(config, db_url, 1, args.events, 0, args.payload_bytes))
+    uncontended = statistics.median(baseline["writes"])
+
+    context = multiprocessing.get_context("spawn")
+    with context.Manager() as manager, ProcessPoolExecutor(args.processes, mp_context=context) as pool:
+        barrier = manager.Barrier(args.processes)
+        results = list(pool.map(
+            run_process,
+            *zip(*[
+                (config, db_url, args.sessions, args.events, args.read_every, args.payload_bytes, barrier)
+                for _ in range(args.processes)
+            ]),
+        ))
+
+    writes = [latency for result in results for latency in result["writes"]]
+    reads = [latency for result in results for latency in result["reads"]]
+    waits = [max(0.0, latency - uncontended) for latency in writes]
+    errors = [error for result in results for error in result["errors"]]
+    elapsed = max(result["elapsed_s"] for result in results)
+    return {
+        "writes": len(writes),
+        "writes_per_s": round(len(writes) / elapsed, 1) if elapsed else 0.0,
+        "uncontended_ms": round(uncontended * 1000, 2),
+        "write_ms": {
+            "p50": round(percentile(writes, 50) * 1000, 2) if writes else None,
+            "p95": round(percentile(writes, 95) * 1000, 2) if writes else None,
+            "p99": round(percentile(writes, 99) * 1000, 2) if writes else None,
+        },
+        "read_ms_p95": round(percentile(reads, 95) * 1000, 2) if reads else None,
+        "lock_wait_ms": {
+            "mean": round(statistics.mean(waits) * 1000, 2) if waits else None,
+            "p95": round(percentile(waits, 95) * 1000, 2) if waits else None,
+            "max": round(max(waits) * 1000, 2) if waits else None,
+        },
+        "errors": len(errors),
+        "error_samples": sorted(set(errors))[:3],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, default=4, help="Writer processes.")
+    parser.add_argument("--sessions", type=int, default=8, help="Sessions written at the same time per process.")
+    parser.add_argument("--events", type=int, default=50, help="Events appended per session.")
+    parser.add_argument("--read-every", type=int, default=5, help="Events between session reads, 0 for none.")
+    parser.add_argument("--payload-bytes", type=int, default=2000, help="Text per event.")
+    parser.add_argument("--postgres-url", default=None, help="Also run against this PostgreSQL database.")
+    parser.add_argument("--output", default=None, help="Optional JSON report path.")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for config in ("adk-default", "tuned"):
+            results[config] = measure(config, f"sqlite:///{os.path.join(tmp, config)}.db", args)
+    if args.postgres_url:
+        results["postgres"] = measure("postgres", args.postgres_url, args)
+
+    print(f"{'config':<12} {'writes':>7} {'writes/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'wait ms':>8} {'wait p95':>9} {'read p95':>9} {'errors':>7}")
+    for config, result in results.items():
+        print(
+            f"{config:<12} {result['writes']:>7} {result['writes_per_s']:>9.1f} {result['write_ms']['p50'] or 0:>8.2f} "
+            f"{result['write_ms']['p95'] or 0:>8.2f} {result['write_ms']['p99'] or 0:>8.2f} "
+            f"{result['lock_wait_ms']['mean'] or 0:>8.2f} {result['lock_wait_ms']['p95'] or 0:>9.2f} "
+            f"{result['read_ms_p95'] or 0:>9.2f} {result['errors']:>7}"
+        )
+        for sample in result["error_samples"]:
+            print(f"{'':<12} {sample}")
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
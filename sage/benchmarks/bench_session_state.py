@@ -0,0 +1,186 @@
+"""
+Measures session load time with large state values inline or in the blob store.
+
+For every call length in --minutes, sage_workflow analyzes a synthetic recording
+against the local mock server (benchmarks/mock_server.py, started on a free port
+unless SAGE_MOCK_URL already points at one), and the events it produced are
+captured. --turns chat turns are appended after them. The same events are then
+written to a fresh SQLite database twice, once with the values inline and once
+through manager_agent.blob_store. The report gives:
+
+- the mean and p95 time of get_session
+- the time of get_session followed by loading the transcript, as an agent does
+- the time spent appending the events
+- the size of the database and of the blob directory
+
+Run from the sage/ directory:
+
+    python -m benchmarks.bench_session_state --minutes 10,60
+
+The workflow and pipeline modes are the ones set by SAGE_WORKFLOW_MODE and
+SAGE_PIPELINE_MODE. The transcript cache, the analysis memo and the LLM response
+cache are disabled.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+from google.adk.events import Event
+from google.adk.sessions import DatabaseSessionService, InMemorySessionService
+from google.genai import types
+
+from benchmarks.bench_pipeline import write_synthetic_call
+from benchmarks.mock_server import LINES, make_server
+from stats import percentile
+
+MODES = ("inline", "blobs")
+SPEAKERS = 2
+
+
+async def capture_analysis(audio_filepath: str) -> tuple:
+    """
+    Analyzes a recording with sage_workflow and returns its initial state and events.
+
+    The events are captured from an in-memory session, so they hold the values
+    exactly as the workflow wrote them.
+    """
+    from google.adk.runners import Runner
+    from manager_agent.agent import sage_workflow
+    from session_defaults import new_session_state
+
+    state = new_session_state(audio_filepath=audio_filepath)
+    session_service = InMemorySessionService()
+    runner = Runner(agent=sage_workflow, app_name="bench", session_service=session_service)
+    session = await session_service.create_session(app_name="bench", user_id="bench", state=dict(state))
+    content = types.Content(role="user", parts=[types.Part(text="Analyze the audio file")])
+    async for _ in runner.run_async(user_id="bench", session_id=session.id, new_message=content):
+        pass
+    session = await session_service.get_session(app_name="bench", user_id="bench", session_id=session.id)
+    return state, session.events
+
+
+def chat_events(turns: int) -> list:
+    """Returns a question and an answer event per chat turn; they carry no state."""
+    events = []
+    for index in range(turns):
+        for role, author in (("user", "user"), ("model", "manager_agent")):
+            events.append(Event(
+                author=author,
+                invocation_id=f"chat-{index}",
+                content=types.Content(role=role, parts=[types.Part(text=LINES[index % len(LINES)])]),
+            ))
+    return events
+
+
+async def measure(mode: str, label: str, initial_state: dict, events: list, reads: int, tmp: str) -> dict:
+    from manager_agent.blob_store import offload_session_state, state_value
+
+    db_path = os.path.join(tmp, f"{mode}_{label}.db")
+    service = DatabaseSessionService(db_url=f"sqlite+aiosqlite:///{db_path}")
+    if mode == "blobs":
+        offload_session_state(service)
+
+    # Deep copies, since the blob store replaces values in the state deltas in place.
+    session = await service.create_session(
+        app_name="bench", user_id="bench", state=json.loads(json.dumps(initial_state))
+    )
+    started = time.perf_counter()
+    for event in events:
+        await service.append_event(session, event.model_copy(deep=True))
+    append_s = time.perf_counter() - started
+
+    loads, loads_with_transcript = [], []
+    for _ in range(reads):
+        started = time.perf_counter()
+        session = await service.get_session(app_name="bench", user_id="bench", session_id=session.id)
+        loads.append(time.perf_counter() - started)
+        transcript = state_value(session.state, "transcript")
+        loads_with_transcript.append(time.perf_counter() - started)
+    assert transcript, "the captured workflow run wrote no transcript"
+
+    return {
+        "get_session_ms": {
+            "mean": round(statistics.mean(loads) * 1000, 2),
+            "p95": round(percentile(loads, 95) * 1000, 2),
+        },
+        "get_session_and_transcript_ms": {
+            "mean": round(statistics.mean(loads_with_transcript) * 1000, 2),
+            "p95": round(percentile(loads_with_transcript, 95) * 1000, 2),
+        },
+        "append_events_ms": round(append_s * 1000, 1),
+        "events": len(session.events),
+        "segments": len(transcript),
+        "db_bytes": os.path.getsize(db_path),
+    }
+
+
+def directory_bytes(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+async def run(lengths: list, turns: int, reads: int) -> dict:
+    from manager_agent.blob_store import blob_store
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for minutes in lengths:
+            label = f"{minutes:g}"
+            audio_filepath = os.path.join(tmp, f"call_{label}min.wav")
+            write_synthetic_call(audio_filepath, minutes, SPEAKERS, seed=0)
+            initial_state, events = await capture_analysis(audio_filepath)
+            events = list(events) + chat_events(turns)
+
+            blob_store.blob_dir = os.path.join(tmp, f"blobs_{label}")
+            results[label] = {}
+            for mode in MODES:
+                result = await measure(mode, label, initial_state, events, reads, tmp)
+                if mode == "blobs":
+                    result["blob_bytes"] = directory_bytes(blob_store.blob_dir)
+                results[label][mode] = result
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--minutes", default="1,10,60", help="Comma separated call lengths in minutes.")
+    parser.add_argument("--turns", type=int, default=10, help="Chat turns after the analysis.")
+    parser.add_argument("--reads", type=int, default=50, help="get_session calls timed per mode.")
+    parser.add_argument("--output", default=None, help="Optional JSON report path.")
+    args = parser.parse_args()
+
+    lengths = [float(m) for m in args.minutes.split(",")]
+    server = None
+    if not os.getenv("SAGE_MOCK_URL"):
+        server = make_server("127.0.0.1", 0, {})
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        os.environ["SAGE_MOCK_URL"] = f"http://127.0.0.1:{server.server_address[1]}"
+    # Read when manager_agent is imported, which only happens from here on.
+    os.environ.update(SAGE_TRANSCRIPT_CACHE="0", SAGE_ANALYSIS_MEMO="0", SAGE_LLM_CACHE="0")
+    try:
+        results = asyncio.run(run(lengths, args.turns, args.reads))
+    finally:
+        if server:
+            server.shutdown()
+
+    print(f"{'minutes':>8} {'mode':<7} {'load ms':>9} {'p95 ms':>8} {'+transcript':>12} {'append ms':>10} "
+          f"{'db KB':>9} {'blobs KB':>9}")
+    for minutes, modes in results.items():
+        for mode, result in modes.items():
+            print(
+                f"{minutes:>8} {mode:<7} {result['get_session_ms']['mean']:>9.2f} {result['get_session_ms']['p95']:>8.2f} "
+                f"{result['get_session_and_transcript_ms']['mean']:>12.2f} {result['append_events_ms']:>10.1f} "
+                f"{result['db_bytes'] / 1024:>9.1f} {result.get('blob_bytes', 0) / 1024:>9.1f}"
+            )
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+Measures the session I/O of a chat turn, before and after utils.SessionTurn.
+
+A session holding the analysis of a call of --minutes minutes is created in a
+fresh SQLite database, then --turns chat turns are run against it twice: once
+with the flow call_agent_async used to have (a state dump, a load to append the
+query, the run, a load to append the response and another state dump), and once
+with SessionTurn. The agent answers without calling a model, so the turn time
+is spent in the runner and the session service. The report gives, per turn:
+
+- the get_session and append_event calls
+- the time spent in them
+- the time of the whole turn
+
+Run from the sage/ directory:
+
+    python -m benchmarks.bench_session_turns --minutes 10,60
+"""
+import argparse
+import asyncio
+import functools
+import json
+import os
+import statistics
+import tempfile
+import time
+from datetime import datetime
+
+from google.adk.agents import BaseAgent
+from google.adk.events import Event, EventActions
+from google.adk.runners import Runner
+from google.adk.sessions import DatabaseSessionService
+from google.genai import types
+
+from benchmarks.bench_session_state import analysis_events, synthetic_analysis
+from benchmarks.mock_server import LINES
+from manager_agent.blob_store import blob_store, offload_session_state
+from session_defaults import new_session_state
+from utils import SessionTurn
+
+FLOWS = ("legacy", "turn")
+
+
+class EchoAgent(BaseAgent):
+    """Answers every query with a fixed line, without calling a model."""
+
+    async def _run_async_impl(self, ctx):
+        yield Event(
+            author=self.name,
+            invocation_id=ctx.invocation_id,
+            content=types.Content(role="model", parts=[types.Part(text=LINES[1])]),
+        )
+
+
+class CountingService:
+    """Counts and times the get_session and append_event calls of a session service."""
+
+    def __init__(self, service):
+        self.calls = {"get_session": 0, "append_event": 0}
+        self.seconds = 0.0
+        for name in self.calls:
+            setattr(service, name, self._wrap(name, getattr(service, name)))
+
+    def _wrap(self, name, method):
+        @functools.wraps(method)
+        async def counted(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await method(*args, **kwargs)
+            finally:
+                self.seconds += time.perf_counter() - started
+                self.calls[name] += 1
+
+        return counted
+
+    def reset(self):
+        self.calls = dict.fromkeys(self.calls, 0)
+        self.seconds = 0.0
+
+
+async def legacy_turn(runner, session_id, query):
+    """The turn as call_agent_async ran it before SessionTurn, without the printing."""
+    service = runner.session_service
+    session = await service.get_session(app_name=runner.app_name, user_id="bench", session_id=session_id)
+    session = await service.get_session(app_name=runner.app_name, user_id="bench", session_id=session_id)
+    session.state["interaction_history"].append(
+        {"action": "user_query", "query": query, "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+    )
+    content = types.Content(role="user", parts=[types.Part(text=query)])
+    await service.append_event(session=session, event=Event(author="user", content=content))
+
+    final_response_text, agent_name = None, None
+    async for event in runner.run_async(user_id="bench", session_id=session_id, new_message=content):
+        agent_name = event.author
+        if event.is_final_response():
+            final_response_text = event.content.parts[0].text
+
+    session = await service.get_session(app_name=runner.app_name, user_id="bench", session_id=session_id)
+    session.state["interaction_history"].append(
+        {
+            "action": "agent_response",
+            "agent": agent_name,
+            "response": final_response_text,
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        }
+    )
+    response = types.Content(role="model", parts=[types.Part(text=final_response_text)])
+    await service.append_event(session=session, event=Event(author=agent_name, content=response))
+    await service.get_session(app_name=runner.app_name, user_id="bench", session_id=session_id)
+
+
+async def session_turn(runner, session_id, query):
+    turn = SessionTurn(runner, "bench", session_id, show_state="off")
+    final_response_text, agent_name = None, None
+    async for event in turn.run(query):
+        agent_name = event.author
+        if event.is_final_response():
+            final_response_text = event.content.parts[0].text
+    await turn.finish(agent_name, final_response_text)
+
+
+async def measure(flow: str, minutes: float, turns: int, blobs: bool, tmp: str) -> dict:
+    db_path = os.path.join(tmp, f"{flow}_{minutes:g}.db")
+    service = DatabaseSessionService(db_url=f"sqlite+aiosqlite:///{db_path}")
+    if blobs:
+        offload_session_state(service)
+    counter = CountingService(service)
+    runner = Runner(app_name="bench", agent=EchoAgent(name="manager_agent"), session_service=service)
+
+    session = await service.create_session(app_name="bench", user_id="bench", state=new_session_state())
+    for index, delta in enumerate(analysis_events(synthetic_analysis(minutes), turns=0)):
+        event = Event(author="manager_agent", invocation_id=f"bench-{index}", actions=EventActions(state_delta=delta))
+        await service.append_event(session, event)
+
+    run_turn = legacy_turn if flow == "legacy" else session_turn
+    gets, appends, io_ms, turn_ms = [], [], [], []
+    for index in range(turns):
+        counter.reset()
+        started = time.perf_counter()
+        await run_turn(runner, session.id, f"Question {index}: {LINES[index % len(LINES)]}")
+        turn_ms.append((time.perf_counter() - started) * 1000)
+        gets.append(counter.calls["get_session"])
+        appends.append(counter.calls["append_event"])
+        io_ms.append(counter.seconds * 1000)
+
+    session = await service.get_session(app_name="bench", user_id="bench", session_id=session.id)
+    return {
+        "get_session": statistics.mean(gets),
+        "append_event": statistics.mean(appends),
+        "session_io_ms": round(statistics.mean(io_ms), 2),
+        "turn_ms": round(statistics.mean(turn_ms), 2),
+        "history_entries": len(session.state.get("interaction_history", [])),
+        "events": len(session.events),
+    }
+
+
+async def run(lengths: list, turns: int, blobs: bool) -> dict:
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        blob_store.blob_dir = os.path.join(tmp, "blobs")
+        for minutes in lengths:
+            results[f"{minutes:g}"] = {flow: await measure(flow, minutes, turns, blobs, tmp) for flow in FLOWS}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--minutes", default="1,10,60", help="Comma separated call lengths in minutes.")
+    parser.add_argument("--turns", type=int, default=20, help="Chat turns run per flow.")
+    parser.add_argument("--blobs", action="store_true", help="Keep large state values in the blob store.")
+    parser.add_argument("--output", default=None, help="Optional JSON report path.")
+    args = parser.parse_args()
+
+    lengths = [float(m) for m in args.minutes.split(",")]
+    results = asyncio.run(run(lengths, args.turns, args.blobs))
+
+    print(f"{'minutes':>8} {'flow':<7} {'gets':>5} {'appends':>8} {'session ms':>11} {'turn ms':>9} {'history':>8}")
+    for minutes, flows in results.items():
+        for flow, result in flows.items():
+            print(
+                f"{minutes:>8} {flow:<7} {result['get_session']:>5.1f} {result['append_event']:>8.1f} "
+                f"{result['session_io_ms']:>11.2f} {result['turn_ms']:>9.2f} {result['history_entries']:>8}"
+            )
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
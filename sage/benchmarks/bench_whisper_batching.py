@@ -0,0 +1,130 @@
+"""
+Compares per-segment and batched whisper decoding on a multi-turn recording.
+
+Diarization is skipped: speaker turns are generated synthetically so that only the
+decoding cost is measured. Run from the sage/ directory:
+
+    python -m benchmarks.bench_whisper_batching --turns 150 --batch-sizes 4,8,16
+    python -m benchmarks.bench_whisper_batching --audio call.wav --turns 150
+"""
+import argparse
+import json
+import random
+import time
+
+import numpy as np
+import torch
+import whisper
+
+from manager_agent.sub_agents.audio_to_transcript_agent.local_backend import (
+    transcribe_segments,
+    transcribe_segments_batched,
+)
+
+SAMPLE_RATE = whisper.audio.SAMPLE_RATE
+
+
+def synthetic_call(turns: int, seed: int = 0):
+    """
+    Builds a synthetic call with alternating speaker turns of 1-12 seconds.
+
+    Each speaker is a voiced tone with its own pitch and a syllable-rate amplitude
+    envelope, separated by short pauses.
+
+    Args:
+        turns (int): Number of speaker turns.
+        seed (int): Random seed, so runs are comparable.
+
+    Returns:
+        tuple: (waveform, segments) where segments are dictionaries with 'start', 'end' and 'label'.
+    """
+    rng = random.Random(seed)
+    pitches = {"SPEAKER_00": 120.0, "SPEAKER_01": 210.0}
+    chunks, segments, cursor = [], [], 0.0
+    for turn in range(turns):
+        label = f"SPEAKER_0{turn % 2}"
+        duration = rng.uniform(1.0, 12.0)
+        t = np.arange(int(duration * SAMPLE_RATE)) / SAMPLE_RATE
+        envelope = 0.5 * (1 + np.sin(2 * np.pi * 4.0 * t))
+        tone = np.sin(2 * np.pi * pitches[label] * t) + 0.3 * np.sin(4 * np.pi * pitches[label] * t)
+        chunks.append((0.1 * envelope * tone).astype(np.float32))
+        segments.append({"start": cursor, "end": cursor + duration, "label": label})
+        cursor += duration
+
+        pause = rng.uniform(0.2, 0.8)
+        chunks.append(np.zeros(int(pause * SAMPLE_RATE), dtype=np.float32))
+        cursor += pause
+    return np.concatenate(chunks), segments
+
+
+def turns_over_audio(audio_path: str, turns: int, seed: int = 0):
+    """Splits a real recording into synthetic alternating speaker turns."""
+    rng = random.Random(seed)
+    waveform = whisper.load_audio(audio_path)
+    total = len(waveform) / SAMPLE_RATE
+    cuts = sorted(rng.uniform(0, total) for _ in range(turns - 1))
+    bounds = [0.0] + cuts + [total]
+    segments = [
+        {"start": bounds[i], "end": bounds[i + 1], "label": f"SPEAKER_0{i % 2}"}
+        for i in range(len(bounds) - 1)
+        if bounds[i + 1] - bounds[i] > 0.2
+    ]
+    return waveform, segments
+
+
+def timed(func, *args, **kwargs):
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--audio", default=None, help="Optional real recording to split into turns.")
+    parser.add_argument("--turns", type=int, default=150)
+    parser.add_argument("--batch-sizes", default="4,8,16")
+    parser.add_argument("--model", default="base")
+    parser.add_argument("--language", default="en")
+    parser.add_argument("--output", default=None, help="Optional JSON file for the results.")
+    args = parser.parse_args()
+
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    model = whisper.load_model(args.model, device=device)
+    if args.audio:
+        waveform, segments = turns_over_audio(args.audio, args.turns)
+    else:
+        waveform, segments = synthetic_call(args.turns)
+    print(f"{len(segments)} turns, {len(waveform) / SAMPLE_RATE / 60:.1f} minutes of audio, device {device}")
+
+    # Warm up the model so the first measured run does not pay one-time costs.
+    transcribe_segments_batched(model, waveform, segments[:2], batch_size=2, language=args.language)
+
+    results = {"turns": len(segments), "audio_seconds": round(len(waveform) / SAMPLE_RATE, 1),
+               "model": args.model, "device": device, "runs": []}
+
+    _, elapsed = timed(transcribe_segments, model, waveform, segments, language=args.language)
+    results["runs"].append({"mode": "per-segment", "batch_size": 1, "wall_s": round(elapsed, 2)})
+    print(f"per-segment: {elapsed:.2f}s")
+
+    for batch_size in (int(b) for b in args.batch_sizes.split(",")):
+        _, elapsed = timed(
+            transcribe_segments_batched, model, waveform, segments,
+            batch_size=batch_size, language=args.language,
+        )
+        baseline = results["runs"][0]["wall_s"]
+        results["runs"].append({
+            "mode": "batched",
+            "batch_size": batch_size,
+            "wall_s": round(elapsed, 2),
+            "speedup": round(baseline / elapsed, 2) if elapsed else None,
+        })
+        print(f"batched (batch_size={batch_size}): {elapsed:.2f}s, {baseline / elapsed:.2f}x")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Compares the LLM-driven workflow with the deterministic tool-only workflow.
+
+Every recording is analyzed once per SAGE_WORKFLOW_MODE. The script reports the
+wall time of each analysis and its LLM calls, split into calls made by agents
+(tool selection hops and the intent agent) and calls made inside the tools. Run
+from the sage/ directory:
+
+    python -m benchmarks.bench_workflow_modes recordings/*.wav
+
+The workflow is built when manager_agent is imported, so each mode runs in its
+own process. The transcript cache, the analysis memo and the LLM response cache
+are disabled unless --cache is given, so both modes analyze the recordings from
+scratch.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+
+from google.genai import types
+
+MODES = ("agents", "tools")
+
+
+def install_call_counter(counts: Counter) -> None:
+    """Counts every LLM request of the process in `counts`, under "agent" or "tool"."""
+    import google.adk.models  # noqa: F401  (registers the built-in model classes)
+    import google.generativeai as genai
+    from google.adk.models.base_llm import BaseLlm
+    from manager_agent.sub_agents.sentiment_agent import agent as sentiment
+
+    def count_agent_calls(method):
+        async def wrapper(self, *args, **kwargs):
+            counts["agent"] += 1
+            async for response in method(self, *args, **kwargs):
+                yield response
+        return wrapper
+
+    pending = [BaseLlm]
+    while pending:
+        cls = pending.pop()
+        pending.extend(cls.__subclasses__())
+        if "generate_content_async" in cls.__dict__:
+            cls.generate_content_async = count_agent_calls(cls.__dict__["generate_content_async"])
+
+    def count_tool_calls(method):
+        if asyncio.iscoroutinefunction(method):
+            async def wrapper(*args, **kwargs):
+                counts["tool"] += 1
+                return await method(*args, **kwargs)
+        else:
+            def wrapper(*args, **kwargs):
+                counts["tool"] += 1
+                return method(*args, **kwargs)
+        return wrapper
+
+    genai.GenerativeModel.generate_content = count_tool_calls(genai.GenerativeModel.generate_content)
+    genai.GenerativeModel.generate_content_async = count_tool_calls(genai.GenerativeModel.generate_content_async)
+    sentiment.acompletion = count_tool_calls(sentiment.acompletion)
+
+
+async def run_mode(paths: list) -> list:
+    """Analyzes every recording with the workflow of this process, one at a time."""
+    from google.adk.runners import Runner
+    from google.adk.sessions import InMemorySessionService
+    from session_defaults import new_session_state
+    from manager_agent.agent import sage_workflow
+
+    counts = Counter()
+    install_call_counter(counts)
+    session_service = InMemorySessionService()
+    runner = Runner(agent=sage_workflow, app_name="bench", session_service=session_service)
+
+    results = []
+    for path in paths:
+        counts.clear()
+        session = await session_service.create_session(
+            app_name="bench", user_id="bench", state=new_session_state(audio_filepath=path)
+        )
+        content = types.Content(role="user", parts=[types.Part(text="Analyze the audio file")])
+        started = time.perf_counter()
+        async for _ in runner.run_async(user_id="bench", session_id=session.id, new_message=content):
+            pass
+        elapsed = time.perf_counter() - started
+        session = await session_service.get_session(app_name="bench", user_id="bench", session_id=session.id)
+        results.append({
+            "file": path,
+            "wall_s": round(elapsed, 2),
+            "agent_llm_calls": counts["agent"],
+            "tool_llm_calls": counts["tool"],
+            "llm_calls": counts["agent"] + counts["tool"],
+            "report": bool(session.state.get("analysis_report")),
+        })
+        print(f"[{os.getenv('SAGE_WORKFLOW_MODE', 'agents')}] {path}: {results[-1]}", file=sys.stderr)
+    return results
+
+
+def summarize(results: list) -> dict:
+    if not results:
+        return {}
+    return {
+        "calls": len(results),
+        "reports": sum(r["report"] for r in results),
+        "wall_s_mean": round(statistics.mean(r["wall_s"] for r in results), 2),
+        "llm_calls_mean": round(statistics.mean(r["llm_calls"] for r in results), 2),
+        "agent_llm_calls_mean": round(statistics.mean(r["agent_llm_calls"] for r in results), 2),
+        "tool_llm_calls_mean": round(statistics.mean(r["tool_llm_calls"] for r in results), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("recordings", nargs="+", help="Audio files to analyze.")
+    parser.add_argument("--modes", default=",".join(MODES), help="Comma separated workflow modes.")
+    parser.add_argument("--cache", action="store_true", help="Keep the transcript, analysis and LLM response caches enabled.")
+    parser.add_argument("--output", default=None, help="Optional JSON file for the report.")
+    parser.add_argument("--worker", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        # Child process: the workflow mode comes from the environment.
+        with open(args.worker, "w", encoding="utf-8") as f:
+            json.dump(asyncio.run(run_mode(args.recordings)), f)
+        return
+
+    report = {"modes": {}}
+    for mode in args.modes.split(","):
+        env = dict(os.environ, SAGE_WORKFLOW_MODE=mode)
+        if not args.cache:
+            env["SAGE_TRANSCRIPT_CACHE"] = "0"
+            env["SAGE_ANALYSIS_MEMO"] = "0"
+            env["SAGE_LLM_CACHE"] = "0"
+        with tempfile.TemporaryDirectory() as tmp:
+            worker_output = os.path.join(tmp, f"{mode}.json")
+            subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_workflow_modes", "--worker", worker_output, *args.recordings],
+                env=env,
+                check=True,
+            )
+            with open(worker_output, "r", encoding="utf-8") as f:
+                results = json.load(f)
+        report["modes"][mode] = {"summary": summarize(results), "files": results}
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    print(json.dumps({mode: r["summary"] for mode, r in report["modes"].items()}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
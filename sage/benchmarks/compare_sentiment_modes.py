@@ -0,0 +1,102 @@
+"""
+Validates the packed sentiment mode against the per-minute mode.
+
+Every transcript is scored in both modes. The script reports how often the packed
+labels agree with the per-minute labels, together with the number of requests and
+the wall time of each mode. Run from the sage/ directory:
+
+    python -m benchmarks.compare_sentiment_modes transcripts/*.json
+
+Each input file holds either a list of [start, end, speaker, text] segments or a
+session state dictionary with a 'transcript' key.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from manager_agent.llm_cache import response_cache
+from manager_agent.sub_agents.sentiment_agent import agent as sentiment
+
+MODES = ("per_minute", "packed")
+
+
+def load_transcript(path: str) -> list:
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return data["transcript"] if isinstance(data, dict) else data
+
+
+async def run_mode(transcript: list, mode: str) -> dict:
+    """Scores one transcript in one mode, counting the completion requests it sends."""
+    calls = 0
+    original = sentiment.acompletion
+
+    async def counting_acompletion(*args, **kwargs):
+        nonlocal calls
+        calls += 1
+        return await original(*args, **kwargs)
+
+    sentiment.acompletion = counting_acompletion
+    try:
+        started = time.perf_counter()
+        result = await sentiment.analyze_sentiment(transcript, mode=mode)
+        elapsed = time.perf_counter() - started
+    finally:
+        sentiment.acompletion = original
+    return {"result": result, "requests": calls, "wall_s": round(elapsed, 2)}
+
+
+async def compare(paths: list) -> dict:
+    report = {"files": [], "minutes": 0, "agreeing_minutes": 0}
+    totals = {mode: {"requests": 0, "wall_s": 0.0} for mode in MODES}
+
+    for path in paths:
+        transcript = load_transcript(path)
+        runs = {mode: await run_mode(transcript, mode) for mode in MODES}
+
+        reference = [sentiment.normalize_label(m["label"]) or m["label"]
+                     for m in runs["per_minute"]["result"]["timeline"]]
+        packed = [m["label"] for m in runs["packed"]["result"]["timeline"]]
+        agreeing = sum(1 for a, b in zip(reference, packed) if a == b)
+
+        report["minutes"] += len(reference)
+        report["agreeing_minutes"] += agreeing
+        for mode in MODES:
+            totals[mode]["requests"] += runs[mode]["requests"]
+            totals[mode]["wall_s"] += runs[mode]["wall_s"]
+
+        report["files"].append({
+            "file": path,
+            "minutes": len(reference),
+            "agreement": round(agreeing / len(reference), 3) if reference else None,
+            "overall": {mode: runs[mode]["result"]["sentiment_overall"] for mode in MODES},
+            **{mode: {"requests": runs[mode]["requests"], "wall_s": runs[mode]["wall_s"]} for mode in MODES},
+        })
+        print(f"{path}: agreement {agreeing}/{len(reference)}, "
+              f"requests {runs['per_minute']['requests']} -> {runs['packed']['requests']}")
+
+    report["agreement"] = (
+        round(report["agreeing_minutes"] / report["minutes"], 3) if report["minutes"] else None
+    )
+    report["totals"] = {mode: {k: round(v, 2) for k, v in t.items()} for mode, t in totals.items()}
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("transcripts", nargs="+", help="Transcript JSON files.")
+    parser.add_argument("--output", default=None, help="Optional JSON file for the report.")
+    args = parser.parse_args()
+
+    # Every request has to reach the model for the counts and timings to mean anything.
+    response_cache.enabled = False
+    report = asyncio.run(compare(args.transcripts))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    print(json.dumps({k: v for k, v in report.items() if k != "files"}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,500 @@
+"""
+Local stand-in for the OpenAI, Gemini and Pinecone APIs, for offline load tests.
+
+The server answers the requests SAGE and rag_agent.py send, with made-up but
+well-formed responses: OpenAI chat completions, embeddings and diarized
+transcriptions, Gemini generateContent, and the Pinecone index, upsert and
+query calls. Each kind of request waits for a latency drawn from a lognormal
+distribution, and a share of the requests fail with a 429 or a 500. Run from
+the sage/ directory:
+
+    python -m benchmarks.mock_server --port 8765 --latency "chat=0.8:2.5,transcription=4:9" --rate-limit-rate 0.02
+
+then point every client at it before starting the app, the batch runner or a
+benchmark:
+
+    export SAGE_MOCK_URL=http://127.0.0.1:8765
+
+Responses are derived from a hash of the request, so a rerun gets the same
+answers. GET /stats returns the request, error, latency and token counts per kind.
+"""
+import argparse
+import email.parser
+import hashlib
+import io
+import json
+import math
+import random
+import re
+import sys
+import threading
+import time
+import wave
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# (median, p95) latency in seconds per kind of request.
+DEFAULT_LATENCY = {
+    "chat": (0.8, 2.5),
+    "gemini": (0.6, 2.0),
+    "embeddings": (0.1, 0.3),
+    "transcription": (4.0, 9.0),
+    "pinecone": (0.05, 0.15),
+}
+
+EMOTIONS = ["Anger", "Frustration", "Calm", "Apology", "Satisfaction"]
+LINES = [
+    "Hi, I'm calling about a charge on my card that I don't recognize.",
+    "I can help with that, can you confirm the last four digits of the card?",
+    "Sure, it ends in 4821. The charge was yesterday, for about two hundred dollars.",
+    "I see it here. I'll open a dispute and block the card for now.",
+    "Thank you, how long does the dispute usually take?",
+    "It usually takes five to seven business days, and you'll get a temporary credit.",
+]
+# Sample value per speaker in speaker-coded recordings, see speaker_codes().
+SPEAKER_CODE_STEP = 1000
+GEMMA_TOOLS = re.compile(r"You have access to the following functions:\n(\[.*?\])\nWhen you call a function", re.DOTALL)
+REPORT = (
+    "**Intent:** {intent}\n\n**Root Cause:** An unrecognized card transaction.\n\n"
+    "**Sentiment Analysis:** The customer starts frustrated and ends satisfied.\n\n"
+    "**Call Transcript:** The customer reports an unknown charge, the agent opens a dispute "
+    "and blocks the card, and explains the timeline for the temporary credit."
+)
+
+
+def parse_latency(spec: str) -> dict:
+    """
+    Parses a "kind=median:p95,kind=median:p95" string into a dictionary.
+
+    Args:
+        spec (str): The comma separated latencies in seconds.
+
+    Returns:
+        dict: A mapping of request kind to (median, p95) seconds.
+    """
+    latency = {}
+    for item in (spec or "").split(","):
+        if not item.strip():
+            continue
+        name, _, value = item.partition("=")
+        median, _, p95 = value.partition(":")
+        latency[name.strip()] = (float(median), float(p95 or median))
+    return latency
+
+
+def digest(value) -> int:
+    """Returns a stable integer hash of a JSON-serializable value."""
+    payload = json.dumps(value, sort_keys=True, default=str).encode("utf-8")
+    return int(hashlib.sha256(payload).hexdigest()[:12], 16)
+
+
+def reply_text(system: str, prompt: str) -> str:
+    """
+    Makes up a response in the format the prompt asks for.
+
+    Args:
+        system (str): The system instruction, if any.
+        prompt (str): The rest of the prompt.
+
+    Returns:
+        str: The response text.
+    """
+    text = f"{system}\n{prompt}"
+    seed = digest(text)
+    if "[minute" in prompt and "JSON array" in text:
+        minutes = re.findall(r"\[minute (\d+)\]", prompt)
+        return json.dumps([
+            {"minute": int(m), "label": EMOTIONS[(seed + i) % len(EMOTIONS)], "score": round(0.5 + (seed + i) % 50 / 100, 2)}
+            for i, m in enumerate(minutes)
+        ])
+    if '{"label"' in text:
+        return json.dumps({"label": EMOTIONS[seed % len(EMOTIONS)], "score": round(0.5 + seed % 50 / 100, 2)})
+    if "Generate a comprehensive summary report" in prompt:
+        intent = re.findall(r"\*\*Intent:\*\* (.*)", prompt)
+        return REPORT.format(intent=intent[-1].strip() if intent else "GeneralInquiry")
+    if "'root_cause'" in text:
+        return json.dumps({"root_cause": "The customer does not recognize a recent card transaction."})
+    categories = re.findall(r"^\s*- (\w+)\s*$", text, flags=re.MULTILINE)
+    if categories and "categories" in text:
+        return categories[seed % len(categories)]
+    if prompt.startswith(("Summarize this part", "Merge these")):
+        return "The customer reported a problem and the agent resolved it."
+    return "This is a mock response. " + LINES[seed % len(LINES)]
+
+
+def pick_tool(tools: list):
+    """
+    Chooses the tool an agent should call, as (name, arguments), or None to answer with text.
+
+    Agent tools are called first, then an agent transfer to the first allowed agent.
+    """
+    for name, _ in tools:
+        if name not in ("transfer_to_agent", "set_filepath"):
+            return name, {}
+    for name, parameters in tools:
+        if name == "transfer_to_agent":
+            targets = ((parameters or {}).get("properties", {}).get("agent_name", {}).get("enum")) or []
+            if targets:
+                return name, {"agent_name": targets[0]}
+    return None
+
+
+def speaker_codes(audio: bytes) -> list:
+    """
+    Reads the speaker code of every second of a speaker-coded WAV recording.
+
+    Synthetic benchmark recordings hold the value SPEAKER_CODE_STEP * speaker
+    while a speaker talks, so the mock can diarize them. Seconds of any other
+    audio get code 0.
+
+    Returns:
+        list: One speaker code per second, or None if the audio is not WAV.
+    """
+    try:
+        with wave.open(io.BytesIO(audio), "rb") as wav:
+            rate, width, channels = wav.getframerate(), wav.getsampwidth(), wav.getnchannels()
+            frames = wav.readframes(wav.getnframes())
+    except (wave.Error, EOFError):
+        return None
+    frame_size = width * channels
+    seconds = len(frames) // frame_size / rate
+    codes = []
+    for second in range(math.ceil(seconds)):
+        offset = min(int((second + 0.5) * rate), len(frames) // frame_size - 1) * frame_size
+        value = int.from_bytes(frames[offset:offset + width], "little", signed=True) if width == 2 else 0
+        codes.append(round(value / SPEAKER_CODE_STEP) if value > 0 else 0)
+    return codes or [0]
+
+
+def mock_transcript(audio: bytes, seed: int) -> dict:
+    """
+    Builds a diarized transcription covering the duration of a WAV recording (60 s if it is not WAV).
+
+    Speaker-coded recordings get one segment per turn, split every 8 seconds, and
+    labels in order of appearance like a real diarizer. Other audio gets two
+    speakers alternating every 5 seconds.
+    """
+    codes = speaker_codes(audio) or [0] * 60
+    if not any(codes):
+        codes = [1 + second // 5 % 2 for second in range(len(codes))]
+    turns, start = [], 0
+    for second in range(1, len(codes) + 1):
+        if second == len(codes) or codes[second] != codes[start] or second - start >= 8:
+            turns.append((start, second, codes[start]))
+            start = second
+    labels, segments = {}, []
+    for index, (start, end, code) in enumerate(turns):
+        speaker = labels.setdefault(code, chr(ord("A") + len(labels)))
+        segments.append({
+            "id": f"seg_{index}", "type": "transcript.text.segment",
+            "start": float(start), "end": float(end),
+            "speaker": speaker, "text": LINES[(seed + index) % len(LINES)],
+        })
+    duration = float(len(codes))
+    return {
+        "task": "transcribe",
+        "duration": duration,
+        "text": " ".join(s["text"] for s in segments),
+        "segments": segments,
+        "usage": {"type": "duration", "seconds": math.ceil(duration)},
+    }
+
+
+def embedding(text: str, dimensions: int) -> list:
+    """Returns a deterministic unit vector for a text."""
+    rng = random.Random(digest(text))
+    values = [rng.gauss(0, 1) for _ in range(dimensions)]
+    norm = math.sqrt(sum(v * v for v in values)) or 1.0
+    return [v / norm for v in values]
+
+
+class MockState:
+    """Settings, Pinecone vectors and request statistics shared by the handler threads."""
+
+    def __init__(self, latency: dict, error_rate: float, rate_limit_rate: float, seed: int):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.vectors = defaultdict(dict)
+        self.stats = defaultdict(lambda: {
+            "requests": 0, "rate_limited": 0, "errors": 0, "latency_s": 0.0, "prompt_tokens": 0, "completion_tokens": 0,
+        })
+
+    def delay(self, kind: str) -> float:
+        """Draws a latency from the lognormal distribution of a kind of request."""
+        median, p95 = self.latency.get(kind, (0.0, 0.0))
+        if median <= 0:
+            return 0.0
+        sigma = math.log(max(p95, median) / median) / 1.645
+        with self.lock:
+            return self.random.lognormvariate(math.log(median), sigma)
+
+    def outcome(self, kind: str, delay: float):
+        """Records a request and returns the HTTP status of an injected failure, or None."""
+        with self.lock:
+            draw = self.random.random()
+            stats = self.stats[kind]
+            stats["requests"] += 1
+            stats["latency_s"] += delay
+            if draw < self.rate_limit_rate:
+                stats["rate_limited"] += 1
+                return 429
+            if draw < self.rate_limit_rate + self.error_rate:
+                stats["errors"] += 1
+                return 500
+        return None
+
+    def count_tokens(self, kind: str, prompt_tokens: int, completion_tokens: int) -> None:
+        with self.lock:
+            self.stats[kind]["prompt_tokens"] += prompt_tokens
+            self.stats[kind]["completion_tokens"] += completion_tokens
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                kind: dict(s, latency_s=round(s["latency_s"], 3),
+                           mean_latency_s=round(s["latency_s"] / s["requests"], 3) if s["requests"] else 0.0)
+                for kind, s in self.stats.items()
+            }
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def state(self) -> MockState:
+        return self.server.state
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def send_json(self, status: int, body: dict, headers: dict = None) -> None:
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def read_body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def simulate(self, kind: str) -> bool:
+        """Waits for the drawn latency. Returns False after sending an injected failure."""
+        delay = self.state.delay(kind)
+        status = self.state.outcome(kind, delay)
+        time.sleep(delay)
+        if status == 429:
+            self.send_json(429, {"error": {"code": 429, "message": "Mock rate limit reached.", "status": "RESOURCE_EXHAUSTED",
+                                           "type": "rate_limit_exceeded"}}, {"Retry-After": "1"})
+            return False
+        if status == 500:
+            self.send_json(500, {"error": {"code": 500, "message": "Mock server error.", "status": "INTERNAL",
+                                           "type": "server_error"}})
+            return False
+        return True
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path == "/stats":
+            self.send_json(200, self.state.snapshot())
+        elif path.startswith("/indexes/"):
+            if self.simulate("pinecone"):
+                name = path.rsplit("/", 1)[-1]
+                host = f"http://{self.headers.get('Host')}"
+                self.send_json(200, {
+                    "name": name, "dimension": 1536, "metric": "cosine", "host": host,
+                    "spec": {"serverless": {"cloud": "aws", "region": "us-east-1"}},
+                    "status": {"ready": True, "state": "Ready"}, "deletion_protection": "disabled",
+                })
+        else:
+            self.send_json(404, {"error": {"message": f"Unknown path {path}"}})
+
+    def do_POST(self):
+        path = self.path.split("?")[0]
+        if path.endswith("/chat/completions"):
+            self.chat_completion(json.loads(self.read_body()))
+        elif path.endswith("/embeddings"):
+            self.embeddings(json.loads(self.read_body()))
+        elif path.endswith("/audio/transcriptions"):
+            self.transcription(self.read_body())
+        elif ":generateContent" in path:
+            self.generate_content(path, json.loads(self.read_body()))
+        elif path == "/vectors/upsert":
+            self.upsert(json.loads(self.read_body()))
+        elif path == "/query":
+            self.query(json.loads(self.read_body()))
+        else:
+            self.read_body()
+            self.send_json(404, {"error": {"message": f"Unknown path {path}"}})
+
+    def chat_completion(self, request: dict) -> None:
+        if not self.simulate("chat"):
+            return
+        messages = request.get("messages", [])
+
+        def text_of(message):
+            content = message.get("content") or ""
+            if isinstance(content, list):
+                return " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+            return content
+
+        system = "\n".join(text_of(m) for m in messages if m.get("role") in ("system", "developer"))
+        prompt = "\n".join(text_of(m) for m in messages if m.get("role") not in ("system", "developer"))
+        tools = [(t["function"]["name"], t["function"].get("parameters")) for t in request.get("tools") or []]
+        choice = pick_tool(tools) if tools and messages and messages[-1].get("role") == "user" else None
+        if choice:
+            name, arguments = choice
+            message = {"role": "assistant", "content": None, "tool_calls": [{
+                "id": f"call_{digest([prompt, name]):x}", "type": "function",
+                "function": {"name": name, "arguments": json.dumps(arguments)},
+            }]}
+            finish_reason = "tool_calls"
+        else:
+            message = {"role": "assistant", "content": reply_text(system, prompt)}
+            finish_reason = "stop"
+        prompt_tokens = (len(system) + len(prompt)) // 4 + 1
+        completion_tokens = len(message["content"] or "") // 4 + 1
+        self.state.count_tokens("chat", prompt_tokens, completion_tokens)
+        self.send_json(200, {
+            "id": f"chatcmpl-{digest(request):x}", "object": "chat.completion", "created": int(time.time()),
+            "model": request.get("model", "mock"),
+            "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        })
+
+    def embeddings(self, request: dict) -> None:
+        if not self.simulate("embeddings"):
+            return
+        inputs = request.get("input")
+        inputs = inputs if isinstance(inputs, list) else [inputs]
+        dimensions = int(request.get("dimensions") or 1536)
+        self.send_json(200, {
+            "object": "list", "model": request.get("model", "mock"),
+            "data": [{"object": "embedding", "index": i, "embedding": embedding(str(text), dimensions)}
+                     for i, text in enumerate(inputs)],
+            "usage": {"prompt_tokens": 0, "total_tokens": 0},
+        })
+
+    def transcription(self, body: bytes) -> None:
+        if not self.simulate("transcription"):
+            return
+        message = email.parser.BytesParser().parsebytes(
+            f"Content-Type: {self.headers.get('Content-Type')}\r\n\r\n".encode("utf-8") + body
+        )
+        audio = b""
+        for part in message.get_payload() if message.is_multipart() else []:
+            if part.get_param("name", header="content-disposition") == "file":
+                audio = part.get_payload(decode=True) or b""
+        self.send_json(200, mock_transcript(audio, digest(len(audio))))
+
+    def generate_content(self, path: str, request: dict) -> None:
+        if not self.simulate("gemini"):
+            return
+
+        def text_of(content):
+            return " ".join(part.get("text", "") for part in (content or {}).get("parts", []))
+
+        contents = request.get("contents", [])
+        system = text_of(request.get("systemInstruction") or request.get("system_instruction"))
+        prompt = "\n".join(text_of(content) for content in contents)
+        tools = [
+            (declaration["name"], declaration.get("parameters"))
+            for tool in request.get("tools") or []
+            for declaration in tool.get("functionDeclarations") or tool.get("function_declarations") or []
+        ]
+        # ADK describes the tools of Gemma models in the prompt and expects the call as JSON text.
+        described = GEMMA_TOOLS.search(prompt)
+        if described:
+            tools = [(tool["name"], tool.get("parameters")) for tool in json.loads(described.group(1))]
+        last_parts = contents[-1].get("parts", []) if contents else []
+        answered = any(
+            "functionResponse" in part or "function_response" in part
+            or part.get("text", "").startswith("Invoking tool `")
+            for part in last_parts
+        )
+        choice = pick_tool(tools) if tools and not answered else None
+        if choice and described:
+            parts = [{"text": json.dumps({"name": choice[0], "parameters": choice[1]})}]
+        elif choice:
+            parts = [{"functionCall": {"name": choice[0], "args": choice[1]}}]
+        else:
+            parts = [{"text": reply_text(system, prompt)}]
+        prompt_tokens = (len(system) + len(prompt)) // 4 + 1
+        completion_tokens = len(json.dumps(parts)) // 4 + 1
+        self.state.count_tokens("gemini", prompt_tokens, completion_tokens)
+        self.send_json(200, {
+            "candidates": [{"content": {"role": "model", "parts": parts}, "finishReason": "STOP", "index": 0}],
+            "usageMetadata": {"promptTokenCount": prompt_tokens, "candidatesTokenCount": completion_tokens,
+                              "totalTokenCount": prompt_tokens + completion_tokens},
+            "modelVersion": path.split("models/")[-1].split(":")[0],
+        })
+
+    def upsert(self, request: dict) -> None:
+        if not self.simulate("pinecone"):
+            return
+        vectors = request.get("vectors", [])
+        with self.state.lock:
+            for vector in vectors:
+                self.state.vectors[request.get("namespace", "")][vector["id"]] = vector
+        self.send_json(200, {"upsertedCount": len(vectors)})
+
+    def query(self, request: dict) -> None:
+        if not self.simulate("pinecone"):
+            return
+        namespace = request.get("namespace", "")
+        query = request.get("vector") or []
+        with self.state.lock:
+            stored = list(self.state.vectors[namespace].values())
+        scored = sorted(
+            ((sum(a * b for a, b in zip(query, v.get("values", []))), v) for v in stored),
+            key=lambda item: -item[0],
+        )[: int(request.get("topK", 10))]
+        self.send_json(200, {"namespace": namespace, "matches": [
+            {"id": v["id"], "score": round(score, 6),
+             **({"metadata": v.get("metadata", {})} if request.get("includeMetadata") else {})}
+            for score, v in scored
+        ]})
+
+
+def make_server(host: str, port: int, latency: dict, error_rate: float = 0.0,
+                rate_limit_rate: float = 0.0, seed: int = 0, verbose: bool = False) -> ThreadingHTTPServer:
+    """Creates the mock server; call serve_forever() on it, possibly from a thread."""
+    server = ThreadingHTTPServer((host, port), MockHandler)
+    server.daemon_threads = True
+    server.state = MockState(latency, error_rate, rate_limit_rate, seed)
+    server.verbose = verbose
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", default="", help='Per-kind "median:p95" seconds, e.g. "chat=0.8:2.5,transcription=4:9".')
+    parser.add_argument("--no-latency", action="store_true", help="Answer every request at once.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests failing with a 500.")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of requests failing with a 429.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the latencies and the injected failures.")
+    parser.add_argument("--verbose", action="store_true", help="Log every request.")
+    args = parser.parse_args()
+
+    latency = {} if args.no_latency else dict(DEFAULT_LATENCY, **parse_latency(args.latency))
+    server = make_server(args.host, args.port, latency, args.error_rate, args.rate_limit_rate, args.seed, args.verbose)
+    print(f"Mock server listening on http://{args.host}:{args.port} (latency {latency or 'none'})", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""
+Trains and evaluates the local intent and sentiment classifiers.
+
+    python classify.py export --output-dir datasets/
+    python classify.py train intent datasets/intent.jsonl
+    python classify.py evaluate intent datasets/intent_holdout.jsonl
+
+Datasets are JSON lines with a 'text' and a 'label' field. A hand-labelled
+dataset can add an 'llm_label' field holding what the LLM answered for the same
+text. `export` builds both datasets from the analyses already stored in the
+session database, whose labels are the LLM answers themselves.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+
+from dotenv import load_dotenv
+
+from manager_agent.blob_store import state_value
+from manager_agent.local_classifier import CLASSIFIER_PATHS, CONFIDENCE_THRESHOLD, LocalClassifier
+from manager_agent.session_backend import SESSION_DB_URL, get_session_service
+from manager_agent.sub_agents.intent_agent.agent import INTENT_CATEGORIES, transcript_text
+from manager_agent.sub_agents.sentiment_agent.agent import bucket_by_minute, format_minute, normalize_label
+from session_defaults import APP_NAME, USER_ID
+
+load_dotenv()
+
+DB_URL = SESSION_DB_URL
+INTENT_LABELS = {category.lower(): category for category in INTENT_CATEGORIES}
+
+
+def read_dataset(path: str) -> list:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def write_dataset(rows: list, path: str) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps(row) + "\n")
+
+
+async def export_datasets(db_url: str, output_dir: str) -> dict:
+    """
+    Builds intent and sentiment datasets from the LLM labels of past analyses.
+
+    Args:
+        db_url (str): The session database URL.
+        output_dir (str): Directory where intent.jsonl and sentiment.jsonl are written.
+
+    Returns:
+        dict: The number of rows written per task.
+    """
+    session_service = get_session_service(db_url)
+    listed = await session_service.list_sessions(app_name=APP_NAME, user_id=USER_ID)
+
+    intent_rows, sentiment_rows = [], []
+    for listed_session in listed.sessions:
+        session = await session_service.get_session(
+            app_name=APP_NAME, user_id=USER_ID, session_id=listed_session.id
+        )
+        transcript = state_value(session.state, "transcript")
+        if not transcript:
+            continue
+
+        intent = session.state.get("intent_state")
+        if isinstance(intent, str):
+            # Labels outside the categories are discarded at inference, so they are not trained on either.
+            label = INTENT_LABELS.get(intent.strip().strip('"').lower())
+            if label:
+                intent_rows.append({"text": transcript_text(transcript), "label": label})
+
+        sentiment_state = state_value(session.state, "sentiment_state")
+        if isinstance(sentiment_state, dict):
+            minute_buckets = bucket_by_minute(transcript)
+            for entry in sentiment_state.get("timeline", []):
+                try:
+                    minute = int(str(entry.get("minute")).split(" ")[0])
+                except ValueError:
+                    continue
+                label = normalize_label(entry.get("label"))
+                if minute in minute_buckets and label:
+                    sentiment_rows.append({"text": format_minute(minute_buckets[minute]), "label": label})
+
+    write_dataset(intent_rows, os.path.join(output_dir, "intent.jsonl"))
+    write_dataset(sentiment_rows, os.path.join(output_dir, "sentiment.jsonl"))
+    return {"intent": len(intent_rows), "sentiment": len(sentiment_rows)}
+
+
+def evaluate(classifier, rows: list, threshold: float = CONFIDENCE_THRESHOLD) -> dict:
+    """
+    Measures throughput, accuracy and agreement with the LLM on a labelled dataset.
+
+    Agreement with the LLM is only reported over the rows that have an 'llm_label'.
+
+    Args:
+        classifier: The classifier to evaluate.
+        rows (list): Rows with 'text', 'label' and optionally 'llm_label'.
+        threshold (float): Confidence under which the pipeline falls back to the LLM.
+
+    Returns:
+        dict: The evaluation report.
+    """
+    texts = [row["text"] for row in rows]
+
+    started = time.perf_counter()
+    predictions = classifier.predict(texts)
+    batch_elapsed = time.perf_counter() - started
+
+    sample = texts[:200]
+    started = time.perf_counter()
+    for text in sample:
+        classifier.predict([text])
+    single_elapsed = time.perf_counter() - started
+
+    correct = confident = confident_correct = 0
+    llm_rows = llm_agree = confident_llm_rows = confident_llm_agree = 0
+    for row, (label, confidence) in zip(rows, predictions):
+        correct += label == row["label"]
+        is_confident = confidence >= threshold
+        if is_confident:
+            confident += 1
+            confident_correct += label == row["label"]
+        if "llm_label" in row:
+            llm_rows += 1
+            llm_agree += label == row["llm_label"]
+            if is_confident:
+                confident_llm_rows += 1
+                confident_llm_agree += label == row["llm_label"]
+
+    total = len(rows)
+    return {
+        "rows": total,
+        "throughput_per_s": round(total / batch_elapsed, 1) if batch_elapsed else None,
+        "latency_ms": round(single_elapsed / len(sample) * 1000, 3) if sample else None,
+        "accuracy": round(correct / total, 3) if total else None,
+        "agreement_with_llm": round(llm_agree / llm_rows, 3) if llm_rows else None,
+        "threshold": threshold,
+        "coverage": round(confident / total, 3) if total else None,
+        "accuracy_when_confident": round(confident_correct / confident, 3) if confident else None,
+        "agreement_with_llm_when_confident": (
+            round(confident_llm_agree / confident_llm_rows, 3) if confident_llm_rows else None
+        ),
+        "llm_calls_avoided": confident,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="Build datasets from past analyses.")
+    export_parser.add_argument("--db-url", default=DB_URL)
+    export_parser.add_argument("--output-dir", default="datasets")
+
+    train_parser = subparsers.add_parser("train", help="Train a classifier.")
+    train_parser.add_argument("task", choices=sorted(CLASSIFIER_PATHS))
+    train_parser.add_argument("dataset")
+    train_parser.add_argument("--output", default=None, help="Model file, defaults to the configured path.")
+    train_parser.add_argument("--holdout", type=float, default=0.2, help="Fraction kept aside for evaluation.")
+
+    eval_parser = subparsers.add_parser("evaluate", help="Evaluate a trained classifier.")
+    eval_parser.add_argument("task", choices=sorted(CLASSIFIER_PATHS))
+    eval_parser.add_argument("dataset")
+    eval_parser.add_argument("--model", default=None, help="Model file, defaults to the configured path.")
+    eval_parser.add_argument("--threshold", type=float, default=CONFIDENCE_THRESHOLD)
+
+    args = parser.parse_args()
+
+    if args.command == "export":
+        counts = asyncio.run(export_datasets(args.db_url, args.output_dir))
+        print(f"Exported {counts} rows to {args.output_dir}")
+
+    elif args.command == "train":
+        rows = read_dataset(args.dataset)
+        random.Random(0).shuffle(rows)
+        holdout = int(len(rows) * args.holdout)
+        train_rows, eval_rows = rows[holdout:], rows[:holdout]
+
+        classifier = LocalClassifier.train([r["text"] for r in train_rows], [r["label"] for r in train_rows])
+        output = args.output or CLASSIFIER_PATHS[args.task]
+        classifier.save(output)
+        print(f"Trained {args.task} classifier on {len(train_rows)} rows, saved to {output}")
+        if eval_rows:
+            print(json.dumps(evaluate(classifier, eval_rows), indent=2))
+
+    elif args.command == "evaluate":
+        classifier = LocalClassifier.load(args.model or CLASSIFIER_PATHS[args.task])
+        print(json.dumps(evaluate(classifier, read_dataset(args.dataset), args.threshold), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -4,37 +4,22 @@ import asyncio
 from manager_agent.agent import manager_agent
 from dotenv import load_dotenv
 from google.adk.runners import Runner
-from google.adk.sessions import DatabaseSessionService
+from manager_agent.session_backend import get_session_service
+from manager_agent.tracing import TracingPlugin
+from session_defaults import APP_NAME, USER_ID, new_session_state
 from utils import call_agent_async
 
 load_dotenv()
 
 # ===== PART 1: Initialize Persistent Session Service =====
-# Using SQLite database for persistent storage
-db_url = "sqlite:///./my_agent_data.db"
-session_service = DatabaseSessionService(db_url=db_url)
-
+# Using the database in SAGE_SESSION_DB_URL, a SQLite file by default
+session_service = get_session_service()
 
 # ===== PART 2: Define Initial State =====
-# This will only be used when creating a new session
-initial_state = {
-    "user_name": "Amit Luhar",
-    "intent_state": None,
-    "sentiment_state": None,
-    "root_cause_state": None,
-    "is_audio_transcribed": False,
-    "audio_filepath": None,
-    "transcript": [],
-    "analysis_report": None,
-    "interaction_history": [],
-}
+# new_session_state() (session_defaults.py) is only used when creating a new session
 
 
 async def main_async():
-    # Setup constants
-    APP_NAME = "Bank Audio Transcript Analyst"
-    USER_ID = "dedsec995"
-
     # ===== PART 3: Session Management - Find or Create =====
     # Check for existing sessions for this user
     existing_sessions = await session_service.list_sessions(
@@ -52,7 +37,7 @@ async def main_async():
         new_session = await session_service.create_session(
             app_name=APP_NAME,
             user_id=USER_ID,
-            state=initial_state,
+            state=new_session_state(),
         )
         SESSION_ID = new_session.id
         print(f"Created new session: {SESSION_ID}")
@@ -63,6 +48,7 @@ async def main_async():
         agent=manager_agent,
         app_name=APP_NAME,
         session_service=session_service,
+        plugins=[TracingPlugin()],
     )
 
     # ===== PART 5: Interactive Conversation Loop =====
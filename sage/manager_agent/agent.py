@@ -2,10 +2,18 @@ from google.adk.agents import Agent, SequentialAgent, ParallelAgent
 from google.adk.tools.tool_context import ToolContext
 from google.adk.models.lite_llm import LiteLlm
 from .sub_agents.intent_agent.agent import intent_agent
-from .sub_agents.sentiment_agent.agent import sentiment_agent
-from .sub_agents.root_cause_agent.agent import root_cause_agent
-from .sub_agents.audio_to_transcript_agent.agent import audio_to_transcript_agent
-from .sub_agents.synthesizer_agent.agent import synthesizer_agent
+from .sub_agents.sentiment_agent.agent import (
+    analyze_sentiment_per_minute,
+    reuse_scored_sentiment,
+    sentiment_agent,
+)
+from .sub_agents.root_cause_agent.agent import analyze_root_cause, root_cause_agent
+from .sub_agents.audio_to_transcript_agent.agent import audio_to_transcript_agent, transcribe_audio
+from .sub_agents.synthesizer_agent.agent import generate_summary_report, synthesizer_agent
+from .memo import record_completed_analysis, skip_completed_analysis
+from .blob_store import state_instruction
+from .scheduler import record_model_error, wait_for_rate_limit
+from .pipeline import PIPELINE_MODE, WORKFLOW_MODE, IncrementalTranscriptionAgent, ToolStepAgent
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -24,34 +32,78 @@ def set_filepath(tool_context: ToolContext, filepath: str) -> dict:
     tool_context.state["audio_filepath"] = filepath
     return {"status": f"Filepath set to {filepath}"}
 
+if WORKFLOW_MODE == "tools":
+    # Each stage calls its tool directly; intent stays an LLM agent since its LLM call is the work itself.
+    transcription_step = ToolStepAgent(
+        name="audio_to_transcript_agent",
+        description="Transcribes the audio file.",
+        tool=transcribe_audio,
+    )
+    analysis_steps = [
+        intent_agent,
+        ToolStepAgent(
+            name="sentiment_agent",
+            description="Scores the sentiment of each minute of the transcript.",
+            tool=analyze_sentiment_per_minute,
+            before_agent_callback=reuse_scored_sentiment,
+        ),
+        ToolStepAgent(
+            name="root_cause_agent",
+            description="Identifies the root cause of the user's issue.",
+            tool=analyze_root_cause,
+        ),
+    ]
+    report_step = ToolStepAgent(
+        name="synthesizer_agent",
+        description="Generates the final report.",
+        tool=generate_summary_report,
+        output_key="analysis_report",
+    )
+else:
+    transcription_step = audio_to_transcript_agent
+    analysis_steps = [intent_agent, sentiment_agent, root_cause_agent]
+    report_step = synthesizer_agent
+
+if PIPELINE_MODE == "incremental":
+    # Sentiment is scored during transcription, so the sentiment step finds it done and skips.
+    transcription_step = IncrementalTranscriptionAgent(
+        name="incremental_transcription_agent",
+        description="Transcribes the audio file and scores the sentiment of each minute as it is transcribed.",
+    )
+
 # Define the main workflow as a SequentialAgent
 sage_workflow = SequentialAgent(
     name="sage_workflow",
     sub_agents=[
-        audio_to_transcript_agent,
+        transcription_step,
         ParallelAgent(
             name="analysis_agents",
-            sub_agents=[
-                intent_agent,
-                sentiment_agent,
-                root_cause_agent,
-            ]
+            sub_agents=analysis_steps,
         ),
-        synthesizer_agent,
-    ]
+        report_step,
+    ],
+    # A recording that was already analyzed is answered from the memo instead of re-running the workflow.
+    before_agent_callback=skip_completed_analysis,
+    after_agent_callback=record_completed_analysis,
 )
 
 manager_agent = Agent(
     name="manager_agent",
     model=LiteLlm(model="openai/gpt-4o"),
     description="Manager agent for the bank audio transcript analysis system.",
-    instruction="""
+    # Filled by state_instruction, since the report and sentiment may be in the blob store.
+    instruction=state_instruction("""
     You are Sage, a friendly and intelligent AI assistant for analyzing bank audio transcripts.
     Your primary role is to manage a team of specialized agents to provide a comprehensive analysis of customer service calls.
     The state `audio_filepath` : {audio_filepath}
-    If the `audio_filepath` is set in the state and the analysis has not been done yet, call the `sage_workflow` agent to perform the analysis.
+    The state `analysis_complete` : {analysis_complete?}
+    If `analysis_complete` is set, the analysis is done: never call `sage_workflow` again, and answer the user's questions using
+    the intent {intent_state?}, the sentiment {sentiment_state?}, the root cause {root_cause_state?} and the report {analysis_report?}.
+    Otherwise, if the `audio_filepath` is set in the state, call the `sage_workflow` agent to perform the analysis.
     Otherwise, you can chat with the user and answer their questions.
-    """,
+    """),
     sub_agents=[sage_workflow],
     tools=[set_filepath],
+    before_model_callback=wait_for_rate_limit,
+    on_model_error_callback=record_model_error,
 )
@@ -0,0 +1,295 @@
+import functools
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from google.adk.agents.readonly_context import ReadonlyContext
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# State keys whose values are moved out of the session once they serialize to at least
+# SAGE_BLOB_MIN_BYTES. The session keeps a {"$blob": digest, "bytes": size} reference.
+BLOB_KEYS = ("transcript", "sentiment_state", "analysis_report")
+BLOB_MIN_BYTES = int(os.getenv("SAGE_BLOB_MIN_BYTES", "1024"))
+BLOB_REF = "$blob"
+# Blobs younger than this are never pruned, since the run that stored them may not
+# have appended the event referencing them yet.
+BLOB_PRUNE_MIN_AGE_S = float(os.getenv("SAGE_BLOB_PRUNE_MIN_AGE_S", "3600"))
+
+_PLACEHOLDER = re.compile(r"{([A-Za-z_][A-Za-z0-9_]*)(\?)?}")
+
+
+def _serialize(value) -> bytes:
+    return json.dumps(value, default=str, separators=(",", ":")).encode("utf-8")
+
+
+# Recently read blobs, by digest. A digest names the same content in any blob directory.
+_MAX_CACHED = 64
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _read_cached(digest: str, path: str) -> bytes:
+    with _cache_lock:
+        data = _cache.get(digest)
+        if data is not None:
+            _cache.move_to_end(digest)
+            return data
+
+    with open(path, "rb") as f:
+        data = f.read()
+    with _cache_lock:
+        _cache[digest] = data
+        _cache.move_to_end(digest)
+        while len(_cache) > _MAX_CACHED:
+            _cache.popitem(last=False)
+    return data
+
+
+class BlobStore:
+    """
+    On-disk, content-addressed store of large session state values.
+
+    Every value is a JSON file named after the SHA-256 digest of its contents, so
+    a value stored by several sessions, such as the transcript of a recording
+    analyzed twice, is only written once. Any other value, even a slightly
+    different one, is a new blob, which is why the pipeline stores the transcript
+    once per analysis rather than while it grows. Blobs are never modified, which
+    lets recently read ones be kept in memory. They are not deleted with their
+    sessions either; `prune` removes the ones no session refers to any more.
+    """
+
+    def __init__(self, blob_dir: str, enabled: bool = True):
+        self.blob_dir = blob_dir
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._stats = {"stores": 0, "writes": 0, "reads": 0, "bytes_offloaded": 0}
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.blob_dir, digest[:2], f"{digest}.json")
+
+    def put(self, value) -> dict:
+        """
+        Stores a value.
+
+        Args:
+            value: Any JSON serializable value.
+
+        Returns:
+            dict: The reference to keep in the session state.
+        """
+        return self._put_data(_serialize(value))
+
+    def _put_data(self, data: bytes) -> dict:
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._blob_path(digest)
+        with self._lock:
+            self._stats["stores"] += 1
+            self._stats["bytes_offloaded"] += len(data)
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f"{path}.{threading.get_ident()}.tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+                self._stats["writes"] += 1
+        return {BLOB_REF: digest, "bytes": len(data)}
+
+    def get(self, ref: dict):
+        """
+        Loads the value behind a reference.
+
+        Returns:
+            The stored value, or None if the blob is missing.
+        """
+        with self._lock:
+            self._stats["reads"] += 1
+        digest = ref[BLOB_REF]
+        try:
+            return json.loads(_read_cached(digest, self._blob_path(digest)))
+        except (FileNotFoundError, json.JSONDecodeError):
+            print(f"Session blob {digest} is missing from {self.blob_dir}")
+            return None
+
+    def prune(self, referenced: set, min_age_s: float = BLOB_PRUNE_MIN_AGE_S) -> dict:
+        """
+        Deletes the blobs that are not referenced.
+
+        Args:
+            referenced (set): The digests still referenced by a session.
+            min_age_s (float): Blobs written more recently than this are kept.
+
+        Returns:
+            dict: The number of blobs kept and removed, and the bytes freed.
+        """
+        result = {"kept": 0, "removed": 0, "bytes_freed": 0}
+        if not os.path.isdir(self.blob_dir):
+            return result
+        cutoff = time.time() - min_age_s
+        for root, _, names in os.walk(self.blob_dir):
+            for name in names:
+                digest, ext = os.path.splitext(name)
+                path = os.path.join(root, name)
+                if ext != ".json" or digest in referenced or os.path.getmtime(path) > cutoff:
+                    result["kept"] += 1
+                    continue
+                size = os.path.getsize(path)
+                os.remove(path)
+                with _cache_lock:
+                    _cache.pop(digest, None)
+                result["removed"] += 1
+                result["bytes_freed"] += size
+        return result
+
+    def stats(self) -> dict:
+        """Returns the values stored, the blobs actually written, the reads and the bytes kept out of sessions."""
+        with self._lock:
+            return dict(self._stats)
+
+
+blob_store = BlobStore(
+    blob_dir=os.getenv("SAGE_BLOB_DIR", "./session_blobs"),
+    enabled=os.getenv("SAGE_BLOB_STORE", "1") != "0",
+)
+
+
+def is_blob_ref(value) -> bool:
+    """Tells whether a state value is a reference to a blob."""
+    return isinstance(value, dict) and BLOB_REF in value
+
+
+def blob_digests(value) -> set:
+    """Returns the digests of all blob references in a state value, however deeply nested."""
+    if is_blob_ref(value):
+        return {value[BLOB_REF]}
+    if isinstance(value, dict):
+        values = value.values()
+    elif isinstance(value, (list, tuple)):
+        values = value
+    else:
+        return set()
+    return set().union(*(blob_digests(v) for v in values))
+
+
+async def prune_unreferenced_blobs(session_service, app_name: str, min_age_s: float = BLOB_PRUNE_MIN_AGE_S) -> dict:
+    """
+    Deletes the blobs that neither the state nor an event of any session of the app refers to.
+
+    Args:
+        session_service: The session service whose sessions are checked.
+        app_name (str): The app whose sessions, of all users, are checked.
+        min_age_s (float): Blobs written more recently than this are kept.
+
+    Returns:
+        dict: The result of BlobStore.prune, with the number of sessions checked.
+    """
+    referenced = set()
+    listed = await session_service.list_sessions(app_name=app_name)
+    for listed_session in listed.sessions:
+        session = await session_service.get_session(
+            app_name=app_name, user_id=listed_session.user_id, session_id=listed_session.id
+        )
+        if session is None:
+            continue
+        referenced |= blob_digests(session.state)
+        for event in session.events:
+            if event.actions and event.actions.state_delta:
+                referenced |= blob_digests(event.actions.state_delta)
+    return dict(blob_store.prune(referenced, min_age_s), sessions=len(listed.sessions))
+
+
+def resolve(value):
+    """Returns the value behind a blob reference, or the value itself if it is stored inline."""
+    return blob_store.get(value) if is_blob_ref(value) else value
+
+
+def state_value(state, key: str, default=None):
+    """
+    Reads a state value, loading it from the blob store if it was moved there.
+
+    Sessions written before the blob store, with the values inline, read the same way.
+    """
+    value = state.get(key, default)
+    return resolve(value)
+
+
+def offload_state(state: dict) -> dict:
+    """
+    Replaces the large BLOB_KEYS values of a state or state delta with blob references, in place.
+
+    Returns:
+        dict: The same dictionary.
+    """
+    if not blob_store.enabled or not state:
+        return state
+    for key in BLOB_KEYS:
+        value = state.get(key)
+        if value is None or is_blob_ref(value):
+            continue
+        data = _serialize(value)
+        if len(data) >= BLOB_MIN_BYTES:
+            state[key] = blob_store._put_data(data)
+    return state
+
+
+def offload_session_state(service):
+    """
+    Makes a session service store large state values in the blob store.
+
+    The values are replaced by references in the state of new sessions and in the
+    state delta of every appended event, before the service persists them, so
+    neither the session row nor the event rows hold them.
+
+    Args:
+        service: A BaseSessionService, changed in place.
+
+    Returns:
+        The same service.
+    """
+    create_session = service.create_session
+    append_event = service.append_event
+
+    @functools.wraps(create_session)
+    async def create_session_offloaded(*args, **kwargs):
+        offload_state(kwargs.get("state"))
+        return await create_session(*args, **kwargs)
+
+    @functools.wraps(append_event)
+    async def append_event_offloaded(session, event):
+        if event.actions and event.actions.state_delta:
+            offload_state(event.actions.state_delta)
+        return await append_event(session, event)
+
+    service.create_session = create_session_offloaded
+    service.append_event = append_event_offloaded
+    return service
+
+
+def state_instruction(template: str):
+    """
+    Builds an instruction provider filling {key} and {key?} from the session state.
+
+    It replaces ADK's own placeholder filling for agents whose instructions quote
+    values that may be in the blob store.
+
+    Args:
+        template (str): The instruction with placeholders.
+    """
+    def provider(context: ReadonlyContext) -> str:
+        def fill(match):
+            key, optional = match.group(1), match.group(2)
+            if key not in context.state:
+                if optional:
+                    return ""
+                raise KeyError(f"Context variable not found: `{key}` in agent '{context.agent_name}'.")
+            value = state_value(context.state, key)
+            return "" if value is None else str(value)
+
+        return _PLACEHOLDER.sub(fill, template)
+
+    return provider
@@ -0,0 +1,144 @@
+import asyncio
+import os
+import threading
+import weakref
+
+import google.generativeai as genai
+import httpx
+from openai import AsyncOpenAI, OpenAI
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Connection pooling shared by every agent and session of the process.
+HTTP_POOL_SIZE = int(os.getenv("SAGE_HTTP_POOL_SIZE", "32"))
+HTTP_KEEPALIVE_SECONDS = float(os.getenv("SAGE_HTTP_KEEPALIVE_SECONDS", "60"))
+HTTP_TIMEOUT_SECONDS = float(os.getenv("SAGE_HTTP_TIMEOUT_SECONDS", "120"))
+HTTP_CONNECT_TIMEOUT_SECONDS = float(os.getenv("SAGE_HTTP_CONNECT_TIMEOUT_SECONDS", "10"))
+
+# Sends every request to the local stand-in server (python -m benchmarks.mock_server) instead of the providers.
+MOCK_URL = os.getenv("SAGE_MOCK_URL", "").rstrip("/")
+if MOCK_URL:
+    # The OpenAI SDK and litellm (ADK's LiteLlm agents) read OPENAI_BASE_URL,
+    # google.genai (ADK's Gemini agents) reads GOOGLE_GEMINI_BASE_URL.
+    os.environ["OPENAI_BASE_URL"] = f"{MOCK_URL}/v1"
+    os.environ["GOOGLE_GEMINI_BASE_URL"] = MOCK_URL
+    os.environ.setdefault("OPENAI_API_KEY", "mock")
+    os.environ.setdefault("GOOGLE_API_KEY", "mock")
+
+_lock = threading.Lock()
+_openai_client = None
+_async_openai_clients = weakref.WeakKeyDictionary()
+_generative_models = {}
+_genai_configured = False
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=HTTP_POOL_SIZE,
+        max_keepalive_connections=HTTP_POOL_SIZE,
+        keepalive_expiry=HTTP_KEEPALIVE_SECONDS,
+    )
+
+
+def _timeout() -> httpx.Timeout:
+    return httpx.Timeout(HTTP_TIMEOUT_SECONDS, connect=HTTP_CONNECT_TIMEOUT_SECONDS)
+
+
+def openai_client() -> OpenAI:
+    """
+    Returns the process-wide OpenAI client.
+
+    The client keeps a pool of keep-alive connections, so transcription requests
+    from different sessions and threads do not pay the TLS handshake again. It
+    does not retry failed requests; scheduled_call does.
+    """
+    global _openai_client
+    with _lock:
+        if _openai_client is None:
+            _openai_client = OpenAI(
+                api_key=os.getenv("OPENAI_API_KEY"),
+                max_retries=0,
+                timeout=_timeout(),
+                http_client=httpx.Client(limits=_limits(), timeout=_timeout()),
+            )
+        return _openai_client
+
+
+async def _close_with_loop(loop, client: AsyncOpenAI) -> None:
+    # Waits until the loop's tasks are cancelled, which asyncio.run does before closing the loop.
+    try:
+        await asyncio.Event().wait()
+    finally:
+        with _lock:
+            _async_openai_clients.pop(loop, None)
+        await client.close()
+
+
+def async_openai_client() -> AsyncOpenAI:
+    """
+    Returns the async OpenAI client of the running event loop, for litellm's `client` argument.
+
+    Async connections belong to the loop that opened them, and the Streamlit app
+    starts a new loop on every rerun, so there is one pooled client per loop. A
+    background task closes the client and its connections when the loop shuts
+    down, so the short-lived loops of asyncio.run do not leave them open.
+    """
+    loop = asyncio.get_running_loop()
+    with _lock:
+        entry = _async_openai_clients.get(loop)
+        if entry is None:
+            client = AsyncOpenAI(
+                api_key=os.getenv("OPENAI_API_KEY"),
+                max_retries=0,
+                timeout=_timeout(),
+                http_client=httpx.AsyncClient(limits=_limits(), timeout=_timeout()),
+            )
+            entry = (client, loop.create_task(_close_with_loop(loop, client)))
+            _async_openai_clients[loop] = entry
+        return entry[0]
+
+
+def generative_model(model_name: str) -> genai.GenerativeModel:
+    """
+    Returns the shared Gemini model object for a model name.
+
+    genai is configured once per process: every `genai.configure` call drops the
+    clients it built before, together with their open channels.
+    """
+    global _genai_configured
+    with _lock:
+        if not _genai_configured:
+            if MOCK_URL:
+                genai.configure(
+                    api_key=os.getenv("GOOGLE_API_KEY"), transport="rest", client_options={"api_endpoint": MOCK_URL}
+                )
+            else:
+                genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+            _genai_configured = True
+        if model_name not in _generative_models:
+            _generative_models[model_name] = genai.GenerativeModel(model_name)
+        return _generative_models[model_name]
+
+
+def genai_request_options() -> dict:
+    """
+    Returns the request options of a Gemini request: its timeout, and no retries,
+    since scheduled_call retries failed requests.
+
+    Returns:
+        dict: The `request_options` argument of `generate_content`.
+    """
+    return {"timeout": HTTP_TIMEOUT_SECONDS, "retry": None}
+
+
+async def generate_content_async(model: genai.GenerativeModel, prompt: str):
+    """
+    Sends a Gemini request without blocking the event loop.
+
+    google.generativeai has no async REST transport, so against the mock server
+    the blocking call runs in a worker thread instead.
+    """
+    if MOCK_URL:
+        return await asyncio.to_thread(model.generate_content, prompt, request_options=genai_request_options())
+    return await model.generate_content_async(prompt, request_options=genai_request_options())
@@ -0,0 +1,199 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+class ColumnarTranscript:
+    """
+    Column-oriented view of a [start, end, speaker, text] transcript.
+
+    Start and end times are float arrays, speakers are integer codes into
+    `speakers`, and all texts live in one UTF-8 buffer addressed by `offsets`
+    (text i is buffer[offsets[i]:offsets[i + 1]]). Bucketing and aggregation run
+    as array operations instead of Python loops over segments.
+    """
+
+    def __init__(self, start, end, speaker_codes, speakers, offsets, buffer):
+        self.start = start
+        self.end = end
+        self.speaker_codes = speaker_codes
+        self.speakers = speakers
+        self.offsets = offsets
+        self.buffer = buffer
+
+    @classmethod
+    def from_segments(cls, transcript) -> "ColumnarTranscript":
+        """
+        Builds the columnar view of a transcript.
+
+        Args:
+            transcript (list): [start_time, end_time, speaker_id, text] segments.
+
+        Returns:
+            ColumnarTranscript: The columnar transcript.
+        """
+        n = len(transcript)
+        start = np.fromiter((s[0] for s in transcript), dtype=np.float64, count=n)
+        end = np.fromiter((s[1] for s in transcript), dtype=np.float64, count=n)
+
+        speaker_index = {}
+        speaker_codes = np.fromiter(
+            (speaker_index.setdefault(str(s[2]), len(speaker_index)) for s in transcript),
+            dtype=np.int32,
+            count=n,
+        )
+        speakers = list(speaker_index)
+
+        encoded = [str(s[3]).encode("utf-8") for s in transcript]
+        offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.fromiter((len(t) for t in encoded), dtype=np.int64, count=n), out=offsets[1:])
+        return cls(start, end, speaker_codes, speakers, offsets, b"".join(encoded))
+
+    def __len__(self) -> int:
+        return len(self.start)
+
+    def text(self, i: int) -> str:
+        return self.buffer[self.offsets[i]:self.offsets[i + 1]].decode("utf-8")
+
+    def speaker(self, i: int) -> str:
+        return self.speakers[self.speaker_codes[i]]
+
+    @property
+    def duration(self) -> float:
+        return float(self.end.max() - self.start.min()) if len(self) else 0.0
+
+    def joined_text(self, sep: str = " ", with_speakers: bool = False, indices=None) -> str:
+        """
+        Joins segment texts straight from the text buffer.
+
+        Args:
+            sep (str): Separator between segments.
+            with_speakers (bool): Prefix every segment with "speaker: ".
+            indices: Optional segment indices to join, defaults to all segments.
+
+        Returns:
+            str: The joined text.
+        """
+        if indices is None:
+            indices = range(len(self))
+        buffer, offsets = self.buffer, self.offsets
+        if with_speakers:
+            prefixes = [f"{s}: ".encode("utf-8") for s in self.speakers]
+            codes = self.speaker_codes
+            parts = (prefixes[codes[i]] + buffer[offsets[i]:offsets[i + 1]] for i in indices)
+        else:
+            parts = (buffer[offsets[i]:offsets[i + 1]] for i in indices)
+        return sep.encode("utf-8").join(parts).decode("utf-8")
+
+    def minute_groups(self, window_seconds: float = 60.0):
+        """
+        Groups segments by the time window they start in.
+
+        Args:
+            window_seconds (float): Window length, one minute by default.
+
+        Returns:
+            tuple: (window indexes, list of segment index arrays), in chronological
+                   window order and original segment order within a window.
+        """
+        if not len(self):
+            return np.array([], dtype=np.int64), []
+        windows = np.floor(self.start / window_seconds).astype(np.int64)
+        order = np.argsort(windows, kind="stable")
+        unique_windows, first = np.unique(windows[order], return_index=True)
+        return unique_windows, np.split(order, first[1:])
+
+    def talk_time(self) -> dict:
+        """Returns the seconds spoken by each speaker."""
+        seconds = np.bincount(
+            self.speaker_codes, weights=np.clip(self.end - self.start, 0, None), minlength=len(self.speakers)
+        )
+        return {speaker: round(float(s), 2) for speaker, s in zip(self.speakers, seconds)}
+
+    def turn_counts(self) -> dict:
+        """Returns the number of segments of each speaker."""
+        counts = np.bincount(self.speaker_codes, minlength=len(self.speakers))
+        return {speaker: int(c) for speaker, c in zip(self.speakers, counts)}
+
+    def overlap_seconds(self) -> float:
+        """Returns the total time consecutive turns of different speakers talk over each other."""
+        if len(self) < 2:
+            return 0.0
+        order = np.argsort(self.start, kind="stable")
+        start, end, codes = self.start[order], self.end[order], self.speaker_codes[order]
+        overlap = np.minimum(end[:-1], end[1:]) - start[1:]
+        overlap = np.where(codes[:-1] != codes[1:], np.clip(overlap, 0, None), 0.0)
+        return round(float(overlap.sum()), 2)
+
+    def metrics(self) -> dict:
+        """Returns duration, talk time, turn counts and overlap of the call."""
+        return {
+            "duration_s": round(self.duration, 2),
+            "talk_time_s": self.talk_time(),
+            "turns": self.turn_counts(),
+            "overlap_s": self.overlap_seconds(),
+        }
+
+
+def aggregate_labels(labels: list, scores: list):
+    """
+    Counts labels and averages their scores with array operations.
+
+    Args:
+        labels (list): One label per item, compared as strings (so None becomes "None").
+        scores (list): One score per item.
+
+    Returns:
+        tuple: (label names in order of first appearance, counts, average scores).
+    """
+    # np.unique sorts the labels, which fails on a mix of types.
+    labels = np.asarray([str(label) for label in labels], dtype=object)
+    categories, first_seen, codes = np.unique(labels, return_index=True, return_inverse=True)
+    order = np.argsort(first_seen, kind="stable")
+    counts = np.bincount(codes, minlength=len(categories))
+    totals = np.bincount(codes, weights=np.asarray(scores, dtype=np.float64), minlength=len(categories))
+    return [str(categories[i]) for i in order], counts[order], totals[order] / counts[order]
+
+
+_MAX_CACHED = 32
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _fingerprint(transcript) -> str:
+    data = json.dumps(transcript, default=str, separators=(",", ":")).encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+def columnar_for(transcript) -> ColumnarTranscript:
+    """
+    Returns the columnar view of a transcript, building it only once per content.
+
+    The transcription tool builds it right after transcribing, and the analysis
+    tools that receive the same transcript from the session state reuse it, even
+    as a different list. The cache is keyed on a SHA-256 digest of all segments,
+    so any change to the transcript builds a new view.
+
+    Args:
+        transcript (list): [start_time, end_time, speaker_id, text] segments.
+
+    Returns:
+        ColumnarTranscript: The columnar transcript.
+    """
+    key = _fingerprint(transcript)
+    with _cache_lock:
+        columnar = _cache.get(key)
+        if columnar is not None:
+            _cache.move_to_end(key)
+            return columnar
+
+    columnar = ColumnarTranscript.from_segments(transcript)
+    with _cache_lock:
+        _cache[key] = columnar
+        _cache.move_to_end(key)
+        while len(_cache) > _MAX_CACHED:
+            _cache.popitem(last=False)
+    return columnar
@@ -0,0 +1,179 @@
+import json
+import math
+import os
+import re
+from collections import Counter
+
+from dotenv import load_dotenv
+from .columnar import columnar_for
+
+load_dotenv()
+
+# Maximum estimated tokens of transcript text sent to the root-cause and synthesizer LLMs.
+PROMPT_TOKEN_BUDGET = int(os.getenv("SAGE_PROMPT_TOKEN_BUDGET", "8000"))
+
+# Turns made only of these words carry no content and are dropped.
+# Answers such as "yes" or "no" are kept, since they can carry the meaning of the exchange.
+FILLER_PATTERN = re.compile(
+    r"^(?:(?:uh+|um+|hmm+|mm+|mhm+|mm-?hmm|uh-?huh|ok(?:ay)?|right|alright|all right|got it|i see)[\s,.!?-]*)+$",
+    re.IGNORECASE,
+)
+SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+")
+WORD = re.compile(r"[a-z0-9']+")
+STOPWORDS = {
+    "a", "an", "the", "and", "or", "but", "so", "to", "of", "in", "on", "for", "is", "it", "i", "you",
+    "me", "my", "your", "we", "that", "this", "be", "are", "was", "can", "do", "have", "just", "with",
+    "at", "as", "if", "not", "what", "will", "would", "there", "they", "he", "she", "um", "uh",
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """Roughly estimates the token count of a text (about 4 characters per token)."""
+    return len(text) // 4 + 1
+
+
+def compact_json(value) -> str:
+    """Serializes a value to JSON without indentation or padding."""
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+def merge_turns(transcript) -> tuple:
+    """
+    Drops filler turns and merges consecutive turns of the same speaker.
+
+    Args:
+        transcript (list): [start_time, end_time, speaker_id, text] segments.
+
+    Returns:
+        tuple: (list of [speaker, text] turns, number of filler turns dropped, number of turns merged).
+    """
+    turns, dropped, merged = [], 0, 0
+    for segment in transcript:
+        speaker, text = str(segment[2]), str(segment[3]).strip()
+        if not text or FILLER_PATTERN.match(text):
+            dropped += 1
+            continue
+        if turns and turns[-1][0] == speaker:
+            turns[-1][1] = f"{turns[-1][1]} {text}"
+            merged += 1
+        else:
+            turns.append([speaker, text])
+    return turns, dropped, merged
+
+
+def select_salient_sentences(turns: list, token_budget: int) -> tuple:
+    """
+    Keeps the most informative sentences of the call until the token budget is used.
+
+    Sentences are scored by the summed TF-IDF weight of their content words,
+    normalized by the square root of their length. The first and last turns are
+    always kept for the opening request and the resolution, and the kept sentences
+    stay in their original order.
+
+    Args:
+        turns (list): [speaker, text] turns from `merge_turns`.
+        token_budget (int): Maximum estimated tokens of the result.
+
+    Returns:
+        tuple: (compacted [speaker, text] turns, sentences kept, sentences total).
+    """
+    sentences = []
+    for turn_index, (speaker, text) in enumerate(turns):
+        for sentence in SENTENCE_SPLIT.split(text):
+            if sentence.strip():
+                words = [w for w in WORD.findall(sentence.lower()) if w not in STOPWORDS]
+                sentences.append((turn_index, sentence.strip(), words))
+
+    document_frequency = Counter(w for _, _, words in sentences for w in set(words))
+    term_frequency = Counter(w for _, _, words in sentences for w in words)
+    n = len(sentences)
+
+    def score(words):
+        if not words:
+            return 0.0
+        weight = sum(term_frequency[w] * math.log(1 + n / document_frequency[w]) for w in set(words))
+        return weight / math.sqrt(len(words))
+
+    always_keep = {0, len(turns) - 1}
+    ranked = sorted(
+        range(n),
+        key=lambda i: (sentences[i][0] not in always_keep, -score(sentences[i][2])),
+    )
+
+    kept, used = set(), 0
+    for i in ranked:
+        speaker = turns[sentences[i][0]][0]
+        cost = estimate_tokens(f"{speaker}: {sentences[i][1]} ")
+        if used + cost > token_budget:
+            continue
+        kept.add(i)
+        used += cost
+
+    compacted = []
+    for i in sorted(kept):
+        turn_index, sentence, _ = sentences[i]
+        speaker = turns[turn_index][0]
+        if compacted and compacted[-1][2] == turn_index:
+            compacted[-1][1] = f"{compacted[-1][1]} {sentence}"
+        elif compacted and compacted[-1][2] != turn_index - 1:
+            # Mark the turns that were left out entirely.
+            compacted.append(["", "...", turn_index])
+            compacted.append([speaker, sentence, turn_index])
+        else:
+            compacted.append([speaker, sentence, turn_index])
+    return [[speaker, text] for speaker, text, _ in compacted], len(kept), n
+
+
+def compact_transcript(transcript, token_budget: int = None) -> tuple:
+    """
+    Compacts a transcript into prompt text that fits a token budget.
+
+    Filler turns are dropped and consecutive turns of the same speaker merged. If
+    the result is still over budget, only the most salient sentences are kept.
+
+    Args:
+        transcript (list): [start_time, end_time, speaker_id, text] segments.
+        token_budget (int): Maximum estimated tokens, defaults to SAGE_PROMPT_TOKEN_BUDGET.
+
+    Returns:
+        tuple: (the "speaker: text" lines joined by newlines, a report of the tokens saved).
+    """
+    token_budget = token_budget or PROMPT_TOKEN_BUDGET
+    original_text = columnar_for(transcript).joined_text(sep="\n", with_speakers=True)
+
+    turns, dropped, merged = merge_turns(transcript)
+    text = "\n".join(f"{speaker}: {t}" for speaker, t in turns)
+
+    sentences_kept = sentences_total = None
+    if estimate_tokens(text) > token_budget:
+        turns, sentences_kept, sentences_total = select_salient_sentences(turns, token_budget)
+        text = "\n".join(f"{speaker}: {t}" if speaker else t for speaker, t in turns)
+
+    original_tokens = estimate_tokens(original_text)
+    compacted_tokens = estimate_tokens(text)
+    report = {
+        "original_tokens": original_tokens,
+        "compacted_tokens": compacted_tokens,
+        "tokens_saved": original_tokens - compacted_tokens,
+        "filler_turns_dropped": dropped,
+        "turns_merged": merged,
+        "sentences_kept": sentences_kept,
+        "sentences_total": sentences_total,
+    }
+    return text, report
+
+
+def record_compaction(state, stage: str, report: dict) -> None:
+    """
+    Logs a compaction report and keeps it in the session state under 'compaction_report'.
+
+    Args:
+        state: The session state.
+        stage (str): The stage that sent the compacted prompt, e.g. "root_cause".
+        report (dict): The report from `compact_transcript`.
+    """
+    print(f"Prompt compaction for {stage}: {report['original_tokens']} -> "
+          f"{report['compacted_tokens']} tokens ({report['tokens_saved']} saved)")
+    reports = dict(state.get("compaction_report") or {})
+    reports[stage] = report
+    state["compaction_report"] = reports
@@ -0,0 +1,160 @@
+import json
+import os
+import re
+import threading
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# The session keeps the last SAGE_HISTORY_MAX_ENTRIES interaction history entries (0 keeps
+# them all). Older ones are folded into a single rollup record at the start of the list,
+# and every entry is also appended to a per-session log, read only when asked for.
+HISTORY_MAX_ENTRIES = int(os.getenv("SAGE_HISTORY_MAX_ENTRIES", "20"))
+ROLLUP_ACTION = "history_rollup"
+
+
+class HistoryLog:
+    """
+    Append-only log of the full interaction history of every session.
+
+    Every session has a JSON lines file, one entry per line, which is never
+    rewritten and only read to show history rolled out of the session.
+    """
+
+    def __init__(self, log_dir: str, enabled: bool = True):
+        self.log_dir = log_dir
+        self.enabled = enabled
+        self._lock = threading.Lock()
+
+    def _log_path(self, session_id: str) -> str:
+        return os.path.join(self.log_dir, f"{re.sub(r'[^A-Za-z0-9_.-]', '_', session_id)}.jsonl")
+
+    def exists(self, session_id: str) -> bool:
+        return os.path.exists(self._log_path(session_id))
+
+    def append(self, session_id: str, entries: list) -> None:
+        """
+        Appends entries to the log of a session.
+
+        Args:
+            session_id (str): The session id.
+            entries (list): The interaction history entries.
+        """
+        if not self.enabled or not entries:
+            return
+        with self._lock:
+            os.makedirs(self.log_dir, exist_ok=True)
+            with open(self._log_path(session_id), "a", encoding="utf-8") as f:
+                for entry in entries:
+                    f.write(json.dumps(entry, default=str) + "\n")
+
+    def read(self, session_id: str) -> list:
+        """
+        Reads the full interaction history of a session.
+
+        Returns:
+            list: The entries, oldest first, or an empty list if the session has no log.
+        """
+        try:
+            with open(self._log_path(session_id), "r", encoding="utf-8") as f:
+                return [json.loads(line) for line in f if line.strip()]
+        except FileNotFoundError:
+            return []
+
+
+history_log = HistoryLog(
+    log_dir=os.getenv("SAGE_HISTORY_LOG_DIR", "./history_logs"),
+    enabled=os.getenv("SAGE_HISTORY_LOG", "1") != "0",
+)
+
+
+def is_rollup(entry) -> bool:
+    """Tells whether an interaction history entry is the rollup of older entries."""
+    return isinstance(entry, dict) and entry.get("action") == ROLLUP_ACTION
+
+
+def roll_up(rollup, entries: list) -> dict:
+    """
+    Folds interaction history entries into a rollup record.
+
+    Args:
+        rollup (dict | None): The current rollup record, if any.
+        entries (list): The entries leaving the session, oldest first.
+
+    Returns:
+        dict: The new rollup record.
+    """
+    rollup = dict(rollup) if rollup else {
+        "action": ROLLUP_ACTION,
+        "entries": 0,
+        "user_queries": 0,
+        "agent_responses": 0,
+        "first_timestamp": None,
+    }
+    for entry in entries:
+        action = entry.get("action") if isinstance(entry, dict) else None
+        rollup["entries"] += 1
+        if action == "user_query":
+            rollup["user_queries"] += 1
+            rollup["last_query"] = entry.get("query", "")[:200]
+        elif action == "agent_response":
+            rollup["agent_responses"] += 1
+        timestamp = entry.get("timestamp") if isinstance(entry, dict) else None
+        if timestamp:
+            rollup["first_timestamp"] = rollup["first_timestamp"] or timestamp
+            rollup["timestamp"] = timestamp
+    return rollup
+
+
+def append_history(history: list, entries: list, session_id: str, max_entries: int = HISTORY_MAX_ENTRIES) -> list:
+    """
+    Appends entries to an interaction history, keeping it bounded.
+
+    The entries are also written to the history log. A history from before the log
+    existed is written to it first, so the log stays complete.
+
+    Args:
+        history (list): The interaction history in the session state.
+        entries (list): The new entries.
+        session_id (str): The session id, which names the log.
+        max_entries (int): Entries kept besides the rollup record, 0 to keep them all.
+
+    Returns:
+        list: The new interaction history, to store in the session state.
+    """
+    history = list(history or [])
+    if history_log.enabled and not history_log.exists(session_id):
+        history_log.append(session_id, [entry for entry in history if not is_rollup(entry)])
+    history_log.append(session_id, entries)
+
+    rollup = history.pop(0) if history and is_rollup(history[0]) else None
+    history.extend(entries)
+    if max_entries and len(history) > max_entries:
+        overflow = len(history) - max_entries
+        rollup = roll_up(rollup, history[:overflow])
+        history = history[overflow:]
+    return [rollup, *history] if rollup else history
+
+
+def chat_messages(history: list, skip: int = 0) -> list:
+    """
+    Builds chat messages from the user queries and agent responses of an interaction history.
+
+    Args:
+        history (list): An interaction history, bounded or read from the log.
+        skip (int): Entries at the start of the full history that are left out,
+            whether they are still in the history or already rolled up.
+
+    Returns:
+        list: Dicts with the role and content of each message.
+    """
+    rolled = history[0]["entries"] if history and is_rollup(history[0]) else 0
+    entries = [entry for entry in history if not is_rollup(entry)][max(0, skip - rolled):]
+    messages = []
+    for interaction in entries:
+        if interaction.get("action") == "user_query":
+            messages.append({"role": "user", "content": interaction.get("query")})
+        elif interaction.get("action") == "agent_response":
+            messages.append({"role": "assistant", "content": interaction.get("response")})
+    return messages
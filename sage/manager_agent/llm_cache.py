@@ -0,0 +1,239 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.genai import types
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Responses are kept for SAGE_LLM_CACHE_TTL_HOURS and the least recently used are
+# evicted once the database holds more than SAGE_LLM_CACHE_MAX_MB of responses.
+# SAGE_LLM_CACHE=0 disables the cache, SAGE_LLM_CACHE_BYPASS=1 always calls the
+# model but still refreshes the cached responses.
+LLM_CACHE_PATH = os.getenv("SAGE_LLM_CACHE_PATH", "./llm_cache.db")
+LLM_CACHE_TTL_SECONDS = float(os.getenv("SAGE_LLM_CACHE_TTL_HOURS", "168")) * 3600
+LLM_CACHE_MAX_BYTES = int(os.getenv("SAGE_LLM_CACHE_MAX_MB", "256")) * 1024 * 1024
+
+
+def request_key(model: str, prompt, **params) -> str:
+    """
+    Builds the cache key of an LLM request.
+
+    Args:
+        model (str): The model name.
+        prompt: The prompt text or chat messages.
+        **params: Any other parameter that changes the response.
+
+    Returns:
+        str: The hex encoded SHA-256 of the request.
+    """
+    payload = json.dumps({"model": model, "prompt": prompt, "params": params}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    SQLite cache of LLM responses for prompts fully determined by their input.
+
+    Lookups and stores are counted per stage, together with the latency the hits
+    saved, so the benefit of the cache shows up stage by stage.
+    """
+
+    def __init__(self, path: str, ttl_seconds: float, max_bytes: int, enabled: bool = True, bypass: bool = False):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.bypass = bypass
+        self._lock = threading.Lock()
+        self._connection = None
+        self._stats = {}
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY, stage TEXT, response TEXT, size INTEGER,"
+                " latency_s REAL, created_at REAL, last_used REAL)"
+            )
+            self._connection.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+            self._connection.commit()
+        return self._connection
+
+    def _count(self, stage: str, field: str, amount: float = 1) -> None:
+        stats = self._stats.setdefault(stage, {"hits": 0, "misses": 0, "stores": 0, "seconds_saved": 0.0})
+        stats[field] += amount
+
+    def get(self, key: str, stage: str):
+        """
+        Looks up a response.
+
+        Args:
+            key (str): The key from `request_key`.
+            stage (str): The stage sending the request, for the statistics.
+
+        Returns:
+            str | None: The cached response, or None on a miss.
+        """
+        if not self.enabled or self.bypass:
+            return None
+        now = time.time()
+        with self._lock:
+            connection = self._connect()
+            row = connection.execute(
+                "SELECT response, latency_s, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[2] > self.ttl_seconds:
+                self._count(stage, "misses")
+                return None
+            connection.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            connection.commit()
+            self._count(stage, "hits")
+            self._count(stage, "seconds_saved", row[1])
+        return row[0]
+
+    def put(self, key: str, stage: str, response: str, latency_s: float) -> None:
+        """
+        Stores a response, then drops expired entries and the least recently used ones over the size limit.
+
+        Args:
+            key (str): The key from `request_key`.
+            stage (str): The stage that sent the request.
+            response (str): The response text.
+            latency_s (float): How long the request took, used to report savings.
+        """
+        if not self.enabled or response is None:
+            return
+        now = time.time()
+        with self._lock:
+            connection = self._connect()
+            connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, stage, response, len(response.encode("utf-8")), round(latency_s, 3), now, now),
+            )
+            self._count(stage, "stores")
+            connection.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,))
+            total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total > self.max_bytes:
+                for entry_key, size in connection.execute(
+                    "SELECT key, size FROM responses ORDER BY last_used"
+                ).fetchall():
+                    if total <= self.max_bytes:
+                        break
+                    connection.execute("DELETE FROM responses WHERE key = ?", (entry_key,))
+                    total -= size
+            connection.commit()
+
+    def stats(self, stage: str = None) -> dict:
+        """Returns the hit/miss counters and the latency saved, for one stage or all of them."""
+        with self._lock:
+            stages = {name: dict(s) for name, s in self._stats.items()}
+        for stats in stages.values():
+            lookups = stats["hits"] + stats["misses"]
+            stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+            stats["seconds_saved"] = round(stats["seconds_saved"], 3)
+        return stages.get(stage, {}) if stage else stages
+
+    def log_stats(self, stage: str) -> None:
+        """Prints the running cache statistics of a stage."""
+        stats = self.stats(stage)
+        if self.enabled and stats:
+            print(f"LLM cache for {stage}: {stats['hits']}/{stats['hits'] + stats['misses']} hits "
+                  f"({stats['hit_rate']:.0%}), {stats['seconds_saved']:.1f}s saved")
+
+
+response_cache = ResponseCache(
+    path=LLM_CACHE_PATH,
+    ttl_seconds=LLM_CACHE_TTL_SECONDS,
+    max_bytes=LLM_CACHE_MAX_BYTES,
+    enabled=os.getenv("SAGE_LLM_CACHE", "1") != "0",
+    bypass=os.getenv("SAGE_LLM_CACHE_BYPASS", "0") == "1",
+)
+
+
+def cached_response(stage: str, model: str, prompt, call, **params) -> str:
+    """
+    Returns the cached response of a request, or calls the model and caches its response.
+
+    Args:
+        stage (str): The stage sending the request, e.g. "root_cause".
+        model (str): The model name.
+        prompt: The prompt text or chat messages.
+        call: A callable sending the request and returning the response text.
+        **params: Any other parameter that changes the response.
+
+    Returns:
+        str: The response text.
+    """
+    key = request_key(model, prompt, **params)
+    cached = response_cache.get(key, stage)
+    if cached is not None:
+        return cached
+    started = time.perf_counter()
+    response = call()
+    response_cache.put(key, stage, response, time.perf_counter() - started)
+    return response
+
+
+async def cached_response_async(stage: str, model: str, prompt, call, **params) -> str:
+    """Same as `cached_response`, for a coroutine function `call`."""
+    key = request_key(model, prompt, **params)
+    cached = response_cache.get(key, stage)
+    if cached is not None:
+        return cached
+    started = time.perf_counter()
+    response = await call()
+    response_cache.put(key, stage, response, time.perf_counter() - started)
+    return response
+
+
+def model_cache_callbacks(stage: str) -> tuple:
+    """
+    Builds before/after model callbacks answering an LLM agent's repeated requests from the cache.
+
+    The key covers the model, the system instruction and the conversation sent to
+    the model. Only plain text responses are cached.
+
+    Args:
+        stage (str): The stage the agent belongs to, e.g. "intent".
+
+    Returns:
+        tuple: (before_model_callback, after_model_callback) for the agent.
+    """
+    pending = {}
+
+    def before_model(callback_context: CallbackContext, llm_request: LlmRequest):
+        config = llm_request.config
+        key = request_key(
+            llm_request.model,
+            [content.model_dump(mode="json", exclude_none=True) for content in llm_request.contents],
+            system_instruction=str(config.system_instruction) if config else None,
+        )
+        cached = response_cache.get(key, stage)
+        if cached is not None:
+            response_cache.log_stats(stage)
+            return LlmResponse(content=types.Content(role="model", parts=[types.Part(text=cached)]))
+        pending[callback_context.invocation_id] = (key, time.perf_counter())
+        return None
+
+    def after_model(callback_context: CallbackContext, llm_response: LlmResponse):
+        entry = pending.pop(callback_context.invocation_id, None)
+        content = llm_response.content
+        if entry is None or llm_response.partial or not content or not content.parts:
+            return None
+        if all(part.text is not None for part in content.parts):
+            key, started = entry
+            response_cache.put(key, stage, "".join(part.text for part in content.parts), time.perf_counter() - started)
+            response_cache.log_stats(stage)
+        return None
+
+    return before_model, after_model
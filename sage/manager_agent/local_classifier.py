@@ -0,0 +1,135 @@
+import os
+import threading
+
+import joblib
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.pipeline import Pipeline
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Model files for each task; a task without a model file always goes to the LLM.
+CLASSIFIER_PATHS = {
+    "intent": os.getenv("SAGE_INTENT_CLASSIFIER_PATH", "./models/intent_classifier.joblib"),
+    "sentiment": os.getenv("SAGE_SENTIMENT_CLASSIFIER_PATH", "./models/sentiment_classifier.joblib"),
+}
+
+# Predictions below this confidence fall back to the LLM.
+CONFIDENCE_THRESHOLD = float(os.getenv("SAGE_CLASSIFIER_THRESHOLD", "0.7"))
+
+_classifiers = {}
+_lock = threading.Lock()
+
+
+class LocalClassifier:
+    """
+    TF-IDF + logistic regression classifier for closed-set labels such as intents and emotions.
+
+    Any object with the same `predict(texts)` method can be plugged in instead with
+    `set_classifier`.
+    """
+
+    def __init__(self, pipeline: Pipeline):
+        self.pipeline = pipeline
+
+    @classmethod
+    def train(cls, texts: list, labels: list) -> "LocalClassifier":
+        """
+        Trains a classifier on labelled transcripts.
+
+        Args:
+            texts (list): The transcript texts.
+            labels (list): The label of each text.
+
+        Returns:
+            LocalClassifier: The trained classifier.
+        """
+        pipeline = Pipeline([
+            ("tfidf", TfidfVectorizer(ngram_range=(1, 2), min_df=1, sublinear_tf=True)),
+            ("clf", LogisticRegression(max_iter=1000, class_weight="balanced")),
+        ])
+        pipeline.fit(texts, labels)
+        return cls(pipeline)
+
+    def predict(self, texts: list) -> list:
+        """
+        Classifies texts.
+
+        Args:
+            texts (list): The texts to classify.
+
+        Returns:
+            list: A (label, confidence) tuple for every text.
+        """
+        probabilities = self.pipeline.predict_proba(texts)
+        classes = self.pipeline.classes_
+        return [
+            (str(classes[row.argmax()]), float(row.max()))
+            for row in probabilities
+        ]
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        joblib.dump(self.pipeline, path)
+
+    @classmethod
+    def load(cls, path: str) -> "LocalClassifier":
+        return cls(joblib.load(path))
+
+
+def get_classifier(task: str):
+    """
+    Returns the classifier for a task, loading it from its model file on first use.
+
+    Args:
+        task (str): "intent" or "sentiment".
+
+    Returns:
+        The classifier, or None if no model is available for the task.
+    """
+    with _lock:
+        if task not in _classifiers:
+            path = CLASSIFIER_PATHS.get(task)
+            if path and os.path.exists(path):
+                print(f"Loading local {task} classifier from {path}")
+                _classifiers[task] = LocalClassifier.load(path)
+            else:
+                _classifiers[task] = None
+        return _classifiers[task]
+
+
+def set_classifier(task: str, classifier) -> None:
+    """
+    Plugs in a classifier for a task, or disables the task with None.
+
+    Args:
+        task (str): "intent" or "sentiment".
+        classifier: An object with a `predict(texts)` method returning (label, confidence) tuples.
+    """
+    with _lock:
+        _classifiers[task] = classifier
+
+
+def classify_confident(task: str, texts: list, allowed_labels: list = None) -> list:
+    """
+    Classifies texts locally, keeping only predictions the LLM does not need to check.
+
+    Args:
+        task (str): "intent" or "sentiment".
+        texts (list): The texts to classify.
+        allowed_labels (list): If given, predictions outside these labels are discarded.
+
+    Returns:
+        list: A (label, confidence) tuple for every text, or None where the LLM should decide.
+    """
+    classifier = get_classifier(task)
+    if classifier is None or not texts:
+        return [None] * len(texts)
+    predictions = []
+    for label, confidence in classifier.predict(texts):
+        if confidence < CONFIDENCE_THRESHOLD or (allowed_labels and label not in allowed_labels):
+            predictions.append(None)
+        else:
+            predictions.append((label, confidence))
+    return predictions
@@ -0,0 +1,209 @@
+import json
+import os
+import threading
+import time
+
+from google.adk.agents.callback_context import CallbackContext
+from google.genai import types
+from dotenv import load_dotenv
+
+from .blob_store import state_value
+from .sub_agents.audio_to_transcript_agent.transcript_cache import hash_audio
+from .sub_agents.sentiment_agent.agent import normalize_label
+
+load_dotenv()
+
+# Bump when a change to the analysis should invalidate the memoized results.
+PIPELINE_VERSION = "1"
+
+# State keys written by sage_workflow, restored together when an analysis is memoized.
+MEMO_KEYS = [
+    "audio_hash",
+    "is_audio_transcribed",
+    "transcript",
+    "call_metrics",
+    "intent_state",
+    "sentiment_state",
+    "sentiment_audio_hash",
+    "root_cause_state",
+    "compaction_report",
+    "analysis_report",
+]
+
+
+class AnalysisMemo:
+    """
+    On-disk memo of finished analyses, keyed by audio hash and pipeline version, with LRU eviction.
+
+    Every entry is a JSON file holding the MEMO_KEYS of the session state the
+    analysis produced. Reading an entry refreshes its modification time, and the
+    least recently used entries are evicted once the directory grows over `max_bytes`.
+    """
+
+    def __init__(self, memo_dir: str, max_bytes: int, enabled: bool = True):
+        self.memo_dir = memo_dir
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self._lock = threading.Lock()
+
+    def _entry_path(self, audio_hash: str) -> str:
+        return os.path.join(self.memo_dir, f"{audio_hash}.v{PIPELINE_VERSION}.json")
+
+    def get(self, audio_hash: str):
+        """
+        Looks up the analysis of a recording.
+
+        Args:
+            audio_hash (str): The content hash of the audio file.
+
+        Returns:
+            dict | None: The memoized state keys, or None if the recording was not analyzed yet.
+        """
+        if not self.enabled:
+            return None
+        path = self._entry_path(audio_hash)
+        with self._lock:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    state = json.load(f)["state"]
+                os.utime(path)
+            except (FileNotFoundError, json.JSONDecodeError, KeyError):
+                return None
+        return state
+
+    def put(self, audio_hash: str, state: dict) -> None:
+        """
+        Stores the analysis of a recording.
+
+        Args:
+            audio_hash (str): The content hash of the audio file.
+            state (dict): The state keys to memoize.
+        """
+        if not self.enabled:
+            return
+        entry = {"pipeline_version": PIPELINE_VERSION, "created_at": time.time(), "state": state}
+        with self._lock:
+            os.makedirs(self.memo_dir, exist_ok=True)
+            path = self._entry_path(audio_hash)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entry, f, default=str)
+            os.replace(tmp_path, path)
+            self._evict()
+
+    def _evict(self) -> None:
+        entries = []
+        total = 0
+        for name in os.listdir(self.memo_dir):
+            if not name.endswith(".json"):
+                continue
+            stat = os.stat(os.path.join(self.memo_dir, name))
+            entries.append((stat.st_mtime, stat.st_size, name))
+            total += stat.st_size
+
+        entries.sort()
+        for _, size, name in entries:
+            if total <= self.max_bytes:
+                break
+            os.remove(os.path.join(self.memo_dir, name))
+            total -= size
+
+
+analysis_memo = AnalysisMemo(
+    memo_dir=os.getenv("SAGE_ANALYSIS_MEMO_DIR", "./analysis_memo"),
+    max_bytes=int(os.getenv("SAGE_ANALYSIS_MEMO_MAX_MB", "512")) * 1024 * 1024,
+    enabled=os.getenv("SAGE_ANALYSIS_MEMO", "1") != "0",
+)
+
+
+def analysis_succeeded(state) -> bool:
+    """
+    Tells whether every stage of an analysis produced a real result.
+
+    A stage that failed leaves an 'error' key, an empty value or, for sentiment,
+    minutes that fell back to a label outside EMOTION_LABELS. Such an analysis is
+    not memoized, so one transient failure is not restored in every later session.
+    """
+    if not state_value(state, "transcript") or not state.get("intent_state"):
+        return False
+    root_cause = state.get("root_cause_state")
+    if not isinstance(root_cause, dict) or "error" in root_cause:
+        return False
+    sentiment = state_value(state, "sentiment_state")
+    if not isinstance(sentiment, dict) or "error" in sentiment or not sentiment.get("timeline"):
+        return False
+    return all(normalize_label(entry.get("label")) for entry in sentiment["timeline"])
+
+
+def completion_marker(audio_hash: str, audio_filepath: str) -> dict:
+    """Builds the 'analysis_complete' state value for a finished analysis."""
+    return {
+        "audio_hash": audio_hash,
+        "audio_filepath": audio_filepath,
+        "pipeline_version": PIPELINE_VERSION,
+        "completed_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+
+
+def skip_completed_analysis(callback_context: CallbackContext):
+    """
+    Skips sage_workflow when the recording in the state was already analyzed.
+
+    The session's own completion marker is checked first. Otherwise the recording
+    is hashed and looked up in the memo, and a hit is restored into the state, so a
+    recording analyzed in another session is not analyzed again.
+
+    Returns:
+        types.Content | None: The analysis report, which skips the workflow, or None to run it.
+    """
+    state = callback_context.state
+    audio_filepath = state.get("audio_filepath")
+    if not audio_filepath:
+        return None
+
+    marker = state.get("analysis_complete")
+    if (
+        isinstance(marker, dict)
+        and marker.get("audio_filepath") == audio_filepath
+        and marker.get("pipeline_version") == PIPELINE_VERSION
+        and state.get("analysis_report")
+    ):
+        print(f"Analysis of {audio_filepath} already completed, skipping the workflow.")
+        return types.Content(role="model", parts=[types.Part(text=state_value(state, "analysis_report"))])
+
+    try:
+        audio_hash = hash_audio(audio_filepath)
+    except OSError:
+        return None
+    memoized = analysis_memo.get(audio_hash)
+    if not memoized or not memoized.get("analysis_report"):
+        # Clear the results of an earlier recording, so they cannot be memoized under this one.
+        if state.get("analysis_report") or state.get("analysis_complete"):
+            state["analysis_report"] = None
+            state["analysis_complete"] = None
+        return None
+
+    print(f"Restoring the memoized analysis of {audio_filepath} ({audio_hash[:12]}).")
+    for key, value in memoized.items():
+        state[key] = value
+    state["analysis_complete"] = completion_marker(audio_hash, audio_filepath)
+    return types.Content(role="model", parts=[types.Part(text=memoized["analysis_report"])])
+
+
+def record_completed_analysis(callback_context: CallbackContext):
+    """
+    Marks the analysis as complete in the state once sage_workflow produced a report.
+
+    The analysis is memoized only if every stage succeeded.
+    """
+    state = callback_context.state
+    audio_hash = state.get("audio_hash")
+    if not state.get("analysis_report") or not audio_hash:
+        return None
+    if analysis_succeeded(state):
+        # Blob references are resolved, so the memo does not depend on the session blob store.
+        analysis_memo.put(audio_hash, {key: state_value(state, key) for key in MEMO_KEYS})
+    else:
+        print(f"Analysis of {audio_hash[:12]} had a failed stage, not memoizing it.")
+    state["analysis_complete"] = completion_marker(audio_hash, state.get("audio_filepath"))
+    return None
@@ -0,0 +1,126 @@
+import asyncio
+import inspect
+import os
+from typing import AsyncGenerator, Callable, Optional
+
+from google.adk.agents import BaseAgent
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.events import Event, EventActions
+from google.adk.tools.tool_context import ToolContext
+from google.genai import types
+from dotenv import load_dotenv
+
+from .blob_store import state_value
+from .columnar import columnar_for
+from .stages import stage_semaphore
+from .sub_agents.audio_to_transcript_agent.agent import transcribe_recording
+from .sub_agents.sentiment_agent.agent import IncrementalSentiment
+
+load_dotenv()
+
+# "sequential" transcribes the whole call before any analysis starts, "incremental"
+# scores the sentiment of every finished minute while the rest is still being transcribed.
+PIPELINE_MODE = os.getenv("SAGE_PIPELINE_MODE", "sequential")
+
+# "agents" lets an LLM agent decide to call each stage's tool, "tools" calls the
+# tools directly as workflow steps. Either way the same state keys are written.
+WORKFLOW_MODE = os.getenv("SAGE_WORKFLOW_MODE", "agents")
+
+
+class ToolStepAgent(BaseAgent):
+    """
+    Runs one tool as a workflow step, without an LLM round trip to select it.
+
+    The tool gets a regular ToolContext, so its state writes reach the session
+    through the step's event exactly as they would through a function response.
+    The event text is the value the tool stored under `output_key`, or its error.
+    """
+
+    tool: Callable
+    output_key: Optional[str] = None
+
+    async def _run_async_impl(self, ctx: InvocationContext) -> AsyncGenerator[Event, None]:
+        tool_context = ToolContext(ctx)
+        result = self.tool(tool_context)
+        if inspect.isawaitable(result):
+            result = await result
+        if isinstance(result, dict) and result.get("error"):
+            text = f"error: {result['error']}"
+        elif self.output_key:
+            text = str(state_value(tool_context.state, self.output_key))
+        else:
+            text = f"{self.tool.__name__} finished."
+        yield Event(
+            invocation_id=ctx.invocation_id,
+            author=self.name,
+            branch=ctx.branch,
+            content=types.Content(role="model", parts=[types.Part(text=text)]),
+            actions=tool_context.actions,
+        )
+
+
+class IncrementalTranscriptionAgent(BaseAgent):
+    """
+    Transcribes the call and scores its sentiment while the transcript arrives.
+
+    Every completed minute is scored as soon as its segments are final (window by
+    window for streamed recordings). While that happens only the progress is
+    published, under 'transcription_progress'; the transcript itself is written to
+    the state once, when transcription ends, since the session stores every state
+    delta. By then 'sentiment_state' only waits for the last minute, and the agents
+    that need the whole call (intent, root cause, synthesis) run on the final transcript.
+    """
+
+    async def _run_async_impl(self, ctx: InvocationContext) -> AsyncGenerator[Event, None]:
+        audio_filepath = ctx.session.state.get("audio_filepath")
+        if not audio_filepath:
+            raise Exception("error: Audio filepath not found in state. Stopping workflow.")
+
+        loop = asyncio.get_running_loop()
+        arrivals = asyncio.Queue()
+        sentiment = IncrementalSentiment()
+        transcript = []
+
+        def on_segments(segments):
+            # Called from the transcription thread.
+            loop.call_soon_threadsafe(arrivals.put_nowait, segments)
+
+        async with stage_semaphore("transcription"):
+            job = asyncio.create_task(asyncio.to_thread(transcribe_recording, audio_filepath, on_segments))
+            job.add_done_callback(lambda _: arrivals.put_nowait(None))
+            while (segments := await arrivals.get()) is not None:
+                if not segments:
+                    continue
+                transcript.extend(segments)
+                sentiment.add(segments)
+                progress = {"segments": len(transcript), "until_s": round(float(transcript[-1][1]), 2)}
+                yield self._event(ctx, state_delta={"transcription_progress": progress})
+
+        try:
+            transcript, audio_hash = job.result()
+        except Exception as e:
+            sentiment.cancel()
+            yield self._event(ctx, f"An error occurred during transcription: {e}")
+            return
+
+        state_delta = {
+            "audio_hash": audio_hash,
+            "is_audio_transcribed": True,
+            "transcript": transcript,
+            "call_metrics": columnar_for(transcript).metrics(),
+        }
+        if transcript:
+            state_delta["sentiment_state"] = await sentiment.finish()
+            state_delta["sentiment_audio_hash"] = audio_hash
+        yield self._event(
+            ctx, f"Transcribed {len(transcript)} segments and scored their sentiment.", state_delta
+        )
+
+    def _event(self, ctx: InvocationContext, text: str = None, state_delta: dict = None) -> Event:
+        return Event(
+            invocation_id=ctx.invocation_id,
+            author=self.name,
+            branch=ctx.branch,
+            content=types.Content(role="model", parts=[types.Part(text=text)]) if text else None,
+            actions=EventActions(state_delta=state_delta or {}),
+        )
@@ -0,0 +1,380 @@
+import asyncio
+import contextlib
+import contextvars
+import os
+import random
+import threading
+import time
+
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models.llm_request import LlmRequest
+from dotenv import load_dotenv
+
+from .compaction import estimate_tokens
+from .tracing import span, usage_attributes
+
+load_dotenv()
+
+# Requests waiting for the same model are served in this order.
+PRIORITIES = ("interactive", "batch")
+
+# (requests per minute, tokens per minute) per provider/model; 0 tokens means no token limit.
+# Override with SAGE_RATE_LIMITS="openai/gpt-4o=500:30000,gemini/gemma-3-27b-it=30:15000"
+DEFAULT_RATE_LIMITS = {
+    "openai/gpt-4o": (500, 30000),
+    "openai/gpt-4o-transcribe-diarize": (500, 0),
+    "gemini/gemma-3-27b-it": (30, 15000),
+    "gemini/gemini-2.0-flash": (2000, 4000000),
+}
+
+RATE_LIMIT_ENABLED = os.getenv("SAGE_RATE_LIMIT", "1") != "0"
+RATE_LIMIT_MAX_RETRIES = int(os.getenv("SAGE_RATE_LIMIT_MAX_RETRIES", "5"))
+RATE_LIMIT_BACKOFF_SECONDS = float(os.getenv("SAGE_RATE_LIMIT_BACKOFF_SECONDS", "2.0"))
+RATE_LIMIT_MAX_BACKOFF_SECONDS = 60.0
+# Timeouts, dropped connections and 5xx responses (and 429s of models without a
+# limiter) are retried here with exponential backoff and jitter. The client
+# libraries do not retry on their own, so a request is never retried by two layers.
+HTTP_MAX_RETRIES = int(os.getenv("SAGE_HTTP_MAX_RETRIES", "2"))
+HTTP_BACKOFF_SECONDS = float(os.getenv("SAGE_HTTP_BACKOFF_SECONDS", "1.0"))
+TRANSIENT_STATUS_CODES = {408, 409, 500, 502, 503, 504}
+TRANSIENT_ERRORS = (
+    "APIConnectionError", "APITimeoutError", "Timeout", "ConnectionError", "ConnectTimeout", "ReadTimeout",
+    "InternalServerError", "ServiceUnavailableError", "ServiceUnavailable", "DeadlineExceeded",
+)
+# A 429 halves the rate of a model, every success gives back this share of the configured rate.
+MIN_RATE_SCALE = 0.1
+RATE_RECOVERY_STEP = 0.05
+
+_priority = contextvars.ContextVar("sage_request_priority", default="batch")
+
+
+def parse_rate_limits(spec: str) -> dict:
+    """
+    Parses a "model=rpm:tpm,model=rpm:tpm" string into a dictionary.
+
+    Args:
+        spec (str): The comma separated rate limits. The token limit may be left out.
+
+    Returns:
+        dict: A mapping of provider/model to (requests per minute, tokens per minute).
+    """
+    limits = {}
+    for item in (spec or "").split(","):
+        if not item.strip():
+            continue
+        name, _, value = item.partition("=")
+        rpm, _, tpm = value.partition(":")
+        limits[name.strip()] = (max(1, int(rpm)), max(0, int(tpm or 0)))
+    return limits
+
+
+def model_key(model: str) -> str:
+    """Maps a model name onto its rate limit key, e.g. "models/gemma-3-27b-it" -> "gemini/gemma-3-27b-it"."""
+    model = model.removeprefix("models/")
+    if "/" in model:
+        return model
+    if model.startswith(("gemini", "gemma")):
+        return f"gemini/{model}"
+    return f"openai/{model}"
+
+
+class RateLimiter:
+    """
+    Token buckets for the requests and tokens per minute of one provider/model.
+
+    Both buckets start full and refill continuously. A waiting request only takes
+    capacity when no request of a higher priority is waiting. A 429 response drains
+    the buckets, halves the refill rate and pauses every caller for a backoff that
+    grows with consecutive 429s; successful requests restore the rate step by step.
+    """
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.scale = 1.0
+        self._lock = threading.Lock()
+        self._requests = float(requests_per_minute)
+        self._tokens = float(tokens_per_minute)
+        self._updated = time.monotonic()
+        self._cooldown_until = 0.0
+        self._strikes = 0
+        self._waiting = {priority: 0 for priority in PRIORITIES}
+        self._stats = {"requests": 0, "rate_limited": 0, "waited_s": 0.0}
+
+    def _refill(self, now: float) -> None:
+        minutes = (now - self._updated) / 60 * self.scale
+        self._updated = now
+        self._requests = min(self.requests_per_minute, self._requests + minutes * self.requests_per_minute)
+        self._tokens = min(self.tokens_per_minute, self._tokens + minutes * self.tokens_per_minute)
+
+    def _reserve(self, tokens: int, priority: str) -> float:
+        """Takes the capacity of one request and returns 0, or returns how long to wait before trying again."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if now < self._cooldown_until:
+                return self._cooldown_until - now
+            if any(self._waiting[p] for p in PRIORITIES[:PRIORITIES.index(priority)]):
+                return 0.05
+            tokens = min(tokens, self.tokens_per_minute)
+            if self._requests >= 1 and self._tokens >= tokens:
+                self._requests -= 1
+                self._tokens -= tokens
+                self._stats["requests"] += 1
+                return 0.0
+            waits = [(1 - self._requests) / self.requests_per_minute]
+            if self.tokens_per_minute:
+                waits.append((tokens - self._tokens) / self.tokens_per_minute)
+            return max(0.01, max(waits) * 60 / self.scale)
+
+    def _enter(self, priority: str) -> float:
+        with self._lock:
+            self._waiting[priority] += 1
+        return time.monotonic()
+
+    def _leave(self, priority: str, started: float) -> None:
+        with self._lock:
+            self._waiting[priority] -= 1
+            self._stats["waited_s"] += time.monotonic() - started
+
+    def acquire(self, tokens: int = 0, priority: str = None) -> None:
+        """Blocks until a request of about `tokens` tokens may be sent."""
+        priority = priority or current_priority()
+        started = self._enter(priority)
+        try:
+            while (delay := self._reserve(tokens, priority)) > 0:
+                time.sleep(min(delay, 1.0))
+        finally:
+            self._leave(priority, started)
+
+    async def acquire_async(self, tokens: int = 0, priority: str = None) -> None:
+        """Same as `acquire`, without blocking the event loop."""
+        priority = priority or current_priority()
+        started = self._enter(priority)
+        try:
+            while (delay := self._reserve(tokens, priority)) > 0:
+                await asyncio.sleep(min(delay, 1.0))
+        finally:
+            self._leave(priority, started)
+
+    def rate_limited(self, retry_after: float = None) -> float:
+        """
+        Records a 429 response and pauses the model.
+
+        Args:
+            retry_after (float): The delay asked for by the provider, if any.
+
+        Returns:
+            float: How long the model is paused, in seconds.
+        """
+        with self._lock:
+            self._strikes += 1
+            self._stats["rate_limited"] += 1
+            self.scale = max(MIN_RATE_SCALE, self.scale / 2)
+            self._requests = self._tokens = 0.0
+            backoff = min(RATE_LIMIT_BACKOFF_SECONDS * 2 ** (self._strikes - 1), RATE_LIMIT_MAX_BACKOFF_SECONDS)
+            delay = max(retry_after or 0.0, backoff + random.uniform(0, backoff))
+            self._cooldown_until = max(self._cooldown_until, time.monotonic() + delay)
+            return delay
+
+    def succeeded(self) -> None:
+        """Records a successful request, which gives back part of the rate taken by earlier 429s."""
+        with self._lock:
+            self._strikes = 0
+            self.scale = min(1.0, self.scale + RATE_RECOVERY_STEP)
+
+    def stats(self) -> dict:
+        """Returns the requests sent, the 429s received, the time spent waiting and the current rate scale."""
+        with self._lock:
+            return dict(self._stats, waited_s=round(self._stats["waited_s"], 3), rate_scale=round(self.scale, 2))
+
+
+_rate_limits = dict(DEFAULT_RATE_LIMITS)
+_rate_limits.update(parse_rate_limits(os.getenv("SAGE_RATE_LIMITS", "")))
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def rate_limiter(model: str):
+    """
+    Returns the process-wide limiter of a model.
+
+    Returns:
+        RateLimiter | None: The limiter, or None if the model has no configured limit
+        or rate limiting is disabled.
+    """
+    key = model_key(model)
+    if not RATE_LIMIT_ENABLED or key not in _rate_limits:
+        return None
+    with _limiters_lock:
+        if key not in _limiters:
+            _limiters[key] = RateLimiter(*_rate_limits[key])
+        return _limiters[key]
+
+
+def rate_limit_stats() -> dict:
+    """Returns the statistics of every limiter used so far, by provider/model."""
+    with _limiters_lock:
+        limiters = dict(_limiters)
+    return {key: limiter.stats() for key, limiter in limiters.items()}
+
+
+def current_priority() -> str:
+    """Returns the priority class of the requests sent from the current context."""
+    return _priority.get()
+
+
+@contextlib.contextmanager
+def request_priority(priority: str):
+    """
+    Sends the requests made inside the block, and the tasks and threads it starts, with a priority class.
+
+    Args:
+        priority (str): One of PRIORITIES.
+    """
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unknown priority {priority!r}, expected one of {PRIORITIES}")
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """Tells whether an OpenAI, LiteLLM or Google API error is a 429 response."""
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    return status == 429 or type(error).__name__ in ("RateLimitError", "ResourceExhausted", "TooManyRequests")
+
+
+def is_transient_error(error: Exception) -> bool:
+    """Tells whether an error is a timeout, a dropped connection or a 5xx response, which may succeed when sent again."""
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    return status in TRANSIENT_STATUS_CODES or type(error).__name__ in TRANSIENT_ERRORS
+
+
+def retry_after_seconds(error: Exception):
+    """Returns the Retry-After delay of a 429 response in seconds, or None if it has none."""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    try:
+        return float(headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def _backing_off(model: str, limiter: RateLimiter, error: Exception) -> None:
+    delay = limiter.rate_limited(retry_after_seconds(error))
+    print(f"Rate limited by {model_key(model)}, pausing {delay:.1f}s "
+          f"and sending at {limiter.scale:.0%} of the configured rate")
+
+
+def scheduled_call(model: str, call, tokens: int = 0):
+    """
+    Sends a request once the rate limits of its model allow it, retrying it after 429s and transient errors.
+
+    The request is recorded as an "llm" span of the current trace, with its token usage.
+
+    Args:
+        model (str): The model name, e.g. "gpt-4o" or "models/gemma-3-27b-it".
+        call: A callable sending the request.
+        tokens (int): The estimated tokens of the request.
+
+    Returns:
+        The result of `call`.
+    """
+    with span(model_key(model), "llm", estimated_tokens=tokens or None) as opened:
+        result = _send_with_retries(model, rate_limiter(model), call, tokens, opened)
+        opened.set(**usage_attributes(result))
+        return result
+
+
+def _retry_delay(model: str, limiter, error: Exception, attempts: dict, opened):
+    """
+    Decides whether a failed request is sent again.
+
+    Returns:
+        float | None: The seconds to sleep before sending it again (the limiter
+        holds back rate limited requests itself), or None to give up.
+    """
+    if limiter is not None and is_rate_limit_error(error):
+        if attempts["rate_limited"] == RATE_LIMIT_MAX_RETRIES:
+            return None
+        attempts["rate_limited"] += 1
+        opened.set(rate_limited=attempts["rate_limited"])
+        _backing_off(model, limiter, error)
+        return 0.0
+    if is_transient_error(error) or is_rate_limit_error(error):
+        if attempts["failed"] == HTTP_MAX_RETRIES:
+            return None
+        attempts["failed"] += 1
+        opened.set(retries=attempts["failed"])
+        delay = min(HTTP_BACKOFF_SECONDS * 2 ** (attempts["failed"] - 1), RATE_LIMIT_MAX_BACKOFF_SECONDS)
+        print(f"{model_key(model)} request failed ({error}), retrying in about {delay:.1f}s")
+        return delay + random.uniform(0, delay)
+    return None
+
+
+def _send_with_retries(model: str, limiter, call, tokens: int, opened):
+    attempts = {"rate_limited": 0, "failed": 0}
+    while True:
+        if limiter is not None:
+            limiter.acquire(tokens)
+        try:
+            result = call()
+        except Exception as e:
+            delay = _retry_delay(model, limiter, e, attempts, opened)
+            if delay is None:
+                raise
+            time.sleep(delay)
+            continue
+        if limiter is not None:
+            limiter.succeeded()
+        return result
+
+
+async def scheduled_call_async(model: str, call, tokens: int = 0):
+    """Same as `scheduled_call`, for a coroutine function `call`."""
+    with span(model_key(model), "llm", estimated_tokens=tokens or None) as opened:
+        result = await _send_with_retries_async(model, rate_limiter(model), call, tokens, opened)
+        opened.set(**usage_attributes(result))
+        return result
+
+
+async def _send_with_retries_async(model: str, limiter, call, tokens: int, opened):
+    attempts = {"rate_limited": 0, "failed": 0}
+    while True:
+        if limiter is not None:
+            await limiter.acquire_async(tokens)
+        try:
+            result = await call()
+        except Exception as e:
+            delay = _retry_delay(model, limiter, e, attempts, opened)
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
+            continue
+        if limiter is not None:
+            limiter.succeeded()
+        return result
+
+
+async def wait_for_rate_limit(callback_context: CallbackContext, llm_request: LlmRequest):
+    """before_model_callback holding an LLM agent's request until the limits of its model allow it."""
+    limiter = rate_limiter(llm_request.model or "")
+    if limiter is not None:
+        text = "".join(
+            part.text or "" for content in llm_request.contents for part in (content.parts or [])
+        )
+        config = llm_request.config
+        await limiter.acquire_async(estimate_tokens(text + str(config.system_instruction if config else "")))
+    return None
+
+
+def record_model_error(callback_context: CallbackContext, llm_request: LlmRequest, error: Exception):
+    """on_model_error_callback pausing the model of an LLM agent request that got a 429 response."""
+    limiter = rate_limiter(llm_request.model or "")
+    if limiter is not None and is_rate_limit_error(error):
+        _backing_off(llm_request.model, limiter, error)
+    return None
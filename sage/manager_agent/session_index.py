@@ -0,0 +1,222 @@
+import functools
+import os
+import sqlite3
+import threading
+import time
+
+from dotenv import load_dotenv
+
+from .blob_store import state_value
+
+load_dotenv()
+
+# One row per session with the few fields the session list shows, kept up to date
+# as events are appended, so listing sessions never loads their state.
+SESSION_INDEX_PATH = os.getenv("SAGE_SESSION_INDEX_PATH", "./session_index.db")
+SESSION_INDEX_ENABLED = os.getenv("SAGE_SESSION_INDEX", "1") != "0"
+
+# Index column -> session state key it is read from.
+INDEXED_KEYS = {
+    "audio_filepath": "audio_filepath",
+    "audio_hash": "audio_hash",
+    "intent": "intent_state",
+    "sentiment": "sentiment_state",
+    "report_ready": "analysis_report",
+}
+
+
+def index_fields(state: dict) -> dict:
+    """
+    Extracts the indexed fields from a session state or state delta.
+
+    Only the keys present are returned, so a delta updates the columns it changes.
+    """
+    fields = {}
+    for column, key in INDEXED_KEYS.items():
+        if key not in state:
+            continue
+        value = state[key]
+        if column == "report_ready":
+            value = int(bool(value))
+        elif column == "sentiment":
+            sentiment = state_value(state, key)
+            value = sentiment.get("sentiment_overall") if isinstance(sentiment, dict) else None
+        elif column == "intent":
+            value = str(value).strip().strip('"') if value else None
+        fields[column] = value
+    if "audio_filepath" in fields:
+        fields["filename"] = os.path.basename(fields["audio_filepath"]) if fields["audio_filepath"] else None
+    return fields
+
+
+class SessionIndex:
+    """
+    SQLite index of the sessions of every app and user, for paging and searching them.
+
+    Pages are read with an index on (app, user, report ready, creation time), so a
+    page costs the same however many sessions there are.
+    """
+
+    def __init__(self, path: str, enabled: bool = True):
+        self.path = path
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._connection = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.row_factory = sqlite3.Row
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                " app_name TEXT, user_id TEXT, session_id TEXT, filename TEXT, audio_filepath TEXT,"
+                " audio_hash TEXT, intent TEXT, sentiment TEXT, report_ready INTEGER DEFAULT 0,"
+                " created_at REAL, updated_at REAL, PRIMARY KEY (app_name, user_id, session_id))"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS sessions_listing"
+                " ON sessions (app_name, user_id, report_ready, created_at DESC)"
+            )
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS backfills (app_name TEXT, user_id TEXT, done_at REAL,"
+                " PRIMARY KEY (app_name, user_id))"
+            )
+            self._connection.commit()
+        return self._connection
+
+    def update(self, app_name: str, user_id: str, session_id: str, fields: dict, created_at: float = None) -> None:
+        """
+        Creates or updates the row of a session.
+
+        Args:
+            app_name (str): The app name.
+            user_id (str): The user id.
+            session_id (str): The session id.
+            fields (dict): The columns to set, from `index_fields`.
+            created_at (float): The creation time, only used when the row is created.
+        """
+        if not self.enabled:
+            return
+        now = time.time()
+        columns = [column for column in fields if column in INDEXED_KEYS or column == "filename"]
+        with self._lock:
+            connection = self._connect()
+            connection.execute(
+                "INSERT OR IGNORE INTO sessions (app_name, user_id, session_id, created_at, updated_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (app_name, user_id, session_id, created_at or now, now),
+            )
+            connection.execute(
+                f"UPDATE sessions SET {''.join(f'{column} = ?, ' for column in columns)}updated_at = ?"
+                " WHERE app_name = ? AND user_id = ? AND session_id = ?",
+                (*(fields[column] for column in columns), now, app_name, user_id, session_id),
+            )
+            connection.commit()
+
+    def page(self, app_name: str, user_id: str, search: str = "", page: int = 0, page_size: int = 12,
+             report_ready: bool = True):
+        """
+        Reads one page of sessions, newest first.
+
+        Args:
+            app_name (str): The app name.
+            user_id (str): The user id.
+            search (str): Matched against the file name, intent and sentiment.
+            page (int): The page number, from 0.
+            page_size (int): Sessions per page.
+            report_ready (bool): Whether only sessions with a finished report are listed.
+
+        Returns:
+            tuple: The session rows as dicts, and the number of matching sessions.
+        """
+        if not self.enabled:
+            return [], 0
+        where = "app_name = ? AND user_id = ?"
+        params = [app_name, user_id]
+        if report_ready:
+            where += " AND report_ready = 1"
+        if search.strip():
+            where += " AND (filename LIKE ? OR intent LIKE ? OR sentiment LIKE ?)"
+            params.extend([f"%{search.strip()}%"] * 3)
+        with self._lock:
+            connection = self._connect()
+            total = connection.execute(f"SELECT COUNT(*) FROM sessions WHERE {where}", params).fetchone()[0]
+            rows = connection.execute(
+                f"SELECT * FROM sessions WHERE {where} ORDER BY created_at DESC LIMIT ? OFFSET ?",
+                (*params, page_size, page * page_size),
+            ).fetchall()
+        return [dict(row) for row in rows], total
+
+    def needs_backfill(self, app_name: str, user_id: str) -> bool:
+        """Tells whether the sessions written before the index existed still have to be indexed."""
+        if not self.enabled:
+            return False
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT 1 FROM backfills WHERE app_name = ? AND user_id = ?", (app_name, user_id)
+            ).fetchone()
+        return row is None
+
+    def mark_backfilled(self, app_name: str, user_id: str) -> None:
+        with self._lock:
+            connection = self._connect()
+            connection.execute("INSERT OR REPLACE INTO backfills VALUES (?, ?, ?)", (app_name, user_id, time.time()))
+            connection.commit()
+
+
+session_index = SessionIndex(path=SESSION_INDEX_PATH, enabled=SESSION_INDEX_ENABLED)
+
+
+async def backfill_session_index(service, app_name: str, user_id: str) -> int:
+    """
+    Indexes the sessions of a user written before the index existed.
+
+    This loads every session once, which the index then spares on later runs.
+
+    Returns:
+        int: The number of sessions indexed.
+    """
+    listed = await service.list_sessions(app_name=app_name, user_id=user_id)
+    for session in listed.sessions:
+        session_index.update(
+            app_name, user_id, session.id, index_fields(session.state), created_at=session.last_update_time
+        )
+    session_index.mark_backfilled(app_name, user_id)
+    return len(listed.sessions)
+
+
+def index_sessions(service):
+    """
+    Keeps the session index up to date with the sessions a session service writes.
+
+    Args:
+        service: A BaseSessionService, changed in place.
+
+    Returns:
+        The same service.
+    """
+    create_session = service.create_session
+    append_event = service.append_event
+
+    @functools.wraps(create_session)
+    async def create_session_indexed(*args, **kwargs):
+        fields = index_fields(kwargs.get("state") or {})
+        session = await create_session(*args, **kwargs)
+        session_index.update(
+            session.app_name, session.user_id, session.id, fields, created_at=session.last_update_time
+        )
+        return session
+
+    @functools.wraps(append_event)
+    async def append_event_indexed(session, event):
+        # Read before the event is stored, while the delta still holds the values rather than blob references.
+        fields = index_fields(event.actions.state_delta) if event.actions and event.actions.state_delta else {}
+        result = await append_event(session, event)
+        if fields and not event.partial:
+            session_index.update(session.app_name, session.user_id, session.id, fields)
+        return result
+
+    service.create_session = create_session_indexed
+    service.append_event = append_event_indexed
+    return service
@@ -0,0 +1,95 @@
+import asyncio
+import functools
+import inspect
+import os
+import weakref
+
+# Default number of calls allowed inside each stage at the same time, per process.
+# Override with SAGE_STAGE_LIMITS="transcription=4,sentiment=8,root_cause=8,synthesis=8"
+DEFAULT_STAGE_LIMITS = {
+    "transcription": 4,
+    "sentiment": 8,
+    "root_cause": 8,
+    "synthesis": 8,
+}
+
+_stage_limits = dict(DEFAULT_STAGE_LIMITS)
+_loop_semaphores = weakref.WeakKeyDictionary()
+
+
+def parse_stage_limits(spec: str) -> dict:
+    """
+    Parses a "stage=limit,stage=limit" string into a dictionary.
+
+    Args:
+        spec (str): The comma separated stage limits.
+
+    Returns:
+        dict: A mapping of stage name to its concurrency limit.
+    """
+    limits = {}
+    for item in (spec or "").split(","):
+        if not item.strip():
+            continue
+        name, _, value = item.partition("=")
+        limits[name.strip()] = max(1, int(value))
+    return limits
+
+
+def configure_stage_limits(limits: dict) -> None:
+    """
+    Updates the per-stage concurrency limits.
+
+    Limits take effect for event loops that have not used the stage yet, so this
+    should be called before the workflow starts running.
+
+    Args:
+        limits (dict): A mapping of stage name to its concurrency limit.
+    """
+    _stage_limits.update({name: max(1, int(value)) for name, value in limits.items()})
+    _loop_semaphores.clear()
+
+
+def get_stage_limits() -> dict:
+    """Returns a copy of the current per-stage concurrency limits."""
+    return dict(_stage_limits)
+
+
+def stage_semaphore(name: str) -> asyncio.Semaphore:
+    """Returns the semaphore limiting a stage on the running event loop, for work that is not a tool."""
+    # asyncio semaphores are bound to the loop they are first used on, and the
+    # Streamlit app calls asyncio.run() on every rerun, so keep one set per loop.
+    loop = asyncio.get_running_loop()
+    semaphores = _loop_semaphores.setdefault(loop, {})
+    if name not in semaphores:
+        semaphores[name] = asyncio.Semaphore(_stage_limits.get(name, DEFAULT_STAGE_LIMITS.get(name, 8)))
+    return semaphores[name]
+
+
+def stage(name: str):
+    """
+    Decorates a tool function so it runs under the concurrency limit of a stage.
+
+    Synchronous tools are moved to a worker thread so that a long transcription or
+    LLM call does not block the event loop shared by concurrent sessions.
+
+    Args:
+        name (str): The stage name, e.g. "transcription" or "sentiment".
+    """
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                async with stage_semaphore(name):
+                    return await func(*args, **kwargs)
+        else:
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                async with stage_semaphore(name):
+                    return await asyncio.to_thread(func, *args, **kwargs)
+        wrapper.stage_name = name
+        return wrapper
+    return decorator
+
+
+configure_stage_limits(parse_stage_limits(os.getenv("SAGE_STAGE_LIMITS", "")))
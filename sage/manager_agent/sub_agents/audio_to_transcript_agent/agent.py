@@ -1,20 +1,114 @@
 from google.adk.agents import Agent
 from google.adk.models.lite_llm import LiteLlm
 from google.adk.tools.tool_context import ToolContext
-from openai import OpenAI
 from dotenv import load_dotenv
+from ...clients import openai_client
+from ...columnar import columnar_for
+from ...scheduler import record_model_error, scheduled_call, wait_for_rate_limit
+from ...stages import stage
 import os
-import torch
-import whisper
-import torchaudio
-from pyannote.audio import Pipeline
-from pyannote.core import Segment
+import time
+from .streaming import should_stream, stream_settings, transcribe_streaming
+from .transcript_cache import cache_key, hash_audio, transcript_cache
 
 load_dotenv()
 
-HF_TOKEN = os.getenv('HF_TOKEN')
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 
+# "openai" uses gpt-4o-transcribe-diarize, "local" uses whisper and pyannote on this machine.
+TRANSCRIBE_BACKEND = os.getenv("SAGE_TRANSCRIBE_BACKEND", "openai")
+
+# Everything that changes the transcript output belongs here, since it is part of the cache key.
+OPENAI_SETTINGS = {
+    "backend": "openai",
+    "model": "gpt-4o-transcribe-diarize",
+    "response_format": "diarized_json",
+    "chunking_strategy": "auto",
+}
+
+if TRANSCRIBE_BACKEND == "local":
+    from .local_backend import LOCAL_SETTINGS, model_pool, transcribe_local
+
+    TRANSCRIBE_SETTINGS = LOCAL_SETTINGS
+    if os.getenv("SAGE_PREWARM_MODELS", "0") == "1":
+        model_pool.prewarm()
+else:
+    TRANSCRIBE_SETTINGS = OPENAI_SETTINGS
+
+
+def transcribe_openai(audio_filepath: str) -> list:
+    """
+    Transcribes and diarizes an audio file with the OpenAI transcription API.
+
+    Args:
+        audio_filepath (str): Path to the audio file.
+
+    Returns:
+        list: [start_time, end_time, speaker_id, text] segments.
+    """
+    client = openai_client()
+
+    def request():
+        with open(audio_filepath, "rb") as audio_file:
+            return client.audio.transcriptions.create(
+                model=OPENAI_SETTINGS["model"],
+                file=audio_file,
+                response_format=OPENAI_SETTINGS["response_format"],
+                chunking_strategy=OPENAI_SETTINGS["chunking_strategy"],
+            )
+
+    transcript = scheduled_call(OPENAI_SETTINGS["model"], request)
+    return [
+        [segment.start, segment.end, segment.speaker, segment.text.strip()]
+        for segment in transcript.segments
+    ]
+
+
+def transcribe_recording(audio_filepath: str, on_segments=None) -> tuple:
+    """
+    Transcribes a recording, going through the transcript cache.
+
+    Args:
+        audio_filepath (str): Path to the audio file.
+        on_segments: Optional callable receiving the transcript segments as they
+                     become final. Streamed recordings deliver them window by window,
+                     everything else in a single call at the end.
+
+    Returns:
+        tuple: (the [start_time, end_time, speaker_id, text] segments, the audio hash).
+    """
+    audio_hash = hash_audio(audio_filepath)
+    # Long recordings are sent to the API in overlapping windows instead of one upload.
+    streaming = TRANSCRIBE_BACKEND != "local" and should_stream(audio_filepath)
+    settings = stream_settings(OPENAI_SETTINGS) if streaming else TRANSCRIBE_SETTINGS
+    key = cache_key(audio_hash, settings)
+    cached = transcript_cache.get(key)
+    if cached is not None:
+        print(f"Transcript cache hit for {audio_filepath}: {transcript_cache.stats()}")
+        if on_segments is not None:
+            on_segments(cached)
+        return cached, audio_hash
+
+    started = time.perf_counter()
+    if TRANSCRIBE_BACKEND == "local":
+        transcript = transcribe_local(audio_filepath)
+    else:
+        if not OPENAI_API_KEY:
+            raise RuntimeError("OPENAI_API_KEY not found in environment.")
+        if streaming:
+            transcript = transcribe_streaming(
+                audio_filepath, OPENAI_SETTINGS, spool_key=key, on_segments=on_segments
+            )
+            on_segments = None
+        else:
+            transcript = transcribe_openai(audio_filepath)
+    transcript_cache.put(key, transcript, elapsed_s=time.perf_counter() - started, audio_hash=audio_hash)
+    if on_segments is not None:
+        on_segments(transcript)
+    return transcript, audio_hash
+
+
+@stage("transcription")
 def transcribe_audio(tool_context: ToolContext) -> dict:
     """
     Transcribes an audio file and performs speaker diarization.
@@ -23,124 +117,29 @@ def transcribe_audio(tool_context: ToolContext) -> dict:
         tool_context (ToolContext): The tool context containing the audio filepath.
 
     Returns:
-        dict: A dictionary containing the 'transcript' key with a list of 
-              [start_time, end_time, speaker_id, text] segments.
+        dict: The number of segments transcribed. The transcript itself, a list of
+              [start_time, end_time, speaker_id, text] segments, is saved to the
+              state under 'transcript' rather than returned, so it is not stored
+              again in the function response event.
     """
     audio_filepath = tool_context.state.get("audio_filepath")
     if not audio_filepath:
         raise Exception("error: Audio filepath not found in state. Stopping workflow.")
         return {"error": "Audio filepath not found in state."}
 
-    if not OPENAI_API_KEY:
-        return {"error": "OPENAI_API_KEY not found in environment."}
-
     try:
-        client = OpenAI(api_key=OPENAI_API_KEY)
-        with open(audio_filepath, "rb") as audio_file:
-            transcript = client.audio.transcriptions.create(
-                model="gpt-4o-transcribe-diarize",
-                file=audio_file,
-                response_format="diarized_json",
-                chunking_strategy="auto",
-            )
-        modified_output = [
-            [segment.start, segment.end, segment.speaker, segment.text.strip()]
-            for segment in transcript.segments
-        ]
+        transcript, audio_hash = transcribe_recording(audio_filepath)
+        tool_context.state["audio_hash"] = audio_hash
         tool_context.state["is_audio_transcribed"] = True
-        tool_context.state['transcript'] = modified_output
-        return {'transcript': modified_output}
+        tool_context.state['transcript'] = transcript
+        tool_context.state["call_metrics"] = columnar_for(transcript).metrics()
+        return {"transcribed_segments": len(transcript)}
     except FileNotFoundError:
         return {"error": f"Audio file not found at path: {audio_filepath}"}
     except Exception as e:
         return {"error": f"An error occurred during transcription: {e}"}
 
 
-# def transcribe_audio(tool_context):    
-#     """
-#     Transcribes an audio file and performs speaker diarization.
-
-#     Args:
-#         tool_context (ToolContext): The tool context containing the audio filepath.
-
-#     Returns:
-#         dict: A dictionary containing the 'transcript' key with a list of 
-#               [start_time, end_time, speaker_id, text] segments.
-#     """
-
-#     audio_path = tool_context.state.get("audio_filepath")
-#     if not audio_path:
-#         raise Exception("error: Audio filepath not found in state. Stopping workflow.")
-#     print(f"The file path: {audio_path}")
-#     device = "cuda" if torch.cuda.is_available() else "cpu"
-#     try:
-#         pipeline = Pipeline.from_pretrained(
-#             "pyannote/speaker-diarization-3.1",
-#             use_auth_token=HF_TOKEN
-#         )
-#         pipeline.to(torch.device(device))
-#     except Exception as e:
-#         return {'error': "Failed to set up the pipeline"} 
-    
-#     diarization = pipeline(audio_path, num_speakers=2)
-#     whisper_model = whisper.load_model("base", device=device)
-    
-#     try:
-#         audio_waveform = whisper.load_audio(audio_path)
-#         sample_rate = whisper.audio.SAMPLE_RATE
-#     except Exception as e:
-#         return {'error': "Failed to transform in whisper compatiable form"} 
-
-    
-#     all_segments = []
-#     for segment, track_id, label in diarization.itertracks(yield_label=True):
-#         all_segments.append({
-#             'start': segment.start,
-#             'end': segment.end,
-#             'label': label
-#         })
-    
-#     if not all_segments:
-#         return {'error': "Not all segments present"} 
-        
-#     all_segments.sort(key=lambda x: x['start'])
-    
-#     merged_segments = []
-#     current_segment = all_segments[0].copy()
-
-#     for next_seg in all_segments[1:]:
-#         if (next_seg['label'] == current_segment['label'] and 
-#             next_seg['start'] - current_segment['end'] < 0.1):
-#             current_segment['end'] = next_seg['end']
-#         else:
-#             merged_segments.append(current_segment)
-#             current_segment = next_seg.copy()
-    
-#     merged_segments.append(current_segment)
-
-#     final_output_list = []
-#     for i, segment in enumerate(merged_segments):
-#         start_time = segment['start']
-#         end_time = segment['end']
-#         label = segment['label']
-        
-#         start_sample = int(start_time * sample_rate)
-#         end_sample = int(end_time * sample_rate)
-        
-#         segment_audio = audio_waveform[start_sample:min(end_sample, len(audio_waveform))]
-
-#         result = whisper_model.transcribe(segment_audio, fp16=torch.cuda.is_available())
-#         text = result['text'].strip()
-
-#         if text:
-#             final_output_list.append([start_time, end_time, label, text])
-
-#     tool_context.state["is_audio_transcribed"] = True
-#     tool_context.state['transcript'] = final_output_list
-    
-#     return {'transcript': final_output_list}
-
-
 audio_to_transcript_agent = Agent(
     name="audio_to_transcript_agent",
     model="gemma-3-27b-it",
@@ -152,4 +151,6 @@ audio_to_transcript_agent = Agent(
     - transcribe_audio
     """,
     tools=[transcribe_audio],
+    before_model_callback=wait_for_rate_limit,
+    on_model_error_callback=record_model_error,
 )
@@ -0,0 +1,268 @@
+import os
+import queue
+import threading
+from contextlib import contextmanager
+
+import torch
+import whisper
+from pyannote.audio import Pipeline
+from dotenv import load_dotenv
+
+load_dotenv()
+
+HF_TOKEN = os.getenv('HF_TOKEN')
+
+# Everything that changes the transcript output belongs here, since it is part of the cache key.
+LOCAL_SETTINGS = {
+    "backend": "local",
+    "whisper_model": os.getenv("SAGE_WHISPER_MODEL", "base"),
+    "diarization_model": os.getenv("SAGE_DIARIZATION_MODEL", "pyannote/speaker-diarization-3.1"),
+    "num_speakers": int(os.getenv("SAGE_NUM_SPEAKERS", "2")),
+    # 1 transcribes every speaker turn separately, >1 decodes that many turns together.
+    "batch_size": int(os.getenv("SAGE_WHISPER_BATCH_SIZE", "1")),
+    "language": os.getenv("SAGE_WHISPER_LANGUAGE") or None,
+}
+
+# Gap (in seconds) under which consecutive turns of the same speaker are merged.
+MERGE_GAP = 0.1
+
+# Turns are grouped into length buckets of this many seconds before batching, so
+# short backchannels are not decoded next to long explanations.
+BUCKET_SECONDS = 5.0
+
+# Same thresholds whisper.transcribe() uses to drop windows without speech.
+NO_SPEECH_THRESHOLD = 0.6
+LOGPROB_THRESHOLD = -1.0
+
+
+class LocalModelPool:
+    """
+    Process-wide pool of warm (diarization pipeline, whisper model) pairs.
+
+    Models are loaded lazily, at most `size` pairs per process, and handed out to
+    one session at a time. Sessions that find the pool exhausted wait for a pair
+    to be returned instead of loading another copy.
+    """
+
+    def __init__(self, size: int = 1, whisper_model: str = "base",
+                 diarization_model: str = "pyannote/speaker-diarization-3.1", device: str = None):
+        self.size = max(1, size)
+        self.whisper_model = whisper_model
+        self.diarization_model = diarization_model
+        self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+        self._idle = queue.Queue()
+        self._loaded = 0
+        self._lock = threading.Lock()
+
+    def _load(self) -> dict:
+        print(f"Loading {self.whisper_model} whisper and {self.diarization_model} on {self.device}...")
+        pipeline = Pipeline.from_pretrained(self.diarization_model, use_auth_token=HF_TOKEN)
+        pipeline.to(torch.device(self.device))
+        model = whisper.load_model(self.whisper_model, device=self.device)
+        return {"diarization": pipeline, "whisper": model}
+
+    def prewarm(self, count: int = None) -> None:
+        """
+        Loads models ahead of the first call so no session pays the load time.
+
+        Args:
+            count (int): How many model pairs to load, defaults to the pool size.
+        """
+        count = self.size if count is None else min(count, self.size)
+        while True:
+            with self._lock:
+                if self._loaded >= count:
+                    return
+                self._loaded += 1
+            try:
+                self._idle.put(self._load())
+            except Exception:
+                with self._lock:
+                    self._loaded -= 1
+                raise
+
+    @contextmanager
+    def acquire(self):
+        """Checks out a model pair for the duration of a transcription."""
+        try:
+            models = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_load = self._loaded < self.size
+                if can_load:
+                    self._loaded += 1
+            if can_load:
+                try:
+                    models = self._load()
+                except Exception:
+                    with self._lock:
+                        self._loaded -= 1
+                    raise
+            else:
+                models = self._idle.get()
+        try:
+            yield models
+        finally:
+            self._idle.put(models)
+
+    def stats(self) -> dict:
+        """Returns how many model pairs are loaded and how many are idle."""
+        return {"size": self.size, "loaded": self._loaded, "idle": self._idle.qsize(), "device": self.device}
+
+
+model_pool = LocalModelPool(
+    size=int(os.getenv("SAGE_LOCAL_POOL_SIZE", "1")),
+    whisper_model=LOCAL_SETTINGS["whisper_model"],
+    diarization_model=LOCAL_SETTINGS["diarization_model"],
+)
+
+
+def merge_speaker_turns(diarization) -> list:
+    """
+    Converts a diarization result into speaker turns, merging adjacent turns of the same speaker.
+
+    Args:
+        diarization: The pyannote diarization annotation.
+
+    Returns:
+        list: Dictionaries with 'start', 'end' and 'label' keys, sorted by start time.
+    """
+    all_segments = [
+        {'start': segment.start, 'end': segment.end, 'label': label}
+        for segment, _, label in diarization.itertracks(yield_label=True)
+    ]
+    if not all_segments:
+        return []
+
+    all_segments.sort(key=lambda x: x['start'])
+
+    merged_segments = []
+    current_segment = all_segments[0].copy()
+    for next_seg in all_segments[1:]:
+        if (next_seg['label'] == current_segment['label'] and
+                next_seg['start'] - current_segment['end'] < MERGE_GAP):
+            current_segment['end'] = next_seg['end']
+        else:
+            merged_segments.append(current_segment)
+            current_segment = next_seg.copy()
+    merged_segments.append(current_segment)
+    return merged_segments
+
+
+def transcribe_segments(whisper_model, audio_waveform, merged_segments, language: str = None) -> list:
+    """
+    Transcribes each speaker turn separately with whisper.
+
+    Args:
+        whisper_model: The loaded whisper model.
+        audio_waveform: The 16 kHz mono waveform of the whole call.
+        merged_segments (list): Speaker turns from `merge_speaker_turns`.
+        language (str): Language code, or None to detect it per turn.
+
+    Returns:
+        list: [start_time, end_time, speaker_id, text] segments with empty turns dropped.
+    """
+    sample_rate = whisper.audio.SAMPLE_RATE
+    final_output_list = []
+    for segment in merged_segments:
+        start_sample = int(segment['start'] * sample_rate)
+        end_sample = int(segment['end'] * sample_rate)
+        segment_audio = audio_waveform[start_sample:min(end_sample, len(audio_waveform))]
+
+        result = whisper_model.transcribe(segment_audio, fp16=torch.cuda.is_available(), language=language)
+        text = result['text'].strip()
+        if text:
+            final_output_list.append([segment['start'], segment['end'], segment['label'], text])
+    return final_output_list
+
+
+def transcribe_segments_batched(whisper_model, audio_waveform, merged_segments,
+                                batch_size: int = 8, language: str = None) -> list:
+    """
+    Transcribes speaker turns in batches instead of one whisper.transcribe() call per turn.
+
+    Turns are bucketed by length, padded to whisper's 30 second window and decoded
+    together. Turns longer than one window fall back to whisper.transcribe().
+    Decoding is greedy without transcribe()'s temperature fallback, so the text can
+    differ slightly on hard audio.
+
+    Args:
+        whisper_model: The loaded whisper model.
+        audio_waveform: The 16 kHz mono waveform of the whole call.
+        merged_segments (list): Speaker turns from `merge_speaker_turns`.
+        batch_size (int): Maximum number of turns decoded together.
+        language (str): Language code, or None to detect it per turn.
+
+    Returns:
+        list: [start_time, end_time, speaker_id, text] segments with empty turns dropped.
+    """
+    sample_rate = whisper.audio.SAMPLE_RATE
+    fp16 = torch.cuda.is_available()
+    texts = [""] * len(merged_segments)
+
+    buckets = {}
+    for index, segment in enumerate(merged_segments):
+        start_sample = int(segment['start'] * sample_rate)
+        end_sample = min(int(segment['end'] * sample_rate), len(audio_waveform))
+        segment_audio = audio_waveform[start_sample:end_sample]
+        if len(segment_audio) == 0:
+            continue
+        if len(segment_audio) > whisper.audio.N_SAMPLES:
+            result = whisper_model.transcribe(segment_audio, fp16=fp16, language=language)
+            texts[index] = result['text'].strip()
+            continue
+        bucket = int((segment['end'] - segment['start']) // BUCKET_SECONDS)
+        buckets.setdefault(bucket, []).append((index, segment_audio))
+
+    options = whisper.DecodingOptions(language=language, fp16=fp16, without_timestamps=True)
+    for bucket in sorted(buckets):
+        items = buckets[bucket]
+        for offset in range(0, len(items), batch_size):
+            batch = items[offset:offset + batch_size]
+            mel = torch.stack([
+                whisper.log_mel_spectrogram(
+                    whisper.pad_or_trim(torch.from_numpy(segment_audio)),
+                    n_mels=whisper_model.dims.n_mels,
+                )
+                for _, segment_audio in batch
+            ]).to(whisper_model.device)
+            results = whisper.decode(whisper_model, mel, options)
+            for (index, _), result in zip(batch, results):
+                if result.no_speech_prob > NO_SPEECH_THRESHOLD and result.avg_logprob < LOGPROB_THRESHOLD:
+                    continue
+                texts[index] = result.text.strip()
+
+    return [
+        [segment['start'], segment['end'], segment['label'], text]
+        for segment, text in zip(merged_segments, texts)
+        if text
+    ]
+
+
+def transcribe_local(audio_filepath: str, num_speakers: int = None) -> list:
+    """
+    Transcribes and diarizes an audio file with the warm whisper and pyannote models.
+
+    Args:
+        audio_filepath (str): Path to the audio file.
+        num_speakers (int): Expected number of speakers, defaults to SAGE_NUM_SPEAKERS.
+
+    Returns:
+        list: [start_time, end_time, speaker_id, text] segments.
+    """
+    num_speakers = num_speakers or LOCAL_SETTINGS["num_speakers"]
+    audio_waveform = whisper.load_audio(audio_filepath)
+    with model_pool.acquire() as models:
+        diarization = models["diarization"](audio_filepath, num_speakers=num_speakers)
+        merged_segments = merge_speaker_turns(diarization)
+        if LOCAL_SETTINGS["batch_size"] > 1:
+            return transcribe_segments_batched(
+                models["whisper"],
+                audio_waveform,
+                merged_segments,
+                batch_size=LOCAL_SETTINGS["batch_size"],
+                language=LOCAL_SETTINGS["language"],
+            )
+        return transcribe_segments(
+            models["whisper"], audio_waveform, merged_segments, language=LOCAL_SETTINGS["language"]
+        )
@@ -0,0 +1,296 @@
+import contextvars
+import io
+import json
+import os
+import shutil
+import time
+import wave
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from openai import OpenAI
+from dotenv import load_dotenv
+
+from ...clients import openai_client
+from ...scheduler import scheduled_call
+
+load_dotenv()
+
+# "auto" streams recordings longer than SAGE_STREAM_MIN_SECONDS, "always" streams
+# every WAV file and "never" always uploads the whole file in one request.
+STREAM_MODE = os.getenv("SAGE_STREAM_MODE", "auto")
+STREAM_MIN_SECONDS = float(os.getenv("SAGE_STREAM_MIN_SECONDS", "600"))
+STREAM_WINDOW_SECONDS = float(os.getenv("SAGE_STREAM_WINDOW_SECONDS", "300"))
+STREAM_OVERLAP_SECONDS = float(os.getenv("SAGE_STREAM_OVERLAP_SECONDS", "10"))
+STREAM_CONCURRENCY = int(os.getenv("SAGE_STREAM_CONCURRENCY", "4"))
+# Finished windows are written here, so a failed run resumes instead of starting over.
+STREAM_SPOOL_DIR = os.getenv("SAGE_STREAM_SPOOL_DIR", "./transcript_stream")
+
+
+def wav_duration(audio_filepath: str):
+    """Returns the duration of a WAV file in seconds, or None if it is not a readable WAV file."""
+    try:
+        with wave.open(audio_filepath, "rb") as wav:
+            return wav.getnframes() / wav.getframerate()
+    except (wave.Error, EOFError):
+        return None
+
+
+def should_stream(audio_filepath: str) -> bool:
+    """Decides whether a recording is transcribed in windows, following SAGE_STREAM_MODE."""
+    if STREAM_MODE == "never":
+        return False
+    duration = wav_duration(audio_filepath)
+    if duration is None:
+        return False
+    return STREAM_MODE == "always" or duration > STREAM_MIN_SECONDS
+
+
+def stream_settings(settings: dict) -> dict:
+    """Adds the window layout to the transcription settings, since it changes the transcript."""
+    return dict(
+        settings,
+        stream_window_s=STREAM_WINDOW_SECONDS,
+        stream_overlap_s=STREAM_OVERLAP_SECONDS,
+    )
+
+
+def plan_windows(duration: float, window_seconds: float, overlap_seconds: float) -> list:
+    """
+    Splits a recording into overlapping windows.
+
+    Args:
+        duration (float): Recording length in seconds.
+        window_seconds (float): Window length.
+        overlap_seconds (float): Time shared by consecutive windows.
+
+    Returns:
+        list: (start, end) of every window, in seconds.
+    """
+    step = max(window_seconds - overlap_seconds, 1.0)
+    windows, start = [], 0.0
+    while True:
+        end = min(start + window_seconds, duration)
+        windows.append((start, end))
+        if end >= duration:
+            return windows
+        start += step
+
+
+def read_window(audio_filepath: str, start: float, end: float) -> bytes:
+    """
+    Reads one window of a WAV file into a standalone WAV file in memory.
+
+    Only the frames of the window are read, so the recording is never loaded whole.
+    """
+    with wave.open(audio_filepath, "rb") as source:
+        params = source.getparams()
+        first = int(start * params.framerate)
+        source.setpos(first)
+        frames = source.readframes(int(end * params.framerate) - first)
+
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as window:
+        window.setparams(params)
+        window.writeframes(frames)
+    return buffer.getvalue()
+
+
+def transcribe_window(client: OpenAI, settings: dict, audio_filepath: str,
+                      index: int, start: float, end: float) -> list:
+    """
+    Transcribes one window. scheduled_call retries it after 429s and transient errors.
+
+    Returns:
+        list: [start_time, end_time, speaker_id, text] segments, with times relative
+              to the start of the recording and speakers local to this window.
+    """
+    audio = read_window(audio_filepath, start, end)
+    try:
+        transcript = scheduled_call(settings["model"], lambda: client.audio.transcriptions.create(
+            model=settings["model"],
+            file=(f"window_{index:04d}.wav", audio),
+            response_format=settings["response_format"],
+            chunking_strategy=settings["chunking_strategy"],
+        ))
+    except Exception as e:
+        raise RuntimeError(f"window {index} ({start:.0f}-{end:.0f}s) failed: {e}") from e
+    return [
+        [segment.start + start, segment.end + start, segment.speaker, segment.text.strip()]
+        for segment in transcript.segments
+    ]
+
+
+def match_speakers(previous: list, current: list, overlap_start: float, overlap_end: float,
+                   known_speakers: list) -> dict:
+    """
+    Maps the speaker labels of a window onto the labels used so far in the call.
+
+    Speakers are paired by how long they talk at the same time in the overlap both
+    windows transcribed. Speakers without overlap evidence take the known labels not
+    matched yet, in order of first appearance; a new label is only created once
+    every known speaker is taken.
+
+    Args:
+        previous (list): Segments of the previous window, already using call-wide labels.
+        current (list): Segments of this window, using window-local labels.
+        overlap_start (float): Start of the shared time range.
+        overlap_end (float): End of the shared time range.
+        known_speakers (list): Call-wide labels in order of first appearance.
+
+    Returns:
+        dict: Window-local label -> call-wide label.
+    """
+    shared = defaultdict(float)
+    for p_start, p_end, p_speaker, _ in previous:
+        if p_end <= overlap_start or p_start >= overlap_end:
+            continue
+        for c_start, c_end, c_speaker, _ in current:
+            seconds = min(p_end, c_end, overlap_end) - max(p_start, c_start, overlap_start)
+            if seconds > 0:
+                shared[(c_speaker, p_speaker)] += seconds
+
+    mapping, taken = {}, set()
+    for (local, call_wide), _ in sorted(shared.items(), key=lambda item: -item[1]):
+        if local not in mapping and call_wide not in taken:
+            mapping[local] = call_wide
+            taken.add(call_wide)
+
+    for _, _, local, _ in current:
+        if local in mapping:
+            continue
+        free = [speaker for speaker in known_speakers if speaker not in taken]
+        if free:
+            mapping[local] = free[0]
+        else:
+            label = local if local not in known_speakers else f"{local}_{len(known_speakers)}"
+            known_speakers.append(label)
+            mapping[local] = label
+        taken.add(mapping[local])
+    return mapping
+
+
+class TranscriptStitcher:
+    """
+    Joins window transcripts into one call transcript, in window order.
+
+    Windows may finish in any order. A window is stitched once every earlier window
+    is, and the segments it owns (those whose midpoint falls between the middles of
+    its overlaps with the neighbouring windows) are then final.
+    """
+
+    def __init__(self, windows: list):
+        self.windows = windows
+        self.cuts = [0.0] + [
+            (windows[i + 1][0] + windows[i][1]) / 2 for i in range(len(windows) - 1)
+        ] + [float("inf")]
+        self.pending = {}
+        self.next_index = 0
+        self.previous = None
+        self.speakers = []
+        self.segments = []
+
+    def add(self, index: int, segments: list) -> list:
+        """
+        Adds the transcript of one window.
+
+        Returns:
+            list: The segments that became final, possibly from several windows.
+        """
+        self.pending[index] = segments
+        final = []
+        while self.next_index in self.pending:
+            index = self.next_index
+            current = self.pending.pop(index)
+            if self.previous is None:
+                mapping = {}
+                for _, _, speaker, _ in current:
+                    if speaker not in mapping:
+                        mapping[speaker] = speaker
+                        self.speakers.append(speaker)
+            else:
+                mapping = match_speakers(
+                    self.previous, current, self.windows[index][0], self.windows[index - 1][1], self.speakers
+                )
+            current = [[start, end, mapping[speaker], text] for start, end, speaker, text in current]
+            low, high = self.cuts[index], self.cuts[index + 1]
+            final.extend(s for s in current if low <= (s[0] + s[1]) / 2 < high)
+            self.previous = current
+            self.next_index += 1
+        self.segments.extend(final)
+        return final
+
+
+def _write_json(path: str, value) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(value, f)
+    os.replace(tmp_path, path)
+
+
+def transcribe_streaming(audio_filepath: str, settings: dict, spool_key: str,
+                         on_segments=None) -> list:
+    """
+    Transcribes a long WAV recording in overlapping windows.
+
+    Windows are read from disk one at a time and transcribed concurrently. Every
+    finished window is written to the spool directory, so a rerun after a failure
+    only sends the missing windows. Stitched segments are handed to `on_segments`
+    as soon as they are final, in call order.
+
+    Args:
+        audio_filepath (str): Path to the WAV file.
+        settings (dict): The OpenAI transcription settings.
+        spool_key (str): Identifies this recording and settings in the spool directory.
+        on_segments: Optional callable receiving each batch of final segments.
+
+    Returns:
+        list: [start_time, end_time, speaker_id, text] segments of the whole call.
+    """
+    windows = plan_windows(wav_duration(audio_filepath), STREAM_WINDOW_SECONDS, STREAM_OVERLAP_SECONDS)
+    spool = os.path.join(STREAM_SPOOL_DIR, spool_key)
+    os.makedirs(spool, exist_ok=True)
+    stitcher = TranscriptStitcher(windows)
+    client = openai_client()
+
+    def finished(index, segments):
+        final = stitcher.add(index, segments)
+        if final and on_segments is not None:
+            on_segments(final)
+
+    started = time.perf_counter()
+    failures = []
+    with ThreadPoolExecutor(max_workers=max(1, STREAM_CONCURRENCY)) as pool:
+        futures = {}
+        for index, (start, end) in enumerate(windows):
+            path = os.path.join(spool, f"window_{index:04d}.json")
+            if os.path.exists(path):
+                with open(path, "r", encoding="utf-8") as f:
+                    finished(index, json.load(f))
+                continue
+            # Each window runs in a copy of this context, so its requests join the current trace.
+            future = pool.submit(
+                contextvars.copy_context().run,
+                transcribe_window, client, settings, audio_filepath, index, start, end,
+            )
+            futures[future] = (index, path)
+
+        for future in as_completed(futures):
+            index, path = futures[future]
+            try:
+                segments = future.result()
+            except Exception as e:
+                failures.append(str(e))
+                continue
+            _write_json(path, segments)
+            finished(index, segments)
+            print(f"Transcribed window {index + 1}/{len(windows)} of {audio_filepath} "
+                  f"({time.perf_counter() - started:.1f}s)")
+
+    if failures:
+        raise RuntimeError(
+            f"{len(failures)} of {len(windows)} windows failed, finished windows are kept in {spool}: "
+            + "; ".join(failures)
+        )
+    shutil.rmtree(spool, ignore_errors=True)
+    return stitcher.segments
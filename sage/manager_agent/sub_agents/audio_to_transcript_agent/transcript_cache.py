@@ -0,0 +1,152 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def hash_audio(audio_filepath: str) -> str:
+    """
+    Computes the content hash of an audio file, independent of its name or location.
+
+    Args:
+        audio_filepath (str): Path to the audio file.
+
+    Returns:
+        str: The hex encoded SHA-256 digest of the file contents.
+    """
+    digest = hashlib.sha256()
+    with open(audio_filepath, "rb") as audio_file:
+        for chunk in iter(lambda: audio_file.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_key(audio_hash: str, settings: dict) -> str:
+    """
+    Builds the cache key for a transcript from the audio hash and the transcription settings.
+
+    Args:
+        audio_hash (str): The content hash of the audio file.
+        settings (dict): The backend, model and diarization settings used to transcribe.
+
+    Returns:
+        str: The hex encoded cache key.
+    """
+    payload = json.dumps({"audio": audio_hash, "settings": settings}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class TranscriptCache:
+    """
+    On-disk, content-addressed cache of diarized transcripts with LRU eviction.
+
+    Every entry is a JSON file named after its key. Reading an entry refreshes its
+    modification time, and the least recently used entries are evicted once the
+    directory grows over `max_bytes`.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int, enabled: bool = True):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+            "seconds_saved": 0.0,
+        }
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key: str):
+        """
+        Looks up a transcript.
+
+        Args:
+            key (str): The cache key from `cache_key`.
+
+        Returns:
+            list | None: The [start, end, speaker, text] segments, or None on a miss.
+        """
+        if not self.enabled:
+            return None
+        path = self._entry_path(key)
+        with self._lock:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    entry = json.load(f)
+                os.utime(path)
+            except (FileNotFoundError, json.JSONDecodeError):
+                self._stats["misses"] += 1
+                return None
+            self._stats["hits"] += 1
+            self._stats["seconds_saved"] += entry.get("elapsed_s", 0.0)
+        return entry["transcript"]
+
+    def put(self, key: str, transcript: list, elapsed_s: float = 0.0, audio_hash: str = None) -> None:
+        """
+        Stores a transcript and evicts the least recently used entries if needed.
+
+        Args:
+            key (str): The cache key from `cache_key`.
+            transcript (list): The [start, end, speaker, text] segments.
+            elapsed_s (float): How long the transcription took, used to report savings.
+            audio_hash (str): The content hash of the audio, kept for reference.
+        """
+        if not self.enabled:
+            return
+        entry = {
+            "audio_hash": audio_hash,
+            "elapsed_s": round(elapsed_s, 3),
+            "created_at": time.time(),
+            "transcript": transcript,
+        }
+        with self._lock:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            path = self._entry_path(key)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, path)
+            self._stats["stores"] += 1
+            self._evict()
+
+    def _evict(self) -> None:
+        entries = []
+        total = 0
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".json"):
+                continue
+            stat = os.stat(os.path.join(self.cache_dir, name))
+            entries.append((stat.st_mtime, stat.st_size, name))
+            total += stat.st_size
+
+        entries.sort()
+        for _, size, name in entries:
+            if total <= self.max_bytes:
+                break
+            os.remove(os.path.join(self.cache_dir, name))
+            total -= size
+            self._stats["evictions"] += 1
+
+    def stats(self) -> dict:
+        """Returns the hit/miss counters and the transcription time saved by hits."""
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+        stats["seconds_saved"] = round(stats["seconds_saved"], 3)
+        return stats
+
+
+transcript_cache = TranscriptCache(
+    cache_dir=os.getenv("SAGE_TRANSCRIPT_CACHE_DIR", "./transcript_cache"),
+    max_bytes=int(os.getenv("SAGE_TRANSCRIPT_CACHE_MAX_MB", "512")) * 1024 * 1024,
+    enabled=os.getenv("SAGE_TRANSCRIPT_CACHE", "1") != "0",
+)
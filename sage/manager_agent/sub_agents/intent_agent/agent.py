@@ -1,11 +1,60 @@
 from google.adk.agents import Agent
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.agents.readonly_context import ReadonlyContext
 from google.adk.models.lite_llm import LiteLlm
+from google.genai import types
+from ...blob_store import state_value
+from ...llm_cache import model_cache_callbacks
+from ...local_classifier import classify_confident
+from ...scheduler import record_model_error, wait_for_rate_limit
 
-intent_agent = Agent(
-    name="IntentAgent",
-    model="gemma-3-27b-it",
-    description="Identifies the user's intent from the transcript.",
-    instruction="""
+INTENT_CATEGORIES = [
+    "BalanceInquiry",
+    "TransactionHistory",
+    "FundTransfer",
+    "LoanApplication",
+    "LoanInquiry",
+    "CreditCardApplication",
+    "CreditCardLimitIncrease",
+    "ReportLostOrStolenCard",
+    "DisputeTransaction",
+    "AccountOpening",
+    "AccountClosure",
+    "UpdatePersonalInformation",
+    "TechnicalSupport",
+    "GeneralInquiry",
+]
+
+
+def transcript_text(transcript) -> str:
+    """Joins the dialogue of all speakers into the text the intent classifier sees."""
+    return " ".join(f"{segment[2]}: {segment[3]}" for segment in transcript)
+
+
+cache_intent_request, cache_intent_response = model_cache_callbacks("intent")
+
+
+def classify_intent_locally(callback_context: CallbackContext):
+    """
+    Classifies the intent with the local classifier before the LLM is called.
+
+    Returns:
+        types.Content | None: The intent, which skips the LLM call, or None when no
+        local model is configured or its prediction is not confident enough.
+    """
+    transcript = state_value(callback_context.state, "transcript")
+    if not transcript:
+        return None
+    prediction = classify_confident("intent", [transcript_text(transcript)], INTENT_CATEGORIES)[0]
+    if prediction is None:
+        return None
+    intent, confidence = prediction
+    print(f"Intent classified locally as {intent} ({confidence:.2f})")
+    callback_context.state["intent_state"] = intent
+    return types.Content(role="model", parts=[types.Part(text=intent)])
+
+
+INTENT_INSTRUCTION = """
         You are an expert in analyzing banking call transcripts. Your task is to identify the primary intent of the customer from the provided transcript. The transcript is a list of segments, each with a speaker and their dialogue.
 
         You must classify the intent into one of the following 14 categories:
@@ -24,7 +73,7 @@ intent_agent = Agent(
         - TechnicalSupport
         - GeneralInquiry
 
-        The input you will receive is a dictionary with a 'transcription' key, which holds a list of lists. Each inner list has the format: [start_time, end_time, speaker_id, text].
+        The transcript is given at the end of these instructions, one "speaker_id: text" turn after another.
 
         You need to analyze the 'text' from all speakers to determine the intent.
 
@@ -33,6 +82,29 @@ intent_agent = Agent(
 
         Do not provide any other explanation or text in your response.
 
-    """,
+"""
+
+
+def intent_instruction(context: ReadonlyContext) -> str:
+    """
+    Appends the transcript from the session state to the intent instruction.
+
+    The transcription step only hands the transcript over through the state, so
+    the model would otherwise classify a conversation it never sees.
+    """
+    transcript = state_value(context.state, "transcript") or []
+    return f"{INTENT_INSTRUCTION}\nTranscript:\n{transcript_text(transcript)}\n"
+
+
+intent_agent = Agent(
+    name="IntentAgent",
+    model="gemma-3-27b-it",
+    description="Identifies the user's intent from the transcript.",
+    instruction=intent_instruction,
     output_key="intent_state",
-)
\ No newline at end of file
+    before_agent_callback=classify_intent_locally,
+    # A cached response skips the rate limiter as well.
+    before_model_callback=[cache_intent_request, wait_for_rate_limit],
+    after_model_callback=cache_intent_response,
+    on_model_error_callback=record_model_error,
+)
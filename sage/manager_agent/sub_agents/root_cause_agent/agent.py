@@ -3,13 +3,17 @@ import re
 from google.adk.agents import Agent
 from google.adk.models.lite_llm import LiteLlm
 from google.adk.tools.tool_context import ToolContext
-import google.generativeai as genai
-import os
+
 from dotenv import load_dotenv
+from ...blob_store import state_value
+from ...clients import genai_request_options, generative_model
+from ...compaction import compact_transcript, estimate_tokens, record_compaction
+from ...llm_cache import cached_response, response_cache
+from ...scheduler import record_model_error, scheduled_call, wait_for_rate_limit
+from ...stages import stage
 load_dotenv()
 
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
-model = genai.GenerativeModel('gemma-3-27b-it')
+model = generative_model('gemma-3-27b-it')
 
 def safe_parse_json(raw):
     """Safely parse model output even if wrapped in markdown."""
@@ -19,6 +23,7 @@ def safe_parse_json(raw):
     except json.JSONDecodeError:
         return None
 
+@stage("root_cause")
 def analyze_root_cause(tool_context: ToolContext) -> dict:
     """
     Analyzes the transcript to identify the root cause of the user's issue.
@@ -29,26 +34,36 @@ def analyze_root_cause(tool_context: ToolContext) -> dict:
     Returns:
         dict: A dictionary containing the identified root cause.
     """
-    transcript = tool_context.state.get("transcript")
+    transcript = state_value(tool_context.state, "transcript")
     if not transcript:
         return {"error": "Transcript not found in state."}
 
-    full_text = " ".join(segment[3] for segment in transcript)
+    conversation, compaction = compact_transcript(transcript)
+    record_compaction(tool_context.state, "root_cause", compaction)
 
     prompt = f"""Analyze the following conversation from a customer service call and identify the root cause of the customer's issue. 
     The root cause should be a concise summary of the underlying problem.
     
     Conversation:
-    {full_text}
+    {conversation}
     
     Respond with a JSON object with a single key 'root_cause'.
     """
 
-    response = model.generate_content(prompt)
+    def request():
+        response = scheduled_call(
+            model.model_name,
+            lambda: model.generate_content(prompt, request_options=genai_request_options()),
+            tokens=estimate_tokens(prompt),
+        )
+        return response.text
+
     try:
-        root_cause = safe_parse_json(response.text)
+        text = cached_response("root_cause", model.model_name, prompt, request)
+        root_cause = safe_parse_json(text)
     except Exception as e:
         root_cause = {"error": str(e)}
+    response_cache.log_stats("root_cause")
 
     tool_context.state["root_cause_state"] = root_cause
     return {"root_cause": root_cause}
@@ -64,4 +79,6 @@ root_cause_agent = Agent(
     
     """,
     tools=[analyze_root_cause],
+    before_model_callback=wait_for_rate_limit,
+    on_model_error_callback=record_model_error,
 )
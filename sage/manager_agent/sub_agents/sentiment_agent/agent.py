@@ -1,18 +1,26 @@
 from google.adk.agents import Agent
+from google.adk.agents.callback_context import CallbackContext
 from google.adk.models.lite_llm import LiteLlm
 from google.adk.tools.tool_context import ToolContext
-import google.generativeai as genai
-import math
+from google.genai import types
+import asyncio
 import os
 import json
 import re
-from collections import defaultdict, Counter
-from litellm import completion
+import numpy as np
+from litellm import acompletion
 from dotenv import load_dotenv
+from ...blob_store import state_value
+from ...clients import async_openai_client, generative_model
+from ...columnar import aggregate_labels, columnar_for
+from ...compaction import estimate_tokens
+from ...llm_cache import cached_response_async, response_cache
+from ...local_classifier import classify_confident
+from ...scheduler import record_model_error, scheduled_call_async, wait_for_rate_limit
+from ...stages import stage
 load_dotenv()
 
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
-model = genai.GenerativeModel('gemma-3-27b-it')
+model = generative_model('gemma-3-27b-it')
 
 def safe_parse_json(raw):
     """Safely parse model output even if wrapped in markdown."""
@@ -22,76 +30,411 @@ def safe_parse_json(raw):
     except json.JSONDecodeError:
         return None
 
-def analyze_sentiment_per_minute(tool_context: ToolContext) -> dict:
+
+SENTIMENT_MODEL = "gpt-4o"
+SENTIMENT_SYSTEM_PROMPT = (
+    "You are a precise emotion detection model for customer conversations. "
+    "Analyze the following 1-minute transcript and identify the *dominant emotion* clearly. "
+    "Differentiate carefully between: "
+    "Anger (aggressive, raised voice), "
+    "Frustration (annoyed or impatient tone), "
+    "Calm (neutral or polite tone), "
+    "Apology (expressing regret), and "
+    "Satisfaction (happy or thankful tone). "
+    "Return only JSON: {\"label\": <emotion>, \"score\": <0-1>}."
+)
+
+EMOTION_LABELS = ["Anger", "Frustration", "Calm", "Apology", "Satisfaction"]
+
+PACKED_SYSTEM_PROMPT = (
+    "You are a precise emotion detection model for customer conversations. "
+    "You will receive several 1-minute excerpts of the same call, each starting with a line like [minute 3]. "
+    "For every minute, identify the *dominant emotion* clearly. "
+    "Differentiate carefully between: "
+    "Anger (aggressive, raised voice), "
+    "Frustration (annoyed or impatient tone), "
+    "Calm (neutral or polite tone), "
+    "Apology (expressing regret), and "
+    "Satisfaction (happy or thankful tone). "
+    "Return only a JSON array with one object per minute, in order: "
+    "[{\"minute\": <minute>, \"label\": <emotion>, \"score\": <0-1>}]."
+)
+
+# "per_minute" sends one request per minute, "packed" scores many minutes per request.
+SENTIMENT_MODE = os.getenv("SAGE_SENTIMENT_MODE", "per_minute")
+# Maximum transcript tokens per packed request; longer calls are split into several requests.
+SENTIMENT_TOKEN_BUDGET = int(os.getenv("SAGE_SENTIMENT_TOKEN_BUDGET", "6000"))
+
+# Maximum number of requests in flight at the same time for a single call.
+SENTIMENT_CONCURRENCY = int(os.getenv("SAGE_SENTIMENT_CONCURRENCY", "8"))
+
+
+def normalize_label(label):
+    """Maps a model label onto one of EMOTION_LABELS, ignoring case, or returns None."""
+    if not isinstance(label, str):
+        return None
+    for known in EMOTION_LABELS:
+        if label.strip().lower() == known.lower():
+            return known
+    return None
+
+
+def bucket_by_minute(transcript) -> dict:
     """
-    Analyzes the emotional tone and satisfaction level of the transcript per minute and saves it to the state.
+    Groups transcript segments by the minute they start in.
+
+    Args:
+        transcript (list): [start_time, end_time, speaker_id, text] segments.
+
+    Returns:
+        dict: A mapping of minute index to a list of (speaker, text) tuples.
     """
-    transcript = tool_context.state.get("transcript")
-    if not transcript:
-        return {"error": "Transcript not found in state."}
+    columnar = columnar_for(transcript)
+    minutes, groups = columnar.minute_groups()
+    return {
+        int(minute): [(columnar.speaker(i), columnar.text(i)) for i in indices]
+        for minute, indices in zip(minutes, groups)
+    }
 
-    minute_buckets = defaultdict(list)
-    for entry in transcript:
-        start_t, end_t, speaker, text = entry
-        minute_index = int(math.floor(start_t / 60))
-        minute_buckets[minute_index].append((speaker, text))
 
-    minute_summary = []
-    for minute, msgs in sorted(minute_buckets.items()):
-        combined_text = " ".join([f"{speaker}: {text}" for speaker, text in msgs])
-
-        resp = completion(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "system",
-                    "content": (
-                        "You are a precise emotion detection model for customer conversations. "
-                        "Analyze the following 1-minute transcript and identify the *dominant emotion* clearly. "
-                        "Differentiate carefully between: "
-                        "Anger (aggressive, raised voice), "
-                        "Frustration (annoyed or impatient tone), "
-                        "Calm (neutral or polite tone), "
-                        "Apology (expressing regret), and "
-                        "Satisfaction (happy or thankful tone). "
-                        "Return only JSON: {\"label\": <emotion>, \"score\": <0-1>}."
+def format_minute(msgs: list) -> str:
+    """Joins the (speaker, text) tuples of one minute into a single line."""
+    return " ".join([f"{speaker}: {text}" for speaker, text in msgs])
+
+
+async def complete_chat(messages: list, semaphore: asyncio.Semaphore, description: str):
+    """
+    Sends a chat completion. scheduled_call_async retries it after 429s and transient errors.
+
+    Args:
+        messages (list): The chat messages.
+        semaphore (asyncio.Semaphore): Caps how many requests are in flight at once.
+        description (str): What is being scored, used in the failure message.
+
+    Returns:
+        str | None: The model output, or None if the request failed.
+    """
+    async def request():
+        try:
+            async with semaphore:
+                resp = await scheduled_call_async(
+                    SENTIMENT_MODEL,
+                    lambda: acompletion(
+                        model=SENTIMENT_MODEL, messages=messages, client=async_openai_client(), num_retries=0
                     ),
-                },
-                {"role": "user", "content": combined_text},
-            ],
-        )
-
-        raw = resp["choices"][0]["message"]["content"]
-        parsed = safe_parse_json(raw)
-        label = parsed.get("label", "neutral") if parsed else "neutral"
-        score = float(parsed.get("score", 0.5)) if parsed else 0.5
-        
-        minute_label = f"{minute} to {minute + 1}"
-        minute_summary.append({
-            "minute": minute_label,
-            "label": label,
-            "score": round(score, 2),
-            "message_count": len(msgs)
-        })
-
-    label_counts = Counter(m["label"] for m in minute_summary)
-    score_totals = defaultdict(float)
-    for m in minute_summary:
-        score_totals[m["label"]] += m["score"]
-
-    avg_scores = {l: score_totals[l] / label_counts[l] for l in label_counts}
-    overall_label = max(label_counts, key=label_counts.get)
-    overall_score = round(avg_scores[overall_label], 2)
-
-    result = {
+                    tokens=sum(estimate_tokens(message["content"]) for message in messages),
+                )
+            return resp["choices"][0]["message"]["content"]
+        except Exception as e:
+            print(f"Sentiment scoring failed for {description}: {e}")
+            return None
+
+    # Failed requests return None and are not cached.
+    return await cached_response_async("sentiment", SENTIMENT_MODEL, messages, request)
+
+
+def timeline_entry(minute: int, label: str, score: float, message_count: int) -> dict:
+    """Builds one entry of the sentiment timeline."""
+    return {
+        "minute": f"{minute} to {minute + 1}",
+        "label": label,
+        "score": round(score, 2),
+        "message_count": message_count
+    }
+
+
+async def score_minute(minute: int, msgs: list, semaphore: asyncio.Semaphore) -> dict:
+    """
+    Scores the dominant emotion of one minute of the call.
+
+    Args:
+        minute (int): The minute index.
+        msgs (list): (speaker, text) tuples spoken in that minute.
+        semaphore (asyncio.Semaphore): Caps how many requests are in flight at once.
+
+    Returns:
+        dict: The timeline entry with 'minute', 'label', 'score' and 'message_count'.
+    """
+    raw = await complete_chat(
+        [
+            {"role": "system", "content": SENTIMENT_SYSTEM_PROMPT},
+            {"role": "user", "content": format_minute(msgs)},
+        ],
+        semaphore,
+        f"minute {minute}",
+    )
+    parsed = safe_parse_json(raw) if raw else None
+    if not isinstance(parsed, dict):
+        parsed = None
+
+    label = parsed.get("label", "neutral") if parsed else "neutral"
+    score = float(parsed.get("score", 0.5)) if parsed else 0.5
+    return timeline_entry(minute, label, score, len(msgs))
+
+
+def pack_minutes(minute_buckets: dict, token_budget: int) -> list:
+    """
+    Splits the minutes of a call into chunks that fit the token budget of one request.
+
+    Args:
+        minute_buckets (dict): A mapping of minute index to (speaker, text) tuples.
+        token_budget (int): Maximum estimated transcript tokens per chunk.
+
+    Returns:
+        list: Lists of minute indexes in chronological order. A minute larger than
+              the budget gets a chunk of its own.
+    """
+    chunks, current, current_tokens = [], [], 0
+    for minute, msgs in sorted(minute_buckets.items()):
+        tokens = estimate_tokens(format_minute(msgs))
+        if current and current_tokens + tokens > token_budget:
+            chunks.append(current)
+            current, current_tokens = [], 0
+        current.append(minute)
+        current_tokens += tokens
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+async def score_minute_chunk(minutes: list, minute_buckets: dict, semaphore: asyncio.Semaphore) -> dict:
+    """
+    Scores several minutes with a single request.
+
+    Args:
+        minutes (list): The minute indexes in this chunk.
+        minute_buckets (dict): A mapping of minute index to (speaker, text) tuples.
+        semaphore (asyncio.Semaphore): Caps how many requests are in flight at once.
+
+    Returns:
+        dict: A mapping of minute index to timeline entry, for the minutes the model
+              returned a valid label for.
+    """
+    packed_text = "\n".join(
+        f"[minute {minute}]\n{format_minute(minute_buckets[minute])}" for minute in minutes
+    )
+    raw = await complete_chat(
+        [
+            {"role": "system", "content": PACKED_SYSTEM_PROMPT},
+            {"role": "user", "content": packed_text},
+        ],
+        semaphore,
+        f"minutes {minutes[0]}-{minutes[-1]}",
+    )
+    parsed = safe_parse_json(raw) if raw else None
+    if not isinstance(parsed, list):
+        return {}
+
+    entries = {}
+    for item in parsed:
+        if not isinstance(item, dict):
+            continue
+        try:
+            minute = int(item.get("minute"))
+            score = float(item.get("score", 0.5))
+        except (TypeError, ValueError):
+            continue
+        label = normalize_label(item.get("label"))
+        if minute in minute_buckets and minute in minutes and label:
+            entries[minute] = timeline_entry(minute, label, score, len(minute_buckets[minute]))
+    return entries
+
+
+def aggregate_sentiment(minute_summary: list) -> dict:
+    """
+    Rolls the per-minute timeline up into the overall sentiment.
+
+    Args:
+        minute_summary (list): Timeline entries in chronological order.
+
+    Returns:
+        dict: The sentiment result with 'sentiment_overall', 'overall_score', 'granularity' and 'timeline'.
+    """
+    labels, counts, avg_scores = aggregate_labels(
+        [m["label"] for m in minute_summary], [m["score"] for m in minute_summary]
+    )
+    # argmax returns the first of tied labels, i.e. the one that appeared first.
+    best = int(np.argmax(counts))
+    overall_label = labels[best]
+    overall_score = round(float(avg_scores[best]), 2)
+
+    return {
         "sentiment_overall": overall_label,
         "overall_score": overall_score,
         "granularity": "1-minute",
         "timeline": minute_summary
     }
 
+
+def classify_minutes_locally(minute_buckets: dict) -> dict:
+    """
+    Labels the minutes the local sentiment classifier is confident about.
+
+    Args:
+        minute_buckets (dict): A mapping of minute index to (speaker, text) tuples.
+
+    Returns:
+        dict: A mapping of minute index to timeline entry for the confident minutes.
+    """
+    minutes = sorted(minute_buckets)
+    predictions = classify_confident(
+        "sentiment", [format_minute(minute_buckets[m]) for m in minutes], EMOTION_LABELS
+    )
+    return {
+        minute: timeline_entry(minute, prediction[0], prediction[1], len(minute_buckets[minute]))
+        for minute, prediction in zip(minutes, predictions)
+        if prediction is not None
+    }
+
+
+async def score_minutes(minute_buckets: dict, mode: str, semaphore: asyncio.Semaphore) -> dict:
+    """
+    Scores a set of minutes of the call.
+
+    Minutes the local classifier is confident about are labelled without an LLM
+    call. For the others, in "per_minute" mode every minute is a separate request,
+    all sent concurrently. In "packed" mode minutes are packed into as few requests
+    as the token budget allows; minutes the model skipped or labelled outside
+    EMOTION_LABELS are then re-scored one by one.
+
+    Args:
+        minute_buckets (dict): A mapping of minute index to (speaker, text) tuples.
+        mode (str): "per_minute" or "packed".
+        semaphore (asyncio.Semaphore): Caps how many requests are in flight at once.
+
+    Returns:
+        dict: A mapping of minute index to timeline entry, for every minute given.
+    """
+    entries = classify_minutes_locally(minute_buckets)
+    remaining = {minute: msgs for minute, msgs in minute_buckets.items() if minute not in entries}
+    if mode == "packed" and remaining:
+        chunk_results = await asyncio.gather(*(
+            score_minute_chunk(minutes, minute_buckets, semaphore)
+            for minutes in pack_minutes(remaining, SENTIMENT_TOKEN_BUDGET)
+        ))
+        for chunk_entries in chunk_results:
+            entries.update(chunk_entries)
+
+    missing = [minute for minute in sorted(minute_buckets) if minute not in entries]
+    if mode == "packed" and missing:
+        print(f"Packed sentiment scoring missed minutes {missing}, scoring them one by one.")
+    scored = await asyncio.gather(*(
+        score_minute(minute, minute_buckets[minute], semaphore) for minute in missing
+    ))
+    entries.update(zip(missing, scored))
+    return entries
+
+
+async def analyze_sentiment(transcript, mode: str = None) -> dict:
+    """
+    Scores every minute of the transcript and aggregates the results.
+
+    Args:
+        transcript (list): [start_time, end_time, speaker_id, text] segments.
+        mode (str): "per_minute" or "packed", defaults to SAGE_SENTIMENT_MODE.
+
+    Returns:
+        dict: The sentiment result, see `aggregate_sentiment`.
+    """
+    semaphore = asyncio.Semaphore(SENTIMENT_CONCURRENCY)
+    minute_buckets = bucket_by_minute(transcript)
+    entries = await score_minutes(minute_buckets, mode or SENTIMENT_MODE, semaphore)
+    minute_summary = [entries[minute] for minute in sorted(minute_buckets)]
+    return aggregate_sentiment(minute_summary)
+
+
+class IncrementalSentiment:
+    """
+    Scores the minutes of a transcript that is still being transcribed.
+
+    Segments are added in call order as they become final. A minute is scored as
+    soon as a segment of a later minute arrives, so by the time the transcript is
+    complete only its last minute is left. A segment that arrives for a minute
+    already scored (one starting in the overlap of two windows) gets that minute
+    scored again with all its segments, and the later score is kept.
+    """
+
+    def __init__(self, mode: str = None):
+        self.mode = mode or SENTIMENT_MODE
+        self.semaphore = asyncio.Semaphore(SENTIMENT_CONCURRENCY)
+        self.minute_buckets = {}
+        self.scheduled = set()
+        self.tasks = []
+
+    def _schedule(self, minutes: list) -> None:
+        if not minutes:
+            return
+        self.scheduled.update(minutes)
+        # Snapshots, since segments arriving later are appended to the live buckets.
+        ready = {minute: list(self.minute_buckets[minute]) for minute in minutes}
+        self.tasks.append(asyncio.create_task(score_minutes(ready, self.mode, self.semaphore)))
+
+    def add(self, segments: list) -> None:
+        """Adds final segments and starts scoring the minutes they complete."""
+        if not segments:
+            return
+        touched = set()
+        for segment in segments:
+            minute = int(segment[0] // 60)
+            self.minute_buckets.setdefault(minute, []).append((str(segment[2]), str(segment[3])))
+            touched.add(minute)
+        current = int(segments[-1][0] // 60)
+        completed = {m for m in self.minute_buckets if m < current and m not in self.scheduled}
+        self._schedule(sorted(completed | (touched & self.scheduled)))
+
+    async def finish(self) -> dict:
+        """Scores the minutes left and aggregates the whole call."""
+        self._schedule([m for m in sorted(self.minute_buckets) if m not in self.scheduled])
+        entries = {}
+        # In scheduling order, so a minute scored again keeps its latest score.
+        for scored in await asyncio.gather(*self.tasks):
+            entries.update(scored)
+        response_cache.log_stats("sentiment")
+        return aggregate_sentiment([entries[minute] for minute in sorted(self.minute_buckets)])
+
+    def cancel(self) -> None:
+        for task in self.tasks:
+            task.cancel()
+
+
+@stage("sentiment")
+async def analyze_sentiment_per_minute(tool_context: ToolContext) -> dict:
+    """
+    Analyzes the emotional tone and satisfaction level of the transcript per minute and saves it to the state.
+    """
+    transcript = state_value(tool_context.state, "transcript")
+    if not transcript:
+        return {"error": "Transcript not found in state."}
+
+    result = await analyze_sentiment(transcript)
+    response_cache.log_stats("sentiment")
+
     tool_context.state["sentiment_state"] = result
-    return result
+    tool_context.state["sentiment_audio_hash"] = tool_context.state.get("audio_hash")
+    # The timeline stays in the state only, so the function response event remains small.
+    return {
+        "sentiment_overall": result["sentiment_overall"],
+        "overall_score": result["overall_score"],
+        "minutes": len(result["timeline"]),
+    }
+
+
+def reuse_scored_sentiment(callback_context: CallbackContext):
+    """
+    Skips the agent when the sentiment of this recording is already in the state.
+
+    The incremental pipeline scores the sentiment while the call is being
+    transcribed, so there is nothing left to do by the time this agent runs.
+
+    Returns:
+        types.Content | None: A short note, which skips the LLM call, or None to run the agent.
+    """
+    state = callback_context.state
+    audio_hash = state.get("audio_hash")
+    if not audio_hash or not state.get("sentiment_state") or state.get("sentiment_audio_hash") != audio_hash:
+        return None
+    overall = (state_value(state, "sentiment_state") or {}).get("sentiment_overall")
+    return types.Content(role="model", parts=[types.Part(text=f"Sentiment already analyzed: {overall}")])
 
 sentiment_agent = Agent(
     name="sentiment_agent",
@@ -104,4 +447,7 @@ sentiment_agent = Agent(
     
     """,
     tools=[analyze_sentiment_per_minute],
+    before_agent_callback=reuse_scored_sentiment,
+    before_model_callback=wait_for_rate_limit,
+    on_model_error_callback=record_model_error,
 )
\ No newline at end of file
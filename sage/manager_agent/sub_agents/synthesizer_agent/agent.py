@@ -1,31 +1,40 @@
 from google.adk.agents import Agent
 from google.adk.models.lite_llm import LiteLlm
 from google.adk.tools.tool_context import ToolContext
-import google.generativeai as genai
+import asyncio
 import os
 import json
 from dotenv import load_dotenv
+from ...blob_store import state_instruction, state_value
+from ...clients import generate_content_async, generative_model
+from ...columnar import columnar_for
+from ...compaction import (
+    PROMPT_TOKEN_BUDGET,
+    compact_json,
+    compact_transcript,
+    estimate_tokens,
+    record_compaction,
+)
+from ...llm_cache import cached_response_async, response_cache
+from ...scheduler import record_model_error, scheduled_call_async, wait_for_rate_limit
+from ...stages import stage
 load_dotenv()
 
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
-model = genai.GenerativeModel('gemini-2.0-flash')
-
-def generate_summary_report(tool_context: ToolContext) -> dict:
-    """
-    Generates a final summary report based on the analysis from other agents.
+model = generative_model('gemini-2.0-flash')
 
-    Args:
-        tool_context (ToolContext): The tool context containing the analysis results.
+# "auto" switches to map-reduce for calls longer than SAGE_SUMMARY_MAPREDUCE_MINUTES,
+# "single" always sends one prompt and "map_reduce" always summarizes in windows.
+SUMMARY_MODE = os.getenv("SAGE_SUMMARY_MODE", "auto")
+SUMMARY_MAPREDUCE_MINUTES = float(os.getenv("SAGE_SUMMARY_MAPREDUCE_MINUTES", "30"))
+SUMMARY_WINDOW_MINUTES = float(os.getenv("SAGE_SUMMARY_WINDOW_MINUTES", "10"))
+SUMMARY_CONCURRENCY = int(os.getenv("SAGE_SUMMARY_CONCURRENCY", "4"))
+# Number of partial summaries merged together per reduce step.
+SUMMARY_REDUCE_FANIN = 4
 
-    Returns:
-        dict: A dictionary containing the final summary report.
-    """
-    intent = tool_context.state.get("intent_state", "Not available")
-    root_cause = tool_context.state.get("root_cause_state", "Not available")
-    sentiment_details = tool_context.state.get("sentiment_state", [])
-    transcript = tool_context.state.get("transcript", [])
 
-    prompt = f"""Generate a comprehensive summary report for the following customer service call.
+def build_report_prompt(intent, root_cause, sentiment_json: str, transcript_section: str) -> str:
+    """Builds the prompt for the final four-section report."""
+    return f"""Generate a comprehensive summary report for the following customer service call.
     The report should be well-structured and include the following sections:
     1.  **Intent:** The customer's primary reason for calling.
     2.  **Root Cause:** The underlying issue or problem.
@@ -34,30 +43,160 @@ def generate_summary_report(tool_context: ToolContext) -> dict:
 
     **Intent:** {intent}
     **Root Cause:** {root_cause}
-    **Sentiment Details:** {json.dumps(sentiment_details, indent=2)}
+    **Sentiment Details:** {sentiment_json}
     **Transcript:**
-    {"\n".join([f"{s[2]}: {s[3]}" for s in transcript])}
+    {transcript_section}
 
     Generate a detailed report based on this information.
     """
 
-    response = model.generate_content(prompt)
-    summary = response.text.strip()
+
+async def generate_text(prompt: str) -> str:
+    """Sends a prompt to the report model, answering repeated prompts from the LLM response cache."""
+    async def request():
+        response = await scheduled_call_async(
+            model.model_name,
+            lambda: generate_content_async(model, prompt),
+            tokens=estimate_tokens(prompt),
+        )
+        return response.text.strip()
+
+    return await cached_response_async("synthesis", model.model_name, prompt, request)
+
+
+async def summarize_text(prompt: str, semaphore: asyncio.Semaphore) -> str:
+    async with semaphore:
+        return await generate_text(prompt)
+
+
+async def summarize_windows(transcript) -> tuple:
+    """
+    Summarizes a long call window by window, then merges the window summaries.
+
+    Windows of SUMMARY_WINDOW_MINUTES are summarized concurrently. While the
+    summaries are still over the prompt token budget, groups of them are merged
+    into higher-level summaries, so the final prompt stays bounded however long
+    the call is.
+
+    Args:
+        transcript (list): [start_time, end_time, speaker_id, text] segments.
+
+    Returns:
+        tuple: (the transcript section for the final prompt, a compaction report).
+    """
+    semaphore = asyncio.Semaphore(SUMMARY_CONCURRENCY)
+    window_seconds = SUMMARY_WINDOW_MINUTES * 60
+    windows, groups = columnar_for(transcript).minute_groups(window_seconds)
+    window_budget = max(1000, PROMPT_TOKEN_BUDGET)
+
+    # Each part is (start minute, end minute, summary text).
+    windows_text = []
+    for window, indices in zip(windows, groups):
+        window_text, _ = compact_transcript([transcript[i] for i in indices], window_budget)
+        windows_text.append((
+            int(window * SUMMARY_WINDOW_MINUTES), int((window + 1) * SUMMARY_WINDOW_MINUTES), window_text
+        ))
+
+    summaries = await asyncio.gather(*(
+        summarize_text(
+            f"""Summarize this part (minutes {start}-{end}) of a customer service call at a bank.
+    List the customer's requests and problems, what the agent did, any commitments made,
+    and how the customer's mood changed. Be concise and factual.
+
+    {window_text}
+    """,
+            semaphore,
+        )
+        for start, end, window_text in windows_text
+    ))
+    parts = [(start, end, summary) for (start, end, _), summary in zip(windows_text, summaries)]
+
+    def render(part):
+        return f"[minutes {part[0]}-{part[1]}]\n{part[2]}"
+
+    reduce_rounds = 0
+    while len(parts) > 1 and estimate_tokens("\n\n".join(map(render, parts))) > PROMPT_TOKEN_BUDGET:
+        batches = [parts[i:i + SUMMARY_REDUCE_FANIN] for i in range(0, len(parts), SUMMARY_REDUCE_FANIN)]
+        merged = await asyncio.gather(*(
+            summarize_text(
+                "Merge these consecutive partial summaries of one customer service call into a single "
+                "chronological summary. Keep every request, problem, commitment and mood change.\n\n"
+                + "\n\n".join(map(render, batch)),
+                semaphore,
+            )
+            for batch in batches
+        ))
+        parts = [(batch[0][0], batch[-1][1], summary) for batch, summary in zip(batches, merged)]
+        reduce_rounds += 1
+
+    section = "(Summarized in time windows)\n" + "\n\n".join(map(render, parts))
+    original_tokens = estimate_tokens(columnar_for(transcript).joined_text(sep="\n", with_speakers=True))
+    report = {
+        "original_tokens": original_tokens,
+        "compacted_tokens": estimate_tokens(section),
+        "tokens_saved": original_tokens - estimate_tokens(section),
+        "windows": len(windows_text),
+        "reduce_rounds": reduce_rounds,
+    }
+    return section, report
+
+
+@stage("synthesis")
+async def generate_summary_report(tool_context: ToolContext) -> dict:
+    """
+    Generates a final summary report based on the analysis from other agents.
+
+    Args:
+        tool_context (ToolContext): The tool context containing the analysis results.
+
+    Returns:
+        dict: A confirmation. The report is saved to the state under 'analysis_report'.
+    """
+    intent = tool_context.state.get("intent_state", "Not available")
+    root_cause = tool_context.state.get("root_cause_state", "Not available")
+    sentiment_details = state_value(tool_context.state, "sentiment_state", [])
+    transcript = state_value(tool_context.state, "transcript", [])
+
+    duration_minutes = columnar_for(transcript).duration / 60
+    map_reduce = SUMMARY_MODE == "map_reduce" or (
+        SUMMARY_MODE == "auto" and duration_minutes > SUMMARY_MAPREDUCE_MINUTES
+    )
+    if map_reduce and transcript:
+        transcript_text, compaction = await summarize_windows(transcript)
+    else:
+        transcript_text, compaction = compact_transcript(transcript)
+
+    sentiment_json = compact_json(sentiment_details)
+    sentiment_original = estimate_tokens(json.dumps(sentiment_details, indent=2, default=str))
+    sentiment_compacted = estimate_tokens(sentiment_json)
+    # The totals cover the transcript and the sentiment timeline, so they add up with tokens_saved.
+    compaction["sentiment_tokens_saved"] = sentiment_original - sentiment_compacted
+    compaction["original_tokens"] += sentiment_original
+    compaction["compacted_tokens"] += sentiment_compacted
+    compaction["tokens_saved"] = compaction["original_tokens"] - compaction["compacted_tokens"]
+    record_compaction(tool_context.state, "synthesis", compaction)
+
+    prompt = build_report_prompt(intent, root_cause, sentiment_json, transcript_text)
+    summary = await generate_text(prompt)
+    response_cache.log_stats("synthesis")
 
     tool_context.state["analysis_report"] = summary
-    return {"analysis_report": summary}
+    return {"status": "Report saved to the state as analysis_report."}
 
 synthesizer_agent = Agent(
     name="synthesizer_agent",
     model=LiteLlm(model="openai/gpt-4o"),
     description="Synthesizes the analysis from other agents into a final report and handles follow-up questions.",
-    instruction="""
+    # Filled by state_instruction, since the report and sentiment may be in the blob store.
+    instruction=state_instruction("""
     You are the Smart Agent. Your primary role is to generate a final and answer any question user might have. Comprehensive report by synthesizing the analysis from the intent, sentiment, and root cause agents.
     If Analysis Report: {analysis_report} is None then always generate a summary report using the tool you have.
     Answer the any question the user have based on {intent_state}, {sentiment_state}, {root_cause_state} and {analysis_report}.
     
     You have access to the following tools:
     - `generate_summary_report`: Call this tool to generate the final report.
-    """,
-    tools=[generate_summary_report]
+    """),
+    tools=[generate_summary_report],
+    before_model_callback=wait_for_rate_limit,
+    on_model_error_callback=record_model_error,
 )
@@ -0,0 +1,489 @@
+import contextlib
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+import urllib.request
+from collections import defaultdict
+
+from google.adk.plugins.base_plugin import BasePlugin
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Spans are recorded unless SAGE_TRACE=0. SAGE_TRACE_EXPORT picks where finished traces go:
+# "jsonl" appends one span per line to SAGE_TRACE_PATH, "otlp" writes OTLP/JSON trace requests,
+# to SAGE_TRACE_OTLP_ENDPOINT (e.g. http://localhost:4318/v1/traces) or else to SAGE_TRACE_PATH.
+TRACE_ENABLED = os.getenv("SAGE_TRACE", "1") != "0"
+TRACE_EXPORT = os.getenv("SAGE_TRACE_EXPORT", "")
+TRACE_PATH = os.getenv("SAGE_TRACE_PATH", "./traces/spans.jsonl")
+TRACE_OTLP_ENDPOINT = os.getenv("SAGE_TRACE_OTLP_ENDPOINT", "")
+SERVICE_NAME = "sage"
+
+SESSION_METHODS = ("create_session", "get_session", "list_sessions", "append_event", "delete_session")
+
+_current_trace = contextvars.ContextVar("sage_trace", default=None)
+_current_span = contextvars.ContextVar("sage_span", default=None)
+_export_lock = threading.Lock()
+
+
+def payload_bytes(value) -> int:
+    """Returns the size of a value serialized as JSON, falling back to its string form."""
+    if hasattr(value, "model_dump_json"):
+        return len(value.model_dump_json(exclude_none=True).encode("utf-8"))
+    try:
+        return len(json.dumps(value, default=str).encode("utf-8"))
+    except (TypeError, ValueError):
+        return len(str(value).encode("utf-8"))
+
+
+def usage_attributes(result) -> dict:
+    """Reads the prompt and completion tokens of an OpenAI, LiteLLM or Gemini response."""
+    usage = getattr(result, "usage", None)
+    if usage is not None:
+        prompt = getattr(usage, "prompt_tokens", None) or getattr(usage, "input_tokens", None)
+        completion = getattr(usage, "completion_tokens", None) or getattr(usage, "output_tokens", None)
+    else:
+        usage = getattr(result, "usage_metadata", None)
+        prompt = getattr(usage, "prompt_token_count", None)
+        completion = getattr(usage, "candidates_token_count", None)
+    tokens = {"prompt_tokens": prompt, "completion_tokens": completion}
+    return {name: value for name, value in tokens.items() if isinstance(value, int)}
+
+
+class Span:
+    """One timed operation of a trace: an agent, a tool, an LLM call or a session read/write."""
+
+    def __init__(self, trace_id: str, name: str, kind: str, parent_id: str = None, attributes: dict = None):
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.attributes = {}
+        self.status = "ok"
+        self.start_ns = time.time_ns()
+        self.duration_s = None
+        self._started = time.perf_counter()
+        self.set(**(attributes or {}))
+
+    def set(self, **attributes) -> None:
+        """Adds attributes to the span, skipping those that are None."""
+        self.attributes.update({name: value for name, value in attributes.items() if value is not None})
+
+    def error(self, error: Exception) -> None:
+        self.status = "error"
+        self.attributes["error"] = f"{type(error).__name__}: {error}"[:500]
+
+    def end(self) -> None:
+        if self.duration_s is None:
+            self.duration_s = time.perf_counter() - self._started
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start_ns": self.start_ns,
+            "duration_ms": round((self.duration_s or 0.0) * 1000, 3),
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+class _NoSpan:
+    """Stands in for a span when no trace is being recorded."""
+
+    def set(self, **attributes) -> None:
+        pass
+
+    def error(self, error: Exception) -> None:
+        pass
+
+
+NO_SPAN = _NoSpan()
+
+
+class Trace:
+    """The spans of one analysis or chat turn, under a root span covering the whole run."""
+
+    def __init__(self, name: str, **attributes):
+        self.trace_id = os.urandom(16).hex()
+        self.spans = []
+        self._lock = threading.Lock()
+        self.root = self.start_span(name, "run", None, attributes)
+
+    def start_span(self, name: str, kind: str, parent: Span = None, attributes: dict = None) -> Span:
+        span = Span(self.trace_id, name, kind, parent.span_id if parent else None, attributes)
+        with self._lock:
+            self.spans.append(span)
+        return span
+
+    def finish(self) -> None:
+        """Ends the spans left open, e.g. by an agent that raised, and then the root span."""
+        with self._lock:
+            spans = list(self.spans)
+        for span in spans:
+            if span is not self.root:
+                span.end()
+        self.root.end()
+
+    def summary_rows(self) -> list:
+        """
+        Aggregates the spans by kind and name.
+
+        Returns:
+            list: One dict per (kind, name) with calls, total and max milliseconds, tokens,
+                  payload bytes and share of the run, slowest first. Agent spans contain
+                  the spans of their tools and LLM calls, so shares add up to more than 100%.
+        """
+        wall_s = self.root.duration_s or 1e-9
+        groups = defaultdict(lambda: {"calls": 0, "total_s": 0.0, "max_s": 0.0, "tokens": 0, "bytes": 0, "errors": 0})
+        with self._lock:
+            spans = [span for span in self.spans if span is not self.root]
+        for span in spans:
+            group = groups[(span.kind, span.name)]
+            duration = span.duration_s or 0.0
+            group["calls"] += 1
+            group["total_s"] += duration
+            group["max_s"] = max(group["max_s"], duration)
+            group["tokens"] += span.attributes.get("prompt_tokens", 0) + span.attributes.get("completion_tokens", 0)
+            group["bytes"] += span.attributes.get("request_bytes", 0) + span.attributes.get("response_bytes", 0)
+            group["errors"] += span.status == "error"
+        rows = [
+            {
+                "kind": kind,
+                "name": name,
+                "calls": group["calls"],
+                "total_ms": round(group["total_s"] * 1000, 1),
+                "max_ms": round(group["max_s"] * 1000, 1),
+                "tokens": group["tokens"],
+                "bytes": group["bytes"],
+                "errors": group["errors"],
+                "share": round(group["total_s"] / wall_s, 3),
+            }
+            for (kind, name), group in groups.items()
+        ]
+        return sorted(rows, key=lambda row: -row["total_ms"])
+
+
+def current_trace():
+    """Returns the trace recorded in the current context, or None."""
+    return _current_trace.get()
+
+
+@contextlib.contextmanager
+def trace(name: str, **attributes):
+    """
+    Records the spans started inside the block, and the tasks and threads it starts, as one trace.
+
+    The trace is exported following SAGE_TRACE_EXPORT when the block exits.
+
+    Args:
+        name (str): The name of the root span, e.g. "analysis".
+        **attributes: Attributes of the root span.
+
+    Yields:
+        Trace | None: The trace, or None if tracing is disabled.
+    """
+    if not TRACE_ENABLED:
+        yield None
+        return
+    current = Trace(name, **attributes)
+    trace_token = _current_trace.set(current)
+    span_token = _current_span.set(current.root)
+    try:
+        yield current
+    except BaseException as e:
+        current.root.error(e)
+        raise
+    finally:
+        _current_span.reset(span_token)
+        _current_trace.reset(trace_token)
+        current.finish()
+        export_trace(current)
+
+
+@contextlib.contextmanager
+def span(name: str, kind: str, **attributes):
+    """
+    Times the block as a child of the current span.
+
+    Args:
+        name (str): The span name, e.g. a model or session method.
+        kind (str): "agent", "tool", "llm" or "session".
+        **attributes: Attributes of the span.
+
+    Yields:
+        Span: The span, or NO_SPAN outside of a trace.
+    """
+    current = _current_trace.get()
+    if current is None:
+        yield NO_SPAN
+        return
+    opened = current.start_span(name, kind, _current_span.get(), attributes)
+    token = _current_span.set(opened)
+    try:
+        yield opened
+    except BaseException as e:
+        opened.error(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        opened.end()
+
+
+def format_summary(current: Trace, limit: int = 20) -> str:
+    """Formats the summary rows of a trace as a text table for the terminal."""
+    header = f"{'kind':<8} {'name':<36} {'calls':>5} {'total ms':>10} {'max ms':>10} {'tokens':>8} {'bytes':>10} {'share':>6}"
+    lines = [
+        f"Trace {current.trace_id}: {current.root.name} took {(current.root.duration_s or 0.0) * 1000:.1f} ms",
+        header,
+        "-" * len(header),
+    ]
+    for row in current.summary_rows()[:limit]:
+        name = row["name"] if len(row["name"]) <= 36 else row["name"][:33] + "..."
+        errors = f"  ({row['errors']} failed)" if row["errors"] else ""
+        lines.append(
+            f"{row['kind']:<8} {name:<36} {row['calls']:>5} {row['total_ms']:>10.1f} {row['max_ms']:>10.1f} "
+            f"{row['tokens']:>8} {row['bytes']:>10} {row['share']:>6.0%}{errors}"
+        )
+    return "\n".join(lines)
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def to_otlp(current: Trace) -> dict:
+    """Converts a trace into an OTLP/JSON ExportTraceServiceRequest."""
+    spans = []
+    for span in current.spans:
+        attributes = dict(span.attributes, **{"sage.kind": span.kind})
+        spans.append({
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "parentSpanId": span.parent_id or "",
+            "name": span.name,
+            # SPAN_KIND_CLIENT for calls leaving the process, SPAN_KIND_INTERNAL otherwise.
+            "kind": 3 if span.kind in ("llm", "session") else 1,
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.start_ns + int((span.duration_s or 0.0) * 1e9)),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items()],
+            "status": {"code": 2, "message": span.attributes.get("error", "")} if span.status == "error" else {"code": 1},
+        })
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+            "scopeSpans": [{"scope": {"name": "sage.tracing"}, "spans": spans}],
+        }]
+    }
+
+
+def _append_lines(path: str, lines: list) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with _export_lock, open(path, "a", encoding="utf-8") as f:
+        f.writelines(line + "\n" for line in lines)
+
+
+def export_trace(current: Trace, export: str = None, path: str = None) -> None:
+    """
+    Writes a finished trace out. Export errors are printed, never raised, so they cannot fail an analysis.
+
+    Args:
+        current (Trace): The trace.
+        export (str): "jsonl", "otlp" or "" for no export. Defaults to SAGE_TRACE_EXPORT.
+        path (str): The output file. Defaults to SAGE_TRACE_PATH.
+    """
+    export = TRACE_EXPORT if export is None else export
+    path = path or TRACE_PATH
+    try:
+        if export == "jsonl":
+            _append_lines(path, [json.dumps(span.to_dict(), default=str) for span in current.spans])
+        elif export == "otlp" and TRACE_OTLP_ENDPOINT:
+            request = urllib.request.Request(
+                TRACE_OTLP_ENDPOINT,
+                data=json.dumps(to_otlp(current), default=str).encode("utf-8"),
+                headers={"Content-Type": "application/json"},
+                method="POST",
+            )
+            with urllib.request.urlopen(request, timeout=10):
+                pass
+        elif export == "otlp":
+            # The line-delimited format read by the OpenTelemetry Collector's otlpjsonfile receiver.
+            _append_lines(path, [json.dumps(to_otlp(current), default=str)])
+    except Exception as e:
+        print(f"Could not export trace {current.trace_id}: {e}")
+
+
+class TracingPlugin(BasePlugin):
+    """
+    Runner plugin recording a span for every agent, tool and LLM request of an invocation.
+
+    Spans join the trace opened around the run with `trace()`. Runs started without
+    one (e.g. by batch.py or `adk web`) get a trace of their own, exported when the
+    run ends.
+    """
+
+    def __init__(self, name: str = "sage_tracing"):
+        super().__init__(name)
+        self._traces = {}
+        self._spans = {}
+
+    def _open(self, invocation_id: str, key: tuple, name: str, kind: str, parent_key: tuple = None,
+              attributes: dict = None):
+        current = self._traces.get(invocation_id, (None, False))[0]
+        if current is None:
+            return None
+        parent = self._spans.get((invocation_id, *parent_key)) if parent_key else None
+        opened = current.start_span(name, kind, parent or current.root, attributes)
+        self._spans[(invocation_id, *key)] = opened
+        return opened
+
+    def _close(self, invocation_id: str, key: tuple, error: Exception = None):
+        opened = self._spans.pop((invocation_id, *key), None)
+        if opened is not None:
+            if error is not None:
+                opened.error(error)
+            opened.end()
+        return opened
+
+    async def before_run_callback(self, *, invocation_context):
+        current, owned = _current_trace.get(), False
+        if current is None and TRACE_ENABLED:
+            current, owned = Trace(invocation_context.agent.name, session_id=invocation_context.session.id), True
+        if current is not None:
+            self._traces[invocation_context.invocation_id] = (current, owned)
+        return None
+
+    async def after_run_callback(self, *, invocation_context):
+        invocation_id = invocation_context.invocation_id
+        current, owned = self._traces.pop(invocation_id, (None, False))
+        for key in [key for key in self._spans if key[0] == invocation_id]:
+            self._spans.pop(key).end()
+        if owned:
+            current.finish()
+            export_trace(current)
+
+    async def before_agent_callback(self, *, agent, callback_context):
+        parent = agent.parent_agent
+        opened = self._open(
+            callback_context.invocation_id, ("agent", agent.name), agent.name, "agent",
+            ("agent", parent.name) if parent else None,
+        )
+        if opened is not None:
+            # Lets scheduled_call and session spans started by the agent nest under it.
+            _current_span.set(opened)
+        return None
+
+    async def after_agent_callback(self, *, agent, callback_context):
+        closed = self._close(callback_context.invocation_id, ("agent", agent.name))
+        if closed is not None:
+            parent = self._spans.get((callback_context.invocation_id, "agent", agent.parent_agent.name)) \
+                if agent.parent_agent else None
+            current = self._traces[callback_context.invocation_id][0]
+            _current_span.set(parent or current.root)
+        return None
+
+    async def before_model_callback(self, *, callback_context, llm_request):
+        # Imported here, the scheduler records its own requests through this module.
+        from .scheduler import model_key
+
+        text = "".join(
+            part.text or "" for content in llm_request.contents for part in (content.parts or [])
+        )
+        self._open(
+            callback_context.invocation_id, ("llm", callback_context.agent_name), model_key(llm_request.model or "llm"),
+            "llm", ("agent", callback_context.agent_name),
+            {"agent": callback_context.agent_name, "request_bytes": len(text.encode("utf-8"))},
+        )
+        return None
+
+    async def after_model_callback(self, *, callback_context, llm_response):
+        if llm_response.partial:
+            return None
+        closed = self._close(callback_context.invocation_id, ("llm", callback_context.agent_name))
+        if closed is not None:
+            usage = llm_response.usage_metadata
+            text = "".join(
+                part.text or "" for part in (llm_response.content.parts or [])
+            ) if llm_response.content else ""
+            closed.set(
+                prompt_tokens=usage.prompt_token_count if usage else None,
+                completion_tokens=usage.candidates_token_count if usage else None,
+                response_bytes=len(text.encode("utf-8")),
+            )
+        return None
+
+    async def on_model_error_callback(self, *, callback_context, llm_request, error):
+        self._close(callback_context.invocation_id, ("llm", callback_context.agent_name), error)
+        return None
+
+    async def before_tool_callback(self, *, tool, tool_args, tool_context):
+        opened = self._open(
+            tool_context.invocation_id, ("tool", tool_context.function_call_id), tool.name, "tool",
+            ("agent", tool_context.agent_name), {"request_bytes": payload_bytes(tool_args)},
+        )
+        if opened is not None:
+            _current_span.set(opened)
+        return None
+
+    async def after_tool_callback(self, *, tool, tool_args, tool_context, result):
+        closed = self._close(tool_context.invocation_id, ("tool", tool_context.function_call_id))
+        if closed is not None:
+            closed.set(response_bytes=payload_bytes(result))
+            self._restore_agent_span(tool_context)
+        return None
+
+    async def on_tool_error_callback(self, *, tool, tool_args, tool_context, error):
+        if self._close(tool_context.invocation_id, ("tool", tool_context.function_call_id), error):
+            self._restore_agent_span(tool_context)
+        return None
+
+    def _restore_agent_span(self, tool_context) -> None:
+        agent_span = self._spans.get((tool_context.invocation_id, "agent", tool_context.agent_name))
+        if agent_span is not None:
+            _current_span.set(agent_span)
+
+
+def _traced_session_call(method_name: str, method):
+    @functools.wraps(method)
+    async def wrapper(*args, **kwargs):
+        with span(method_name, "session", session_id=kwargs.get("session_id")) as opened:
+            result = await method(*args, **kwargs)
+            if opened is not NO_SPAN:
+                if method_name == "append_event":
+                    opened.set(request_bytes=payload_bytes(kwargs.get("event", args[-1] if args else None)))
+                elif hasattr(result, "state"):
+                    opened.set(response_bytes=payload_bytes(result.state))
+            return result
+    wrapper.traced = True
+    return wrapper
+
+
+def instrument_session_service(service):
+    """
+    Records a session span for every read and write of a session service.
+
+    Args:
+        service: A BaseSessionService, instrumented in place.
+
+    Returns:
+        The same service.
+    """
+    for method_name in SESSION_METHODS:
+        method = getattr(service, method_name, None)
+        if method is None or getattr(method, "traced", False):
+            continue
+        setattr(service, method_name, _traced_session_call(method_name, method))
+    return service
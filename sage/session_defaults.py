@@ -0,0 +1,34 @@
+import copy
+
+# The app and user every session is stored under, shared by the app, the CLI,
+# the batch runner and the dataset export.
+APP_NAME = "Bank Audio Transcript Analyst"
+USER_ID = "dedsec995"
+
+# The state of a new session. Use new_session_state rather than this dict itself.
+initial_state = {
+    "user_name": "Amit Luhar",
+    "intent_state": None,
+    "sentiment_state": None,
+    "root_cause_state": None,
+    "is_audio_transcribed": False,
+    "audio_filepath": None,
+    "transcript": [],
+    "analysis_report": None,
+    "interaction_history": [],
+}
+
+
+def new_session_state(**values) -> dict:
+    """
+    Builds the state of a new session.
+
+    The lists of initial_state are copied too, so sessions created in the same
+    process never share them.
+
+    Args:
+        **values: State values to set, e.g. audio_filepath.
+    """
+    state = copy.deepcopy(initial_state)
+    state.update(values)
+    return state
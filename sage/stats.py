@@ -0,0 +1,12 @@
+# Summary statistics shared by the batch runner and the benchmarks.
+
+
+def percentile(values, pct):
+    """Returns the pct-th percentile of a list of numbers using linear interpolation."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100
+    lower = int(k)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (k - lower)
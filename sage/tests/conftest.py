@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The tests import the sage/ modules the way the entry points do, from the sage/ directory.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Importing manager_agent builds the agents; keep LiteLLM from fetching its model cost map.
+os.environ.setdefault("LITELLM_LOCAL_MODEL_COST_MAP", "True")
@@ -0,0 +1,61 @@
+import asyncio
+import os
+
+from google.adk.events import Event, EventActions
+from google.adk.sessions import InMemorySessionService
+
+from manager_agent import blob_store as blob_module
+from manager_agent.blob_store import BlobStore, blob_digests, offload_session_state, prune_unreferenced_blobs
+
+
+def test_same_value_is_written_once(tmp_path):
+    store = BlobStore(str(tmp_path))
+    first = store.put({"report": "x" * 2000})
+    second = store.put({"report": "x" * 2000})
+    assert first == second
+    assert store.stats()["writes"] == 1
+    assert store.get(first) == {"report": "x" * 2000}
+
+
+def test_blob_digests_finds_nested_references():
+    state = {"transcript": {"$blob": "a", "bytes": 1}, "other": [{"$blob": "b", "bytes": 1}, 3], "text": "c"}
+    assert blob_digests(state) == {"a", "b"}
+
+
+def test_prune_keeps_referenced_and_recent_blobs(tmp_path):
+    store = BlobStore(str(tmp_path))
+    kept = store.put(["kept"])
+    dropped = store.put(["dropped"])
+    recent = store.put(["recent"])
+    for ref in (kept, dropped):
+        os.utime(store._blob_path(ref["$blob"]), (0, 0))
+
+    result = store.prune({kept["$blob"]}, min_age_s=60)
+    assert result["removed"] == 1
+    assert os.path.exists(store._blob_path(kept["$blob"]))
+    assert os.path.exists(store._blob_path(recent["$blob"]))
+    assert not os.path.exists(store._blob_path(dropped["$blob"]))
+
+
+def test_prune_unreferenced_blobs_reads_state_and_events(tmp_path, monkeypatch):
+    store = BlobStore(str(tmp_path))
+    monkeypatch.setattr(blob_module, "blob_store", store)
+    monkeypatch.setattr(blob_module, "BLOB_MIN_BYTES", 10)
+
+    async def main():
+        service = offload_session_state(InMemorySessionService())
+        session = await service.create_session(
+            app_name="app", user_id="u", state={"transcript": [[0, 1, "A", "x" * 50]]}
+        )
+        event = Event(
+            author="agent", invocation_id="i", actions=EventActions(state_delta={"analysis_report": "r" * 50})
+        )
+        await service.append_event(session, event)
+        orphan = store.put("orphan" * 10)
+        for root, _, names in os.walk(store.blob_dir):
+            for name in names:
+                os.utime(os.path.join(root, name), (0, 0))
+        return orphan, await prune_unreferenced_blobs(service, "app", min_age_s=60)
+
+    orphan, result = asyncio.run(main())
+    assert result == {"kept": 2, "removed": 1, "bytes_freed": orphan["bytes"], "sessions": 1}
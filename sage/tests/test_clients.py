@@ -0,0 +1,18 @@
+import asyncio
+
+from manager_agent import clients
+
+
+def test_async_client_is_shared_within_a_loop_and_closed_with_it(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+
+    async def use():
+        client = clients.async_openai_client()
+        assert clients.async_openai_client() is client
+        return client
+
+    first = asyncio.run(use())
+    second = asyncio.run(use())
+    assert first is not second
+    assert first.is_closed() and second.is_closed()
+    assert len(clients._async_openai_clients) == 0
@@ -0,0 +1,33 @@
+import pytest
+
+from manager_agent.columnar import aggregate_labels, columnar_for
+
+GREETING = [0.0, 4.0, "A", "Thank you for calling, how can I help?"]
+CLOSING = [60.0, 64.0, "A", "Is there anything else I can help with?"]
+
+
+def test_transcripts_sharing_opening_and_closing_get_their_own_view():
+    first = [GREETING, [10.0, 20.0, "B", "I lost my card."], CLOSING]
+    second = [GREETING, [10.0, 20.0, "B", "I want to open an account."], CLOSING]
+    assert columnar_for(first) is not columnar_for(second)
+    assert "I lost my card." in columnar_for(first).joined_text()
+    assert "open an account" in columnar_for(second).joined_text()
+
+
+def test_equal_transcripts_share_the_view():
+    transcript = [GREETING, [10.0, 20.0, "B", "I lost my card."], CLOSING]
+    assert columnar_for(transcript) is columnar_for([list(segment) for segment in transcript])
+
+
+def test_minute_groups_keep_segment_order():
+    columnar = columnar_for([[0.0, 5.0, "A", "a"], [70.0, 75.0, "B", "b"], [30.0, 35.0, "B", "c"]])
+    windows, groups = columnar.minute_groups()
+    assert list(windows) == [0, 1]
+    assert [list(group) for group in groups] == [[0, 2], [1]]
+
+
+def test_aggregate_labels_mixes_types():
+    labels, counts, averages = aggregate_labels(["Calm", None, "Calm"], [0.2, 0.5, 0.4])
+    assert labels == ["Calm", "None"]
+    assert list(counts) == [2, 1]
+    assert list(averages) == pytest.approx([0.3, 0.5])
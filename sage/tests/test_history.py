@@ -0,0 +1,70 @@
+import pytest
+
+from manager_agent import history as history_module
+from manager_agent.history import HistoryLog, append_history, chat_messages, is_rollup
+
+
+@pytest.fixture
+def log(tmp_path, monkeypatch):
+    log = HistoryLog(str(tmp_path))
+    monkeypatch.setattr(history_module, "history_log", log)
+    return log
+
+
+def turn(index):
+    return [
+        {"action": "user_query", "query": f"question {index}", "timestamp": f"t{index}"},
+        {"action": "agent_response", "agent": "manager_agent", "response": f"answer {index}", "timestamp": f"t{index}"},
+    ]
+
+
+def test_history_under_the_limit_is_kept_as_is(log):
+    history = append_history([], turn(0), "s1", max_entries=4)
+    assert history == turn(0)
+    assert log.read("s1") == turn(0)
+
+
+def test_overflow_is_rolled_up_and_logged(log):
+    history = []
+    for index in range(3):
+        history = append_history(history, turn(index), "s1", max_entries=4)
+
+    assert is_rollup(history[0])
+    assert history[0]["entries"] == 2
+    assert history[0]["user_queries"] == 1 and history[0]["agent_responses"] == 1
+    assert history[0]["last_query"] == "question 0"
+    assert history[1:] == turn(1) + turn(2)
+    assert log.read("s1") == turn(0) + turn(1) + turn(2)
+
+    history = append_history(history, turn(3), "s1", max_entries=4)
+    assert history[0]["entries"] == 4
+    assert history[0]["first_timestamp"] == "t0" and history[0]["timestamp"] == "t1"
+
+
+def test_zero_keeps_every_entry(log):
+    history = []
+    for index in range(5):
+        history = append_history(history, turn(index), "s1", max_entries=0)
+    assert len(history) == 10 and not any(is_rollup(entry) for entry in history)
+
+
+def test_history_from_before_the_log_is_written_to_it_first(log):
+    append_history(turn(0), turn(1), "old", max_entries=20)
+    assert log.read("old") == turn(0) + turn(1)
+
+
+def test_chat_messages_skip_counts_rolled_up_entries(log):
+    history = []
+    for index in range(3):
+        history = append_history(history, turn(index), "s1", max_entries=4)
+    full = log.read("s1")
+
+    assert chat_messages(history) == [
+        {"role": "user", "content": "question 1"}, {"role": "assistant", "content": "answer 1"},
+        {"role": "user", "content": "question 2"}, {"role": "assistant", "content": "answer 2"},
+    ]
+    # Skipping the same entries gives the same messages from the bounded history and from the log.
+    assert chat_messages(history, skip=4) == chat_messages(full, skip=4) == [
+        {"role": "user", "content": "question 2"}, {"role": "assistant", "content": "answer 2"},
+    ]
+    assert chat_messages(full, skip=0)[0] == {"role": "user", "content": "question 0"}
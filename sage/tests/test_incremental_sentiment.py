@@ -0,0 +1,67 @@
+import asyncio
+
+from manager_agent.sub_agents.sentiment_agent import agent as sentiment_module
+from manager_agent.sub_agents.sentiment_agent.agent import IncrementalSentiment, timeline_entry
+
+
+def fake_scorer(calls):
+    async def score_minutes(minute_buckets, mode, semaphore):
+        calls.append({minute: list(msgs) for minute, msgs in minute_buckets.items()})
+        await asyncio.sleep(0)
+        return {
+            minute: timeline_entry(minute, "neutral", 0.5, len(msgs))
+            for minute, msgs in minute_buckets.items()
+        }
+
+    return score_minutes
+
+
+def run(segment_batches):
+    async def main():
+        sentiment = IncrementalSentiment(mode="per_minute")
+        for segments in segment_batches:
+            sentiment.add(segments)
+        return sentiment, await sentiment.finish()
+
+    return asyncio.run(main())
+
+
+def test_scores_a_minute_once_a_later_minute_arrives(monkeypatch):
+    calls = []
+    monkeypatch.setattr(sentiment_module, "score_minutes", fake_scorer(calls))
+    _, result = run([
+        [[0.0, 5.0, "A", "hello"], [30.0, 35.0, "B", "hi"]],
+        [[65.0, 70.0, "A", "next minute"]],
+    ])
+    assert calls == [{0: [("A", "hello"), ("B", "hi")]}, {1: [("A", "next minute")]}]
+    assert [entry["minute"] for entry in result["timeline"]] == ["0 to 1", "1 to 2"]
+
+
+def test_scheduled_minute_is_a_snapshot(monkeypatch):
+    calls = []
+    monkeypatch.setattr(sentiment_module, "score_minutes", fake_scorer(calls))
+
+    async def main():
+        sentiment = IncrementalSentiment(mode="per_minute")
+        sentiment.add([[0.0, 5.0, "A", "hello"], [65.0, 70.0, "B", "later"]])
+        scheduled = sentiment.tasks[0]
+        # Appending to the live bucket must not change what was handed to the scorer.
+        sentiment.minute_buckets[0].append(("B", "late"))
+        await scheduled
+        sentiment.cancel()
+
+    asyncio.run(main())
+    assert calls[0] == {0: [("A", "hello")]}
+
+
+def test_late_segment_rescores_its_minute(monkeypatch):
+    calls = []
+    monkeypatch.setattr(sentiment_module, "score_minutes", fake_scorer(calls))
+    _, result = run([
+        [[0.0, 5.0, "A", "hello"], [65.0, 70.0, "B", "later"]],
+        [[50.0, 60.0, "A", "late"], [125.0, 130.0, "B", "third minute"]],
+    ])
+    assert calls[1] == {0: [("A", "hello"), ("A", "late")], 1: [("B", "later")]}
+    first_minute = result["timeline"][0]
+    assert first_minute["minute"] == "0 to 1"
+    assert first_minute["message_count"] == 2
@@ -0,0 +1,26 @@
+from types import SimpleNamespace
+
+from manager_agent.sub_agents.intent_agent.agent import intent_agent, intent_instruction
+
+TRANSCRIPT = [
+    [0.0, 4.2, "SPEAKER_00", "Thank you for calling, how can I help?"],
+    [4.5, 9.8, "SPEAKER_01", "I think my debit card was stolen yesterday."],
+]
+
+
+def test_intent_prompt_contains_the_transcript_from_state():
+    # The workflows hand the transcript to IntentAgent only through the session state.
+    context = SimpleNamespace(state={"transcript": TRANSCRIPT}, agent_name="IntentAgent")
+    prompt = intent_instruction(context)
+    assert "SPEAKER_00: Thank you for calling, how can I help?" in prompt
+    assert "SPEAKER_01: I think my debit card was stolen yesterday." in prompt
+    assert "ReportLostOrStolenCard" in prompt
+
+
+def test_intent_prompt_without_transcript():
+    context = SimpleNamespace(state={}, agent_name="IntentAgent")
+    assert intent_instruction(context).rstrip().endswith("Transcript:")
+
+
+def test_intent_agent_uses_the_transcript_instruction():
+    assert intent_agent.instruction is intent_instruction
@@ -0,0 +1,73 @@
+from types import SimpleNamespace
+
+import pytest
+
+from manager_agent import memo as memo_module
+from manager_agent.memo import AnalysisMemo, record_completed_analysis, skip_completed_analysis
+from manager_agent.sub_agents.audio_to_transcript_agent.transcript_cache import hash_audio
+
+
+@pytest.fixture
+def memo(tmp_path, monkeypatch):
+    memo = AnalysisMemo(str(tmp_path / "memo"), max_bytes=1024 * 1024)
+    monkeypatch.setattr(memo_module, "analysis_memo", memo)
+    return memo
+
+
+@pytest.fixture
+def recording(tmp_path):
+    path = tmp_path / "call.wav"
+    path.write_bytes(b"RIFF fake audio")
+    return str(path)
+
+
+def finished_state(recording, **overrides):
+    state = {
+        "audio_filepath": recording,
+        "audio_hash": hash_audio(recording),
+        "transcript": [[0.0, 5.0, "A", "I lost my card."]],
+        "intent_state": "ReportLostOrStolenCard",
+        "sentiment_state": {"sentiment_overall": "Calm", "timeline": [{"minute": "0 to 1", "label": "Calm"}]},
+        "root_cause_state": {"root_cause": "Lost card."},
+        "analysis_report": "# Report",
+    }
+    state.update(overrides)
+    return state
+
+
+def test_successful_analysis_is_restored_in_another_session(memo, recording):
+    record_completed_analysis(SimpleNamespace(state=finished_state(recording)))
+
+    other = SimpleNamespace(state={"audio_filepath": recording})
+    content = skip_completed_analysis(other)
+    assert content.parts[0].text == "# Report"
+    assert other.state["root_cause_state"] == {"root_cause": "Lost card."}
+    assert other.state["analysis_complete"]["audio_hash"] == hash_audio(recording)
+
+
+def test_unknown_recording_runs_the_workflow(memo, recording):
+    state = {"audio_filepath": recording, "analysis_report": "# Report of another call"}
+    assert skip_completed_analysis(SimpleNamespace(state=state)) is None
+    assert state["analysis_report"] is None
+
+
+@pytest.mark.parametrize("overrides", [
+    {"root_cause_state": {"error": "503 Service Unavailable"}},
+    {"root_cause_state": None},
+    {"sentiment_state": {"sentiment_overall": "neutral", "timeline": [{"minute": "0 to 1", "label": "neutral"}]}},
+    {"intent_state": None},
+])
+def test_failed_stage_is_not_memoized(memo, recording, overrides):
+    state = finished_state(recording, **overrides)
+    record_completed_analysis(SimpleNamespace(state=state))
+    assert state["analysis_complete"]
+    assert memo.get(state["audio_hash"]) is None
+    assert skip_completed_analysis(SimpleNamespace(state={"audio_filepath": recording})) is None
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    memo = AnalysisMemo(str(tmp_path), max_bytes=250)
+    for name in ("a", "b", "c"):
+        memo.put(name, {"analysis_report": name * 50})
+    assert memo.get("a") is None
+    assert memo.get("c") == {"analysis_report": "c" * 50}
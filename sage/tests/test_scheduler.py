@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+
+from manager_agent import scheduler
+from manager_agent.scheduler import is_transient_error, scheduled_call, scheduled_call_async
+
+
+class StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+
+
+def flaky(errors, result="ok"):
+    calls = []
+
+    def call():
+        calls.append(1)
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return result
+
+    return call, calls
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(scheduler, "HTTP_BACKOFF_SECONDS", 0.0)
+    monkeypatch.setattr(scheduler, "HTTP_MAX_RETRIES", 2)
+
+
+def test_transient_errors():
+    assert is_transient_error(StatusError(503))
+    assert is_transient_error(TimeoutError())
+    assert not is_transient_error(StatusError(400))
+    assert not is_transient_error(ValueError("bad json"))
+
+
+def test_transient_error_is_retried_up_to_the_limit():
+    # No rate limit is configured for this model, so only the transient retries apply.
+    call, calls = flaky([StatusError(500), StatusError(502)])
+    assert scheduled_call("unlimited-model", call) == "ok"
+    assert len(calls) == 3
+
+    call, calls = flaky([StatusError(500)] * 3)
+    with pytest.raises(StatusError):
+        scheduled_call("unlimited-model", call)
+    assert len(calls) == 3
+
+
+def test_other_errors_are_not_retried():
+    call, calls = flaky([StatusError(400)])
+    with pytest.raises(StatusError):
+        scheduled_call("unlimited-model", call)
+    assert len(calls) == 1
+
+
+def test_async_call_retries_the_same_way():
+    errors = [StatusError(503)]
+    calls = []
+
+    async def call():
+        calls.append(1)
+        if len(calls) <= len(errors):
+            raise errors[0]
+        return "ok"
+
+    assert asyncio.run(scheduled_call_async("unlimited-model", call)) == "ok"
+    assert len(calls) == 2
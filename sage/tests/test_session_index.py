@@ -0,0 +1,64 @@
+from manager_agent.session_index import SessionIndex, index_fields
+
+
+def test_index_fields_reads_only_the_keys_present():
+    assert index_fields({"intent_state": '"DisputeTransaction"\n'}) == {"intent": "DisputeTransaction"}
+    assert index_fields({"user_name": "x"}) == {}
+
+
+def test_index_fields_of_a_full_state():
+    fields = index_fields({
+        "audio_filepath": "/calls/2024/call_01.wav",
+        "audio_hash": "abc",
+        "intent_state": None,
+        "sentiment_state": {"sentiment_overall": "Frustrated", "timeline": []},
+        "analysis_report": "# Report",
+    })
+    assert fields == {
+        "audio_filepath": "/calls/2024/call_01.wav",
+        "filename": "call_01.wav",
+        "audio_hash": "abc",
+        "intent": None,
+        "sentiment": "Frustrated",
+        "report_ready": 1,
+    }
+    assert index_fields({"analysis_report": None, "sentiment_state": None}) == {"report_ready": 0, "sentiment": None}
+
+
+def test_page_lists_ready_sessions_newest_first(tmp_path):
+    index = SessionIndex(str(tmp_path / "index.db"))
+    for number in range(5):
+        index.update("app", "u", f"s{number}", {"report_ready": int(number != 2)}, created_at=float(number + 1))
+    index.update("app", "other", "s9", {"report_ready": 1})
+
+    rows, total = index.page("app", "u", page_size=2)
+    assert total == 4
+    assert [row["session_id"] for row in rows] == ["s4", "s3"]
+    rows, _ = index.page("app", "u", page=1, page_size=2)
+    assert [row["session_id"] for row in rows] == ["s1", "s0"]
+    rows, _ = index.page("app", "u", page=2, page_size=2)
+    assert rows == []
+    _, total = index.page("app", "u", report_ready=False)
+    assert total == 5
+
+
+def test_update_keeps_columns_a_delta_does_not_change(tmp_path):
+    index = SessionIndex(str(tmp_path / "index.db"))
+    index.update("app", "u", "s1", index_fields({"audio_filepath": "/calls/loan_call.wav"}), created_at=1.0)
+    index.update("app", "u", "s1", index_fields({"intent_state": "LoanInquiry", "analysis_report": "done"}))
+
+    rows, total = index.page("app", "u", search="loan")
+    assert total == 1
+    row = rows[0]
+    assert (row["filename"], row["intent"], row["report_ready"], row["created_at"]) == (
+        "loan_call.wav", "LoanInquiry", 1, 1.0
+    )
+    assert index.page("app", "u", search="Frustrated") == ([], 0)
+
+
+def test_backfill_is_marked_per_user(tmp_path):
+    index = SessionIndex(str(tmp_path / "index.db"))
+    assert index.needs_backfill("app", "u")
+    index.mark_backfilled("app", "u")
+    assert not index.needs_backfill("app", "u")
+    assert index.needs_backfill("app", "other")
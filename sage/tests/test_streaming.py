@@ -0,0 +1,108 @@
+import pytest
+
+from manager_agent.sub_agents.audio_to_transcript_agent.streaming import (
+    TranscriptStitcher,
+    match_speakers,
+    plan_windows,
+)
+
+
+def test_plan_windows_single_window_for_short_recording():
+    assert plan_windows(120.0, 300.0, 10.0) == [(0.0, 120.0)]
+
+
+def test_plan_windows_overlap_and_coverage():
+    windows = plan_windows(700.0, 300.0, 10.0)
+    assert windows == [(0.0, 300.0), (290.0, 590.0), (580.0, 700.0)]
+    for (_, previous_end), (start, _) in zip(windows, windows[1:]):
+        assert previous_end - start == pytest.approx(10.0)
+    assert windows[-1][1] == 700.0
+
+
+def test_plan_windows_exact_multiple_has_no_empty_tail():
+    windows = plan_windows(590.0, 300.0, 10.0)
+    assert windows == [(0.0, 300.0), (290.0, 590.0)]
+
+
+def test_plan_windows_overlap_not_shorter_than_window_still_advances():
+    windows = plan_windows(5.0, 2.0, 5.0)
+    starts = [start for start, _ in windows]
+    assert starts == sorted(set(starts))
+    assert windows[-1][1] == 5.0
+
+
+def test_match_speakers_pairs_by_overlap_time():
+    previous = [[280.0, 295.0, "A", "first"], [295.0, 300.0, "B", "second"]]
+    # The new window labels the same two people the other way around.
+    current = [[290.0, 295.0, "B", "first"], [295.0, 300.0, "A", "second"], [300.0, 310.0, "A", "more"]]
+    known = ["A", "B"]
+    assert match_speakers(previous, current, 290.0, 300.0, known) == {"B": "A", "A": "B"}
+    assert known == ["A", "B"]
+
+
+def test_match_speakers_without_overlap_takes_free_known_labels():
+    previous = [[0.0, 100.0, "A", "hello"]]
+    current = [[300.0, 310.0, "X", "hi"], [310.0, 320.0, "Y", "there"]]
+    known = ["A", "B"]
+    assert match_speakers(previous, current, 290.0, 300.0, known) == {"X": "A", "Y": "B"}
+
+
+def test_match_speakers_adds_new_label_once_known_are_taken():
+    previous = [[290.0, 300.0, "A", "hello"]]
+    current = [[290.0, 300.0, "A", "hello"], [300.0, 305.0, "B", "new voice"]]
+    known = ["A"]
+    mapping = match_speakers(previous, current, 290.0, 300.0, known)
+    assert mapping == {"A": "A", "B": "B"}
+    assert known == ["A", "B"]
+
+
+def test_match_speakers_renames_new_local_label_that_clashes():
+    previous = [[290.0, 300.0, "A", "hello"]]
+    # Local "B" talks over the known "A"; local "A" is a third person.
+    current = [[290.0, 300.0, "B", "hello"], [300.0, 305.0, "A", "third"]]
+    known = ["A", "B"]
+    mapping = match_speakers(previous, current, 290.0, 300.0, known)
+    assert mapping == {"B": "A", "A": "B"}
+
+    known = ["A"]
+    mapping = match_speakers(previous, current, 290.0, 300.0, known)
+    assert mapping["B"] == "A"
+    assert mapping["A"] == "A_1"
+    assert known == ["A", "A_1"]
+
+
+def two_windows():
+    windows = [(0.0, 300.0), (290.0, 590.0)]
+    first = [[0.0, 10.0, "A", "opening"], [285.0, 294.0, "B", "kept by window 0"], [296.0, 300.0, "A", "cut"]]
+    # Window 1 uses swapped local labels, and re-transcribes the overlap.
+    second = [[285.0, 294.0, "A", "kept by window 0"], [296.0, 300.0, "B", "cut"], [400.0, 410.0, "B", "closing"]]
+    return windows, first, second
+
+
+def test_stitcher_keeps_each_overlap_segment_once():
+    windows, first, second = two_windows()
+    stitcher = TranscriptStitcher(windows)
+    assert stitcher.cuts == [0.0, 295.0, float("inf")]
+    final = stitcher.add(0, first) + stitcher.add(1, second)
+    assert [segment[3] for segment in final] == ["opening", "kept by window 0", "cut", "closing"]
+    assert [segment[2] for segment in final] == ["A", "B", "A", "A"]
+    assert stitcher.segments == final
+
+
+def test_stitcher_waits_for_earlier_windows():
+    windows, first, second = two_windows()
+    stitcher = TranscriptStitcher(windows)
+    assert stitcher.add(1, second) == []
+    final = stitcher.add(0, first)
+    assert [segment[3] for segment in final] == ["opening", "kept by window 0", "cut", "closing"]
+
+
+def test_stitcher_same_result_in_any_order():
+    windows, first, second = two_windows()
+    in_order = TranscriptStitcher(windows)
+    in_order.add(0, first)
+    in_order.add(1, second)
+    reversed_order = TranscriptStitcher(windows)
+    reversed_order.add(1, second)
+    reversed_order.add(0, first)
+    assert in_order.segments == reversed_order.segments
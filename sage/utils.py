@@ -1,8 +1,17 @@
+import os
 from datetime import datetime
 
-from google.adk.events import Event
+from google.adk.events import Event, EventActions
 from google.genai import types
 
+from manager_agent.blob_store import state_value
+from manager_agent.history import ROLLUP_ACTION, append_history
+from manager_agent.tracing import format_summary, trace
+
+# How a turn prints the session state: "diff" prints the keys the turn changed,
+# "full" the whole state before and after the run, "off" nothing.
+SHOW_STATE = os.getenv("SAGE_SHOW_STATE", "diff")
+
 
 class Colors:
     RESET = "\033[0m"
@@ -31,78 +40,129 @@ class Colors:
 
 
 
-async def display_state(
-    session_service, app_name, user_id, session_id, label="Current State"
-):
-    """Display the current session state in a formatted way."""
-    try:
-        session = await session_service.get_session(
-            app_name=app_name, user_id=user_id, session_id=session_id
-        )
+def print_state(state, label="Current State"):
+    """Print a session state in a formatted way."""
+    print(f"\n{'-' * 10} {label} {'-' * 10}")
 
-        print(f"\n{'-' * 10} {label} {'-' * 10}")
+    user_name = state.get("user_name", "Unknown")
+    print(f"User: {user_name}")
 
-        user_name = session.state.get("user_name", "Unknown")
-        print(f"User: {user_name}")
+    intent_state = state.get("intent_state", "Not analyzed")
+    print(f"Intent: {intent_state}")
 
-        intent_state = session.state.get("intent_state", "Not analyzed")
-        print(f"Intent: {intent_state}")
+    sentiment_state = state_value(state, "sentiment_state", "Not analyzed")
+    print(f"Sentiment: {sentiment_state}")
 
-        sentiment_state = session.state.get("sentiment_state", "Not analyzed")
-        print(f"Sentiment: {sentiment_state}")
+    root_cause_state = state.get("root_cause_state", "Not analyzed")
+    print(f"Root Cause: {root_cause_state}")
 
-        root_cause_state = session.state.get("root_cause_state", "Not analyzed")
-        print(f"Root Cause: {root_cause_state}")
+    is_audio_transcribed = state.get("is_audio_transcribed", False)
+    print(f"Audio Transcribed: {is_audio_transcribed}")
 
-        is_audio_transcribed = session.state.get("is_audio_transcribed", False)
-        print(f"Audio Transcribed: {is_audio_transcribed}")
+    analysis_report = state_value(state, "analysis_report", "Not generated")
+    print(f"Analysis Report: {analysis_report}")
 
-        analysis_report = session.state.get("analysis_report", "Not generated")
-        print(f"Analysis Report: {analysis_report}")
+    interaction_history = state.get("interaction_history", [])
+    if interaction_history:
+        print("Interaction History:")
+        for idx, interaction in enumerate(interaction_history, 1):
+            print_interaction(idx, interaction)
+    else:
+        print("Interaction History: None")
 
-        interaction_history = session.state.get("interaction_history", [])
-        if interaction_history:
-            print("Interaction History:")
-            for idx, interaction in enumerate(interaction_history, 1):
-                if isinstance(interaction, dict):
-                    action = interaction.get("action", "interaction")
-                    timestamp = interaction.get("timestamp", "unknown time")
-
-                    if action == "user_query":
-                        query = interaction.get("query", "")
-                        print(f'  {idx}. User query at {timestamp}: "{query}"')
-                    elif action == "agent_response":
-                        agent = interaction.get("agent", "unknown")
-                        response = interaction.get("response", "")
-                        if len(response) > 100:
-                            response = response[:97] + "..."
-                        print(f'  {idx}. {agent} response at {timestamp}: "{response}"')
-                    else:
-                        details = ", ".join(
-                            f"{k}: {v}"
-                            for k, v in interaction.items()
-                            if k not in ["action", "timestamp"]
-                        )
-                        print(
-                            f"  {idx}. {action} at {timestamp}"
-                            + (f" ({details})" if details else "")
-                        )
-                else:
-                    print(f"  {idx}. {interaction}")
+    other_keys = [
+        k
+        for k in state.keys()
+        if k not in ["user_name", "intent_state", "sentiment_state", "root_cause_state", "is_audio_transcribed", "analysis_report", "interaction_history"]
+    ]
+    if other_keys:
+        print("Additional State:")
+        for key in other_keys:
+            print(f"  {key}: {state[key]}")
+
+    print("-" * (22 + len(label)))
+
+
+def print_interaction(idx, interaction):
+    """Print one interaction history entry."""
+    if isinstance(interaction, dict):
+        action = interaction.get("action", "interaction")
+        timestamp = interaction.get("timestamp", "unknown time")
+
+        if action == "user_query":
+            query = interaction.get("query", "")
+            print(f'  {idx}. User query at {timestamp}: "{query}"')
+        elif action == "agent_response":
+            agent = interaction.get("agent", "unknown")
+            response = interaction.get("response", "")
+            if len(response) > 100:
+                response = response[:97] + "..."
+            print(f'  {idx}. {agent} response at {timestamp}: "{response}"')
+        elif action == ROLLUP_ACTION:
+            print(
+                f"  {idx}. {interaction.get('entries', 0)} earlier interactions"
+                f" ({interaction.get('user_queries', 0)} queries) from"
+                f" {interaction.get('first_timestamp')} to {timestamp}"
+            )
         else:
-            print("Interaction History: None")
-
-        other_keys = [
-            k
-            for k in session.state.keys()
-            if k not in ["user_name", "intent_state", "sentiment_state", "root_cause_state", "is_audio_transcribed", "analysis_report", "interaction_history"]
-        ]
-        if other_keys:
-            print("Additional State:")
-            for key in other_keys:
-                print(f"  {key}: {session.state[key]}")
-
-        print("-" * (22 + len(label)))
+            details = ", ".join(
+                f"{k}: {v}"
+                for k, v in interaction.items()
+                if k not in ["action", "timestamp"]
+            )
+            print(
+                f"  {idx}. {action} at {timestamp}"
+                + (f" ({details})" if details else "")
+            )
+    else:
+        print(f"  {idx}. {interaction}")
+
+
+def print_state_changes(state, changed_keys, history_start=0, label="State changes"):
+    """
+    Print only the state keys a turn changed, with their values after the turn.
+
+    Args:
+        state (dict): The session state after the turn.
+        changed_keys (set): The keys written by the events of the turn.
+        history_start (int): Entries of the interaction history that existed before the turn.
+        label (str): The heading.
+    """
+    print(f"\n{'-' * 10} {label} {'-' * 10}")
+    if not changed_keys:
+        print("No changes")
+    for key in sorted(changed_keys):
+        if key == "interaction_history":
+            history = state.get(key, [])
+            print("Interaction History:")
+            for idx, interaction in enumerate(history[history_start:], history_start + 1):
+                print_interaction(idx, interaction)
+            continue
+        value = str(state_value(state, key))
+        if len(value) > 200:
+            value = value[:197] + "..."
+        print(f"  {key}: {value}")
+    print("-" * (22 + len(label)))
+
+
+def history_entry(action, **fields):
+    """Build an interaction history entry."""
+    return {
+        "action": action,
+        **fields,
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    }
+
+
+async def display_state(
+    session_service, app_name, user_id, session_id, label="Current State"
+):
+    """Display the current session state in a formatted way."""
+    try:
+        session = await session_service.get_session(
+            app_name=app_name, user_id=user_id, session_id=session_id
+        )
+        print_state(session.state, label)
     except Exception as e:
         print(f"Error displaying state: {e}")
 
@@ -141,83 +201,106 @@ async def process_agent_response(event):
     return final_response
 
 
-async def call_agent_async(runner, user_id, session_id, query):
-    """Call the agent asynchronously with the user's query."""
-    session = await runner.session_service.get_session(
-        app_name=runner.app_name, user_id=user_id, session_id=session_id
-    )
-    session.state["interaction_history"].append(
-        {
-            "action": "user_query",
-            "query": query,
-            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        }
-    )
-
-    user_query_event = Event(
-        author="user",
-        content=types.Content(role="user", parts=[types.Part(text=query)]),
-    )
-    await runner.session_service.append_event(session=session, event=user_query_event)
-
-    content = types.Content(role="user", parts=[types.Part(text=query)])
-    print(
-        f"\n{Colors.BG_GREEN}{Colors.BLACK}{Colors.BOLD}--- Running Query: {query} ---{Colors.RESET}"
-    )
-    final_response_text = None
-    agent_name = None
-
-    await display_state(
-        runner.session_service,
-        runner.app_name,
-        user_id,
-        session_id,
-        "State BEFORE processing",
-    )
-
-    try:
-        async for event in runner.run_async(
-            user_id=user_id, session_id=session_id, new_message=content
-        ):
-            if event.author:
-                agent_name = event.author
+class SessionTurn:
+    """
+    One query to a runner and its response, with as few session round trips as possible.
+
+    The runner loads the session and stores the query and the agent events itself.
+    The turn then loads the session once, after the run, and writes the query and
+    response interaction history entries in a single event, rolling the oldest
+    entries up once the history is full. The state dump reuses
+    that load: by default it prints only the keys the events of the turn changed.
+
+    Usage:
+        turn = SessionTurn(runner, user_id, session_id)
+        async for event in turn.run(query):
+            ...
+        await turn.finish(agent_name, final_response_text)
+    """
+
+    def __init__(self, runner, user_id, session_id, show_state=SHOW_STATE):
+        self.runner = runner
+        self.user_id = user_id
+        self.session_id = session_id
+        self.show_state = show_state
+        self.session = None
+        self.changed_keys = set()
+        self._entries = []
+
+    async def _get_session(self):
+        return await self.runner.session_service.get_session(
+            app_name=self.runner.app_name, user_id=self.user_id, session_id=self.session_id
+        )
 
-            response = await process_agent_response(event)
-            if response:
-                final_response_text = response
-    except Exception as e:
-        print(f"{Colors.BG_RED}{Colors.WHITE}ERROR during agent run: {e}{Colors.RESET}")
+    async def run(self, query):
+        """Run the query, yielding the events of the run."""
+        self._entries = [history_entry("user_query", query=query)]
+        if self.show_state == "full":
+            print_state((await self._get_session()).state, "State BEFORE processing")
 
-    if final_response_text and agent_name:
-        session = await runner.session_service.get_session(
-            app_name=runner.app_name, user_id=user_id, session_id=session_id
+        content = types.Content(role="user", parts=[types.Part(text=query)])
+        async for event in self.runner.run_async(
+            user_id=self.user_id, session_id=self.session_id, new_message=content
+        ):
+            if event.actions and event.actions.state_delta:
+                self.changed_keys.update(event.actions.state_delta)
+            yield event
+
+    async def finish(self, agent_name=None, response=None):
+        """
+        Store the interaction history entries of the turn and print the state.
+
+        Returns:
+            Session: The session after the turn.
+        """
+        if response and agent_name:
+            self._entries.append(
+                history_entry("agent_response", agent=agent_name, response=response)
+            )
+        session = await self._get_session()
+        history = append_history(
+            session.state.get("interaction_history", []), self._entries, self.session_id
         )
-        session.state["interaction_history"].append(
-            {
-                "action": "agent_response",
-                "agent": agent_name,
-                "response": final_response_text,
-                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            }
+        history_start = len(history) - len(self._entries)
+        history_event = Event(
+            author=agent_name or "user",
+            actions=EventActions(state_delta={"interaction_history": history}),
         )
+        await self.runner.session_service.append_event(session=session, event=history_event)
+        self.changed_keys.add("interaction_history")
+        self.session = session
 
-        agent_response_event = Event(
-            author=agent_name,
-            content=types.Content(
-                role="model", parts=[types.Part(text=final_response_text)]
-            ),
-        )
-        await runner.session_service.append_event(
-            session=session, event=agent_response_event
+        if self.show_state == "full":
+            print_state(session.state, "State AFTER processing")
+        elif self.show_state == "diff":
+            print_state_changes(session.state, self.changed_keys, history_start)
+        return session
+
+
+async def call_agent_async(runner, user_id, session_id, query):
+    """Call the agent asynchronously with the user's query."""
+    with trace("query", session_id=session_id, query=query[:200]) as current:
+        print(
+            f"\n{Colors.BG_GREEN}{Colors.BLACK}{Colors.BOLD}--- Running Query: {query} ---{Colors.RESET}"
         )
+        final_response_text = None
+        agent_name = None
+
+        turn = SessionTurn(runner, user_id, session_id)
+        try:
+            async for event in turn.run(query):
+                if event.author:
+                    agent_name = event.author
+
+                response = await process_agent_response(event)
+                if response:
+                    final_response_text = response
+        except Exception as e:
+            print(f"{Colors.BG_RED}{Colors.WHITE}ERROR during agent run: {e}{Colors.RESET}")
 
-    await display_state(
-        runner.session_service,
-        runner.app_name,
-        user_id,
-        session_id,
-        "State AFTER processing",
-    )
+        await turn.finish(agent_name, final_response_text)
 
+    if current is not None:
+        print(format_summary(current))
     print(f"{Colors.YELLOW}{'-' * 30}{Colors.RESET}")
     return final_response_text